@@ -1,6 +1,6 @@
-import json
 import maya.cmds as cmds
-import log, app, attributes
+import maya.api.OpenMaya as om2
+import log, app, attributes, skeletons
 
 LOG = log.get_logger(__name__)
 
@@ -344,62 +344,280 @@ def deleteJointsFromHierarchy(joints):
 
 
 # ------- data IO ------- #
-def exportSkeleton(exportPath, root):
+def _plugValues(plug, angle=False):
+    """
+    Values of the three children of a compound plug, e.g. rotate. Angles are returned in degrees.
+    """
+    if angle:
+        return [plug.child(i).asMAngle().asDegrees() for i in xrange(3)]
+    return [plug.child(i).asDouble() for i in xrange(3)]
+
+
+def _dynamicAttributes(nodeFn):
+    """
+    Names of the user defined attributes of a node, as listAttr(ud=True) returns them, read from the
+    function set already attached to the node.
+    """
+    names = []
+    for i in xrange(nodeFn.attributeCount()):
+        attrFn = om2.MFnAttribute(nodeFn.attribute(i))
+        if attrFn.dynamic:
+            names.append(attrFn.name)
+    return names
+
+
+def gatherSkeleton(root):
+    """
+    Read a joint hierarchy in a single depth-first DAG traversal.
+    Only joints parented under joints are gathered, the traversal doesn't descend into other nodes.
+
+    Args:
+        root: The root joint of a skeleton.
+
+    Returns: List of joint dicts in topological order (every parent before its children):
+        name: Root as given, partial path name for other joints.
+        parent: Index of the parent joint in the list, -1 for the root.
+        p: World position. o: Joint orient. r: Rotation. s: Scale. roo: Rotation order string.
+        custom: {attr: attributes.gatherDict()} of user defined attributes.
+
+    Raises:
+        ValueError if root is not a joint.
+    """
+    selList = om2.MSelectionList()
+    selList.add(root)
+    rootPath = selList.getDagPath(0)
+    if not rootPath.hasFn(om2.MFn.kJoint):
+        raise ValueError('"{}" is not a joint'.format(root))
+    dagIt = om2.MItDag()
+    dagIt.reset(rootPath, om2.MItDag.kDepthFirst, om2.MFn.kInvalid)
+
+    joints = []
+    indices = {}
+    while not dagIt.isDone():
+        path = dagIt.getPath()
+        if not path.hasFn(om2.MFn.kJoint):
+            # skip the whole branch, as listRelatives(type='joint') would
+            dagIt.prune()
+            dagIt.next()
+            continue
+        parentPath = om2.MDagPath(path)
+        parentPath.pop()
+        parent = indices.get(parentPath.fullPathName(), -1) if joints else -1
+        name = path.partialPathName() if joints else root
+
+        transformFn = om2.MFnTransform(path)
+        position = om2.MTransformationMatrix(path.inclusiveMatrix()).translation(om2.MSpace.kWorld)
+        fullName = path.fullPathName()
+        joint = {'name': name,
+                 'parent': parent,
+                 'p': [position.x, position.y, position.z],
+                 'o': _plugValues(transformFn.findPlug('jointOrient', False), angle=True),
+                 'r': _plugValues(transformFn.findPlug('rotate', False), angle=True),
+                 's': _plugValues(transformFn.findPlug('scale', False)),
+                 'roo': skeletons.ROTATE_ORDERS[transformFn.findPlug('rotateOrder', False).asShort()],
+                 'custom': {}}
+        for attr in _dynamicAttributes(transformFn):
+            joint['custom'][attr] = attributes.gatherDict(fullName, attr)
+
+        indices[fullName] = len(joints)
+        joints.append(joint)
+        dagIt.next()
+    return joints
+
+
+def _findDagPath(node):
+    """
+    MDagPath of a node, None if it doesn't exist.
+
+    Raises:
+        ValueError if several nodes match the name.
+    """
+    selList = om2.MSelectionList()
+    try:
+        selList.add(node)
+    except RuntimeError:
+        return None
+    if selList.length() > 1:
+        raise ValueError('"{}" matches several nodes'.format(node))
+    return selList.getDagPath(0)
+
+
+def _findExisting(joints, parent=None):
+    """
+    Resolve the parent and the joints already in the scene, before anything is built.
+    Both build paths use it, so a skeleton file builds the same hierarchy either way.
+
+    Returns: (MDagPath of the parent or None, list of MDagPath or None for the joints to create)
+
+    Raises:
+        ValueError listing every name that matches several nodes.
+    """
+    ambiguous = []
+    paths = []
+    for name in [parent] + [joint['name'] for joint in joints]:
+        try:
+            paths.append(_findDagPath(name) if name else None)
+        except ValueError:
+            ambiguous.append(name)
+            paths.append(None)
+    if ambiguous:
+        raise ValueError('Unable to build skeleton, names match several nodes: {}'.format(', '.join(ambiguous)))
+    return paths[0], paths[1:]
+
+
+def _buildSkeletonUndoable(joints, parent=None):
+    """
+    buildSkeleton() with undoable commands, one createNode, setAttr and xform call per joint, in one undo chunk.
+    """
+    parentPath, paths = _findExisting(joints, parent=parent)
+    parent = parentPath.fullPathName() if parentPath is not None else None
+    names = []
+    existing = []
+    cmds.undoInfo(openChunk=True)
+    try:
+        for joint, path in zip(joints, paths):
+            if path is not None:
+                existing.append(joint['name'])
+                names.append(path.fullPathName())
+                continue
+            jointParent = names[joint['parent']] if joint['parent'] >= 0 else parent
+            kwargs = {'p': jointParent} if jointParent else {}
+            name = cmds.createNode('joint', n=joint['name'].split('|')[-1], skipSelect=True, **kwargs)
+            names.append(cmds.ls(name, long=True)[0])
+        if existing:
+            LOG.info('{} joints already exist in the scene, skipped joint creation: {}'.format(
+                len(existing), ', '.join(existing)))
+
+        for name, joint in zip(names, joints):
+            cmds.setAttr(name + '.jointOrient', *joint['o'])
+            cmds.setAttr(name + '.rotate', *joint['r'])
+            cmds.setAttr(name + '.scale', *joint['s'])
+            cmds.setAttr(name + '.rotateOrder', skeletons.ROTATE_ORDERS.index(joint['roo']))
+            cmds.xform(name, translation=joint['p'], worldSpace=True)
+
+        names = [cmds.ls(name)[0] for name in names]
+        for name, joint in zip(names, joints):
+            for attr in joint['custom']:
+                attributes.restoreAttr(name, attr, joint['custom'][attr])
+    finally:
+        cmds.undoInfo(closeChunk=True)
+    return names
+
+
+def buildSkeleton(joints, parent=None, undoable=True):
+    """
+    Create or update joints from gatherSkeleton() joint dicts, without touching the selection.
+    Existing joints are updated in place. A name matching several nodes is an error, raised before anything
+    is built.
+    By default the build uses undoable commands, one call per joint and value, in one undo step.
+    Batch and scripted callers pass undoable=False for the fast path: missing joints are created in one
+    API modifier batch under explicit parents, every local value is set in one batch, and world positions
+    are set in topological order. That path is not recorded in the undo queue.
+
+    Args:
+        joints: List of joint dicts in topological order.
+        parent: Optional parent node of the root joints. The world if it doesn't exist.
+        undoable: True to build with undoable commands. False for the fast API modifiers.
+
+    Returns: List of joint names, same order as joints.
+
+    Raises:
+        ValueError if the parent or a joint name matches several nodes.
+    """
+    if undoable:
+        return _buildSkeletonUndoable(joints, parent=parent)
+    parentPath, paths = _findExisting(joints, parent=parent)
+    dagMod = om2.MDagModifier()
+    objects = []
+    existing = []
+    for joint, path in zip(joints, paths):
+        if path is not None:
+            existing.append(joint['name'])
+            objects.append(path.node())
+            continue
+        if joint['parent'] >= 0:
+            parentObj = objects[joint['parent']]
+        elif parentPath is not None:
+            parentObj = parentPath.node()
+        else:
+            parentObj = om2.MObject.kNullObj
+        obj = dagMod.createNode('joint', parentObj)
+        dagMod.renameNode(obj, joint['name'].split('|')[-1])
+        objects.append(obj)
+    dagMod.doIt()
+    if existing:
+        LOG.info('{} joints already exist in the scene, skipped joint creation: {}'.format(
+            len(existing), ', '.join(existing)))
+
+    # local values of every joint in one batch
+    dgMod = om2.MDGModifier()
+    for obj, joint in zip(objects, joints):
+        nodeFn = om2.MFnDependencyNode(obj)
+        for attr, values in (('jointOrient', joint['o']), ('rotate', joint['r'])):
+            plug = nodeFn.findPlug(attr, False)
+            for i in xrange(3):
+                dgMod.newPlugValueMAngle(plug.child(i), om2.MAngle(values[i], om2.MAngle.kDegrees))
+        plug = nodeFn.findPlug('scale', False)
+        for i in xrange(3):
+            dgMod.newPlugValueDouble(plug.child(i), joint['s'][i])
+        dgMod.newPlugValueShort(nodeFn.findPlug('rotateOrder', False), skeletons.ROTATE_ORDERS.index(joint['roo']))
+    dgMod.doIt()
+
+    # world positions, parents first
+    names = []
+    for obj, joint in zip(objects, joints):
+        path = om2.MDagPath.getAPathTo(obj)
+        om2.MFnTransform(path).setTranslation(om2.MVector(*joint['p']), om2.MSpace.kWorld)
+        names.append(path.partialPathName())
+
+    # custom attrs
+    for name, joint in zip(names, joints):
+        for attr in joint['custom']:
+            attributes.restoreAttr(name, attr, joint['custom'][attr])
+    return names
+
+
+def exportSkeleton(exportPath, root, flat=False):
     '''Exports skeleton data to a json file.
+    The hierarchy is read in a single DAG traversal, see gatherSkeleton().
+
     Args:
         exportPath: The file path where a json file is saved.
         root: The root joint of a skeleton to export.
+        flat: True to save the flat layout (name table, parent indices and packed values),
+              False for the nested layout. See skeletons.
 
     Returns:
         True if export succeeds. False if export fails.
     Raises:
         Logs error if unable to export json file.
     '''
-    def recursiveGather(jnt):
-        infoDict = {}
-        children = cmds.listRelatives(jnt, children=1, pa=1, type='joint')
-        infoDict['p'] = cmds.joint(jnt, q=1, position=1)
-        infoDict['o'] = cmds.joint(jnt, q=1, orientation=1)
-        infoDict['roo'] = cmds.joint(jnt, q=1, rotationOrder=1)
-        infoDict['s'] = cmds.joint(jnt, q=1, scale=1)
-        infoDict['r'] = cmds.getAttr(jnt + '.r')[0]
-        infoDict['custom'] = {}
-        infoDict['child'] = {}
-        # custom attrs
-        customAttrList = cmds.listAttr(jnt, ud=1)
-        if not customAttrList:
-            customAttrList = []
-        for attr in customAttrList:
-            attributes.gatherDict(jnt, attr)
-            infoDict['custom'][attr] = attributes.gatherDict(jnt, attr)
-            #cmds.getAttr('{}.{}'.format(jnt, attr))
-        if not children:
-            return infoDict
-        for child_jnt in children:
-            infoDict['child'][child_jnt] = recursiveGather(child_jnt)
-        return infoDict
-
-    data = {}
-    data[root] = recursiveGather(root)
     par = cmds.listRelatives(root, parent=1, pa=1)
     if par:
         par = par[0]
-    data['parent'] = par
-
-    with open(exportPath, 'w') as outfile:
-        try:
-            json.dump(data, outfile, sort_keys=True, indent=4)
-            LOG.info('Exported skeleton data to {}.'.format(exportPath))
-            return True
-        except:
-            LOG.error('Unable to export skeleton data to {0}.'.format(exportPath))
-            return False
-
-
-def importSkeleton(importPath):
+    try:
+        joints = gatherSkeleton(root)
+    except ValueError as e:
+        LOG.error('Unable to export skeleton data to {0}: {1}'.format(exportPath, e))
+        return False
+
+    try:
+        skeletons.writeSkeleton(exportPath, joints, parent=par, flat=flat)
+        LOG.info('Exported skeleton data to {}.'.format(exportPath))
+        return True
+    except:
+        LOG.error('Unable to export skeleton data to {0}.'.format(exportPath))
+        return False
+
+
+def importSkeleton(importPath, undoable=True):
     '''
+    Rebuild a skeleton exported with exportSkeleton(), in either layout. See buildSkeleton().
+
     Args:
         importPath: The file path where a json file is loaded.
+        undoable: True to build with undoable commands, so the import can be undone. False for batch and
+                  scripted callers, faster but not undoable. See buildSkeleton().
 
     Returns:
         True if export succeeds. False if export fails.
@@ -415,39 +633,15 @@ def importSkeleton(importPath):
             LOG.error('Unable to load skeleton data from {0}.'.format(importPath))
             return False
 
-    def recursiveRead(d):
-        for jnt in d:
-            if jnt == 'parent':
-                continue
-
-            sel = cmds.ls(sl=1)
-            shortName = jnt.split('|')[-1]
-            p = d[jnt]['p']
-            o = d[jnt]['o']
-            s = d[jnt]['s']
-            roo = d[jnt]['roo']
-            r = d[jnt]['r']
-            if cmds.objExists(jnt):
-                cmds.joint(jnt, e=1, p=p, o=o, s=s, roo=roo)
-                LOG.info('{} already exists in the scene. Skipped joint creation.'.format(jnt))
-            else:
-                cmds.joint(n=shortName, p=p, o=o, s=s, roo=roo)
-            cmds.setAttr(jnt + '.rx', r[0])
-            cmds.setAttr(jnt + '.ry', r[1])
-            cmds.setAttr(jnt + '.rz', r[2])
-            # custom attrs
-            if d[jnt]['custom']:
-                for attr in d[jnt]['custom']:
-                    attributes.restoreAttr(jnt, attr, d[jnt]['custom'][attr])
-            cmds.select(jnt)
-            recursiveRead(d[jnt]['child'])
-            cmds.select(sel)
-
-    cmds.select(cl=1)
-    par = data['parent']
-    if (par and cmds.objExists(par)):
-        cmds.select(par)
-
-    recursiveRead(data)
+    if skeletons.isFlat(data):
+        joints, parent = skeletons.unpackSkeleton(data)
+    else:
+        joints, parent = skeletons.flattenSkeleton(data)
+    try:
+        buildSkeleton(joints, parent=parent, undoable=undoable)
+    except ValueError as e:
+        LOG.error(str(e))
+        return False
 
     LOG.info('Imported skeleton data from {}.'.format(importPath))
+    return True
@@ -0,0 +1,195 @@
+"""
+Name lookups between stored data and the nodes of a scene.
+
+Data exported from one rig is often imported into another where nodes live under a namespace, under a
+different DAG path, or were renamed by a convention. A NameIndex hashes a list of names once under
+several keys, so every lookup is a few dict accesses instead of a scan of the whole list.
+"""
+import re
+import log
+
+LOG = log.get_logger(__name__)
+# CONSTANTS
+EXACT = 'exact'
+SHORT = 'short'
+NO_NAMESPACE = 'noNamespace'
+RULES = 'rules'
+LEVELS = (EXACT, SHORT, NO_NAMESPACE, RULES)
+
+
+def shortName(name):
+    """
+    Name without its DAG path. '|grp|ns:body' -> 'ns:body'
+    """
+    return name.rpartition('|')[2]
+
+
+def stripNamespace(name):
+    """
+    Short name without its namespaces. '|grp|ns:body' -> 'body'
+    """
+    return shortName(name).rpartition(':')[2]
+
+
+def namespaceOf(name):
+    """
+    Namespace of a name. '|grp|ns:body' -> 'ns'
+    """
+    return shortName(name).rpartition(':')[0]
+
+
+def commonDepth(name, other):
+    """
+    Number of DAG ancestors two full path names share. '|grp|a|x', '|grp|a|y' -> 2
+    """
+    depth = 0
+    for part, otherPart in zip(name.split('|')[1:-1], other.split('|')[1:-1]):
+        if part != otherPart:
+            break
+        depth += 1
+    return depth
+
+
+def closest(candidates, near):
+    """
+    Pick the candidate closest to a node, by namespace first, then by DAG hierarchy.
+
+    Args:
+        candidates: Full path names.
+        near: Full path name of the node the candidates are used with, e.g. the mesh an influence binds to.
+
+    Returns: The candidate sharing the namespace of near, or else the deepest DAG ancestors with near.
+             None if no single candidate is closest.
+    """
+    namespace = namespaceOf(near)
+    if namespace:
+        same = [candidate for candidate in candidates if namespaceOf(candidate) == namespace]
+        if len(same) == 1:
+            return same[0]
+        if same:
+            candidates = same
+    depths = [commonDepth(candidate, near) for candidate in candidates]
+    best = max(depths)
+    if best and depths.count(best) == 1:
+        return candidates[depths.index(best)]
+    return None
+
+
+class NameIndex(object):
+    """
+    Resolve names against a list of target names. A name is looked up, in order, by:
+        exact       - the name itself
+        short       - without DAG path
+        noNamespace - without DAG path and namespaces (unless namespace is True)
+        rules       - after regex (pattern, replacement) rules, applied to both sides on the no namespace name,
+                      or on the short name if namespace is True
+    A name matching several targets is left unresolved, unless the remap table or the node it is used with
+    (namespace, then DAG hierarchy) settles it.
+
+    Example:
+        index = naming.NameIndex(cmds.ls(type='transform', long=True), rules=[(r'_v\\d+$', '')])
+        resolved, unresolved, ambiguous = index.resolveAll(infs, table={'old_jnt': 'new_jnt'}, near='|charB:body')
+    """
+
+    def __init__(self, names, rules=None, namespace=False):
+        """
+        Args:
+            names: Target names. Duplicates are dropped.
+            rules: Optional list of (regex pattern, replacement) applied in order to canonize names.
+            namespace: True to only match names with their namespace.
+        """
+        self.names = []
+        seen = set()
+        for name in names:
+            if name not in seen:
+                seen.add(name)
+                self.names.append(name)
+        self.rules = [(re.compile(pattern), replacement) for pattern, replacement in rules or ()]
+        self.namespace = namespace
+        self._maps = dict((level, {}) for level in LEVELS)
+        # names are unique, so each key lists a name once without searching its candidates
+        for name in self.names:
+            for level, key in self._keys(name):
+                self._maps[level].setdefault(key, []).append(name)
+
+    def _keys(self, name):
+        """
+        Lookup keys of a name, as (level, key).
+        """
+        keys = [(EXACT, name), (SHORT, shortName(name))]
+        if self.namespace:
+            stripped = keys[-1][1]
+        else:
+            stripped = stripNamespace(name)
+            keys.append((NO_NAMESPACE, stripped))
+        if self.rules:
+            for pattern, replacement in self.rules:
+                stripped = pattern.sub(replacement, stripped)
+            keys.append((RULES, stripped))
+        return keys
+
+    def candidates(self, name):
+        """
+        Target names matching a name, at the first lookup level with any match.
+
+        Args:
+            name: Name to resolve.
+
+        Returns: (level, list of target names). (None, []) if nothing matches.
+        """
+        for level, key in self._keys(name):
+            candidates = self._maps[level].get(key)
+            if candidates:
+                return level, candidates
+        return None, []
+
+    def resolve(self, name, table=None, near=None):
+        """
+        Args:
+            name: Name to resolve.
+            table: Optional {name: target} remap table, used before any lookup.
+            near: Optional full path name used to pick between several matches. See closest().
+
+        Returns: The matching target name. None if nothing, or several targets, match.
+        """
+        if table and name in table:
+            return table[name]
+        candidates = self.candidates(name)[1]
+        if len(candidates) > 1:
+            return closest(candidates, near) if near else None
+        return candidates[0] if candidates else None
+
+    def resolveAll(self, names, table=None, near=None):
+        """
+        Resolve a list of names in one pass.
+
+        Args:
+            names: Names to resolve.
+            table: Optional {name: target} remap table, used before any lookup.
+            near: Optional full path name used to pick between several matches. See closest().
+
+        Returns: (resolved, unresolved, ambiguous)
+            resolved: {name: target}
+            unresolved: Names without a single match, in input order.
+            ambiguous: {name: [targets]} for the unresolved names matching several targets.
+        """
+        resolved, unresolved, ambiguous = {}, [], {}
+        missing = set()
+        for name in names:
+            if name in resolved or name in missing:
+                continue
+            if table and name in table:
+                resolved[name] = table[name]
+                continue
+            candidates = self.candidates(name)[1]
+            target = candidates[0] if len(candidates) == 1 else None
+            if len(candidates) > 1 and near:
+                target = closest(candidates, near)
+            if target is None:
+                missing.add(name)
+                unresolved.append(name)
+                if candidates:
+                    ambiguous[name] = list(candidates)
+                continue
+            resolved[name] = target
+        return resolved, unresolved, ambiguous
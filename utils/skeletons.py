@@ -0,0 +1,199 @@
+"""
+Skeleton data and file formats.
+
+Maya-independent, so skeleton files can be read, converted and compared from plain python.
+
+Two layouts are supported:
+    nested - Legacy exportSkeleton() json. {root: {'p', 'o', 'roo', 's', 'r', 'custom', 'child': {name: {...}}},
+             'parent': parent of the root}
+    flat   - Joints in topological order (every parent before its children):
+             {'format': 'flatSkeleton', 'version': 1, 'parent': parent of the roots,
+              'names': [joint names], 'parents': [parent index, -1 for roots],
+              'p', 'o', 'r', 's': [x0, y0, z0, x1, ...] world position, joint orient, rotation, scale,
+              'roo': [rotation order index, see ROTATE_ORDERS],
+              'custom': {joint name: {attr: attributes.gatherDict()}} for joints with custom attributes}
+
+In memory, joints are handled as a list of joint dicts in topological order:
+    {'name', 'parent' (index, -1 for roots), 'p', 'o', 'r', 's', 'roo' (string), 'custom'}
+and the flat layout as packed numpy arrays. See packSkeleton().
+"""
+import json
+import numpy as np
+import log
+
+LOG = log.get_logger(__name__)
+# CONSTANTS
+FLAT_FORMAT = 'flatSkeleton'
+FLAT_VERSION = 1
+ROTATE_ORDERS = ('xyz', 'yzx', 'zxy', 'xzy', 'yxz', 'zyx')
+VECTOR_KEYS = ('p', 'o', 'r', 's')
+
+
+def isFlat(data):
+    """
+    Args:
+        data: Loaded skeleton json.
+
+    Returns: True for the flat layout, False for the nested layout.
+    """
+    return data.get('format') == FLAT_FORMAT
+
+
+def flattenSkeleton(data):
+    """
+    List the joints of the nested layout in topological order. Children are listed by name.
+
+    Args:
+        data: Nested skeleton dict.
+
+    Returns: (list of joint dicts, parent node of the roots)
+    """
+    joints = []
+    stack = [(name, -1, data[name]) for name in sorted(data, reverse=True) if name != 'parent']
+    while stack:
+        name, parent, info = stack.pop()
+        joint = dict((key, info[key]) for key in VECTOR_KEYS + ('roo',))
+        joint['custom'] = info.get('custom') or {}
+        joint['name'] = name
+        joint['parent'] = parent
+        index = len(joints)
+        joints.append(joint)
+        children = info.get('child') or {}
+        stack.extend((child, index, children[child]) for child in sorted(children, reverse=True))
+    return joints, data.get('parent')
+
+
+def nestSkeleton(joints, parent=None):
+    """
+    Build the nested layout from joint dicts.
+
+    Args:
+        joints: List of joint dicts in topological order.
+        parent: Parent node of the roots.
+
+    Returns: Nested skeleton dict.
+    """
+    data = {}
+    infos = []
+    for joint in joints:
+        info = dict((key, joint[key]) for key in VECTOR_KEYS + ('roo', 'custom'))
+        info['child'] = {}
+        infos.append(info)
+        if joint['parent'] < 0:
+            data[joint['name']] = info
+        else:
+            infos[joint['parent']]['child'][joint['name']] = info
+    data['parent'] = parent
+    return data
+
+
+def packSkeleton(joints, parent=None):
+    """
+    Pack joint dicts in the flat layout.
+
+    Args:
+        joints: List of joint dicts in topological order.
+        parent: Parent node of the roots.
+
+    Returns: Flat skeleton dict. parents and roo are int arrays, p, o, r and s are (joint, 3) float arrays.
+    """
+    flat = {'format': FLAT_FORMAT,
+            'version': FLAT_VERSION,
+            'parent': parent,
+            'names': [joint['name'] for joint in joints],
+            'parents': np.array([joint['parent'] for joint in joints], dtype=np.int64),
+            'roo': np.array([ROTATE_ORDERS.index(joint['roo']) for joint in joints], dtype=np.int64),
+            'custom': dict((joint['name'], joint['custom']) for joint in joints if joint['custom'])}
+    for key in VECTOR_KEYS:
+        flat[key] = np.array([joint[key] for joint in joints], dtype=np.float64).reshape(-1, 3)
+    return flat
+
+
+def unpackSkeleton(flat):
+    """
+    Unpack the flat layout to joint dicts.
+
+    Args:
+        flat: Flat skeleton dict, arrays packed or as loaded from json.
+
+    Returns: (list of joint dicts, parent node of the roots)
+    """
+    names = flat['names']
+    parents = np.asarray(flat['parents'], dtype=np.int64)
+    if len(parents) != len(names) or np.any(parents >= np.arange(len(parents))):
+        raise ValueError('Joints are not in topological order')
+    vectors = dict((key, np.asarray(flat[key], dtype=np.float64).reshape(-1, 3).tolist()) for key in VECTOR_KEYS)
+    roo = np.asarray(flat['roo'], dtype=np.int64).tolist()
+    custom = flat.get('custom') or {}
+    joints = []
+    for i, name in enumerate(names):
+        joint = dict((key, vectors[key][i]) for key in VECTOR_KEYS)
+        joint['name'] = name
+        joint['parent'] = int(parents[i])
+        joint['roo'] = ROTATE_ORDERS[roo[i]]
+        joint['custom'] = custom.get(name, {})
+        joints.append(joint)
+    return joints, flat.get('parent')
+
+
+def _jsonFlat(flat):
+    """
+    Flat skeleton dict with the packed arrays as flat lists.
+    """
+    data = dict(flat)
+    for key in ('parents', 'roo') + VECTOR_KEYS:
+        data[key] = np.asarray(flat[key]).ravel().tolist()
+    return data
+
+
+def readSkeleton(path):
+    """
+    Read a skeleton file of either layout in one read.
+
+    Args:
+        path: The file path to read.
+
+    Returns: Flat skeleton dict with packed arrays.
+    """
+    with open(path) as infile:
+        data = json.load(infile)
+    if not isFlat(data):
+        return packSkeleton(*flattenSkeleton(data))
+    if data.get('version', FLAT_VERSION) > FLAT_VERSION:
+        raise ValueError('Unsupported skeleton file version {} in {}'.format(data['version'], path))
+    flat = dict(data)
+    flat['parents'] = np.asarray(data['parents'], dtype=np.int64)
+    flat['roo'] = np.asarray(data['roo'], dtype=np.int64)
+    for key in VECTOR_KEYS:
+        flat[key] = np.asarray(data[key], dtype=np.float64).reshape(-1, 3)
+    return flat
+
+
+def writeSkeleton(path, joints, parent=None, flat=False):
+    """
+    Write joint dicts to a skeleton file.
+
+    Args:
+        path: The file path to write.
+        joints: List of joint dicts in topological order.
+        parent: Parent node of the roots.
+        flat: True to write the flat layout, False for the nested layout.
+    """
+    if flat:
+        data = _jsonFlat(packSkeleton(joints, parent=parent))
+    else:
+        data = nestSkeleton(joints, parent=parent)
+    with open(path, 'w') as outfile:
+        json.dump(data, outfile, sort_keys=True, indent=4)
+
+
+def convertSkeleton(path, outputPath, flat=True):
+    """
+    Convert a skeleton file between the nested and flat layouts.
+
+    Args:
+        path: Skeleton file of either layout.
+        outputPath: The file path to write.
+        flat: True to write the flat layout, False for the nested layout.
+    """
+    writeSkeleton(outputPath, *unpackSkeleton(readSkeleton(path)), flat=flat)
@@ -1,16 +1,25 @@
 import os
-import re
 import json
+import contextlib
 import maya.cmds as cmds
 import maya.mel as mel
-import maya.OpenMaya as om
-import maya.OpenMayaAnim as oma
+import maya.api.OpenMaya as om2
+import maya.api.OpenMayaAnim as oma2
+import numpy as np
 import log
+import naming
+import skinweights
+import spatial
+import topology
 from vendor.Qt import QtWidgets, QtCore
 
 LOG = log.get_logger(__name__)
 # CONSTANTS
 PROXYGRP = 'PROXY_SKIN_INFS'
+# correspondence maps shared by every skin weight operation
+TOPOLOGY_CACHE = topology.MapCache()
+# in-session skin weight checkpoints
+SNAPSHOTS = skinweights.SnapshotStore()
 
 
 def create(geom, infs, name=None, proxyJnts=True, nw=2, bm=0, sm=0, mi=4):
@@ -21,7 +30,7 @@ def create(geom, infs, name=None, proxyJnts=True, nw=2, bm=0, sm=0, mi=4):
         geom: Target geo.
         infs: A list of influence objects.
         name: SkinCluster name.
-        proxyJnts:
+        proxyJnts: True to create proxy joints for missing influences, see createProxyInfluences().
         nw: Normalization mode. 0 - none, 1 - interactive, 2 - post
         bm: Binding method. 0 - Closest distance between a joint and a point of the geometry. 1 - Closest distance between a joint, considering the skeleton hierarchy, and a point of the geometry. 2 - Surface heat map diffusion.
         sm: Skinning method. 0 - classical linear skinning. 1 - dual quaternion (volume preserving), 2 - a weighted blend between the two.
@@ -35,52 +44,140 @@ def create(geom, infs, name=None, proxyJnts=True, nw=2, bm=0, sm=0, mi=4):
     if not cmds.objExists(geom):
         LOG.warning('Could not find mesh: "' + geom + '", skipping...')
         return
-    infsDup = []
-    for inf in infs:
-        if not cmds.objExists(inf) and proxyJnts:
-            # create a proxy influence so we can still apply weights
-            LOG.warning('Could not find influence: "' + inf + '", creating a proxy...')
-            if not cmds.objExists(PROXYGRP):
-                cmds.createNode('transform', n=PROXYGRP)
-            infShortName = inf.split('|')[-1]
-            cmds.select(PROXYGRP)
-            infName = cmds.joint(n=infShortName)
-            infsDup.append(infName)
-        else:
-            infsDup.append(inf)
+    if proxyJnts:
+        resolved = createProxyInfluences(infs)
+        infsDup = [resolved[inf] for inf in infs]
+    else:
+        infsDup = infs
     skin = cmds.skinCluster(infsDup, geom, n=name, tsb=True, lw=False, nw=nw, bm=bm, sm=sm, mi=mi)[0]
     return skin
 
 
-def removeUnusedInfluences(srcSkin):
+def createProxyInfluences(infs, force=False):
     """
-    Remove unused influences on a skinCluster.
+    Resolve a list of influences, creating a proxy joint under PROXYGRP for each missing one
+    so weights can still be applied. Every influence is checked once and the selection is left untouched.
+
+    Args:
+        infs: A list of influence objects. Can repeat.
+        force: True to create a proxy for every influence, e.g. for names matching several nodes.
+
+    Returns: {influence: existing node or created proxy joint}
+    """
+    resolved = {}
+    missing = []
+    for inf in infs:
+        if inf in resolved:
+            continue
+        resolved[inf] = inf
+        if force or not cmds.objExists(inf):
+            missing.append(inf)
+    if not missing:
+        return resolved
+
+    if not cmds.objExists(PROXYGRP):
+        cmds.createNode('transform', n=PROXYGRP)
+    for inf in missing:
+        # create a proxy influence so we can still apply weights
+        LOG.warning('Could not find influence: "' + inf + '", creating a proxy...')
+        resolved[inf] = cmds.createNode('joint', n=inf.split('|')[-1], p=PROXYGRP)
+    return resolved
+
+
+def createBatch(manifest, infs=None, proxyJnts=True, nw=2, bm=0, sm=0, mi=4):
+    """
+    Create skinClusters for many meshes in one batch.
+    Influences of every mesh are resolved together, so missing influences shared by many meshes
+    only get one proxy joint, created in a single pass.
+
+    Example:
+        # 200 props bound to the same skeleton
+        skinclusters.createBatch(props, infs=skeletonJoints)
+        # per mesh settings
+        skinclusters.createBatch({'body': {'sm': 2, 'mi': 8}, 'cap': {'infs': ['head'], 'mi': 1}}, infs=joints)
+        # settings from a json file
+        skinclusters.createBatch('/path/to/bind_manifest.json')
+
+    Args:
+        manifest: A list of meshes, a {mesh: settings} dict, or the path of a json file holding that dict.
+                  Settings can override any of infs, name, nw, bm, sm and mi for a mesh.
+        infs: Default list of influence objects.
+        proxyJnts: True to create proxy joints for missing influences.
+        nw: Default normalization mode, see create().
+        bm: Default binding method, see create().
+        sm: Default skinning method, see create().
+        mi: Default maximum number of influences, see create().
+
+    Returns: {mesh: created skinCluster}
+    """
+    if not isinstance(manifest, (dict, list, tuple)):
+        with open(manifest) as infile:
+            manifest = json.load(infile)
+    if not isinstance(manifest, dict):
+        manifest = dict((mesh, {}) for mesh in manifest)
+    defaults = {'infs': infs or [], 'name': None, 'nw': nw, 'bm': bm, 'sm': sm, 'mi': mi}
+
+    settings = {}
+    for mesh in sorted(manifest):
+        if not cmds.objExists(mesh):
+            LOG.warning('Could not find mesh: "' + mesh + '", skipping...')
+            continue
+        if getSkinCluster(mesh):
+            LOG.warning('Mesh "{0}" already has a skinCluster, skipping...'.format(mesh))
+            continue
+        settings[mesh] = dict(defaults, **(manifest[mesh] or {}))
+        if not settings[mesh]['infs']:
+            LOG.warning('Mesh "{0}" has no influences, skipping...'.format(mesh))
+            settings.pop(mesh)
+
+    # every influence is resolved once for the whole batch
+    allInfs = [inf for mesh in settings for inf in settings[mesh]['infs']]
+    resolved = createProxyInfluences(allInfs) if proxyJnts else dict((inf, inf) for inf in allInfs)
+
+    skins = {}
+    for mesh in sorted(settings):
+        meshSettings = settings[mesh]
+        name = meshSettings['name'] or mesh.split('|')[-1] + '_skinCluster'
+        skins[mesh] = cmds.skinCluster([resolved[inf] for inf in meshSettings['infs']], mesh, n=name, tsb=True,
+                                       lw=False, nw=meshSettings['nw'], bm=meshSettings['bm'],
+                                       sm=meshSettings['sm'], mi=meshSettings['mi'])[0]
+    LOG.info('Created {0} skinClusters.'.format(len(skins)))
+    return skins
+
+
+def removeInfluences(srcSkin, infls):
+    """
+    Remove influences from a skinCluster in a single edit.
 
     Args:
         srcSkin: Target skinCluster.
+        infls: A list of influence objects.
 
     Returns: The number of removed influence(s).
     """
-    removeCount = 0
-    infls = cmds.skinCluster(srcSkin, q=True, inf=True)
-    wtinfs = cmds.skinCluster(srcSkin, q=True, wi=True)
-
-    # set skinCluster to HasNoEffect so it won't process after each removal
+    if not infls:
+        return 0
+    # set skinCluster to HasNoEffect so it won't process during the removal
     nodeState = cmds.getAttr(srcSkin + ".nodeState")
     cmds.setAttr(srcSkin + ".nodeState", 1)
-    for infl in infls:
-        found = False
-        for wtinf in wtinfs:
-            if wtinf == infl:
-                found = True
-                break
-        if not found:
-            # remove the influence since it has no effect
-            cmds.skinCluster(srcSkin, e=True, ri=infl)
-            removeCount += 1
+    cmds.skinCluster(srcSkin, e=True, ri=list(infls))
     # restore the old node state
     cmds.setAttr(srcSkin + ".nodeState", nodeState)
-    return removeCount
+    return len(infls)
+
+
+def removeUnusedInfluences(srcSkin):
+    """
+    Remove unused influences on a skinCluster.
+
+    Args:
+        srcSkin: Target skinCluster.
+
+    Returns: The number of removed influence(s).
+    """
+    infls = cmds.skinCluster(srcSkin, q=True, inf=True)
+    wtinfs = set(cmds.skinCluster(srcSkin, q=True, wi=True) or [])
+    return removeInfluences(srcSkin, [infl for infl in infls if infl not in wtinfs])
 
 
 def getInfluences(src):
@@ -115,261 +212,1197 @@ def getSkinCluster(src):
     return srcSkin
 
 
-def exportSkinWeight(exportPath, meshes, namespace=False):
+def _getSkinFn(skinCluster):
+    """
+    Get the API 2.0 function set of a skinCluster.
+
+    Args:
+        skinCluster: SkinCluster node.
+
+    Returns: (MFnSkinCluster, MDagPath of the deformed geometry)
+    """
+    selList = om2.MSelectionList()
+    selList.add(skinCluster)
+    skinFn = oma2.MFnSkinCluster(selList.getDependNode(0))
+    return skinFn, skinFn.getPathAtIndex(0)
+
+
+def _vertexComponent(vertexIds=None, vertexCount=None):
+    """
+    Create a mesh vertex component object.
+
+    Args:
+        vertexIds: A list of vertex ids.
+        vertexCount: Number of vertices for a complete component. Used when vertexIds is None.
+
+    Returns: MObject of kMeshVertComponent.
+    """
+    compFn = om2.MFnSingleIndexedComponent()
+    component = compFn.create(om2.MFn.kMeshVertComponent)
+    if vertexIds is None:
+        compFn.setCompleteData(vertexCount)
+    else:
+        compFn.addElements(om2.MIntArray(np.asarray(vertexIds, dtype=np.int64).tolist()))
+    return component
+
+
+def getSelectedVertices():
+    """
+    Selected vertex ids per mesh, read once from the active selection list.
+    Components are read as index arrays, the selection is never flattened to one string per vertex.
+
+    Returns: {full path of the mesh transform and of its shape: sorted numpy int array}
+    """
+    selList = om2.MGlobal.getActiveSelectionList()
+    selected = {}
+    for i in xrange(selList.length()):
+        try:
+            dagPath, component = selList.getComponent(i)
+        except (TypeError, RuntimeError):
+            # not a dag node
+            continue
+        if component.isNull() or not component.hasFn(om2.MFn.kMeshVertComponent):
+            continue
+        ids = np.array(om2.MFnSingleIndexedComponent(component).getElements(), dtype=np.int64)
+        paths = [dagPath.fullPathName()]
+        if dagPath.apiType() == om2.MFn.kMesh:
+            transform = om2.MDagPath(dagPath)
+            transform.pop()
+            paths.append(transform.fullPathName())
+        for path in paths:
+            selected.setdefault(path, []).append(ids)
+    return dict((path, np.unique(np.concatenate(ids))) for path, ids in selected.items())
+
+
+def getInfluenceIndices(skinCluster, infs):
+    """
+    Map influence names to the influence indices of a skinCluster.
+
+    Args:
+        skinCluster: SkinCluster node.
+        infs: A list of influence names.
+
+    Returns: Numpy int array, same length as infs. -1 for influences not on the skinCluster.
+    """
+    skinFn, _ = _getSkinFn(skinCluster)
+    current = {}
+    for i, infDag in enumerate(skinFn.influenceObjects()):
+        current[infDag.partialPathName()] = i
+        current[infDag.fullPathName()] = i
+    return np.array([current.get(inf, -1) for inf in infs], dtype=np.int64)
+
+
+def getVertexCount(skinCluster):
+    """
+    Number of vertices deformed by a skinCluster.
+
+    Args:
+        skinCluster: SkinCluster node.
+
+    Returns: Vertex count of the deformed geometry.
+    """
+    _, geoPath = _getSkinFn(skinCluster)
+    return om2.MItGeometry(geoPath).count()
+
+
+def getPoints(mesh):
+    """
+    World space positions of all vertices of a mesh, read in one query.
+
+    Args:
+        mesh: Mesh node.
+
+    Returns: (vertex, 3) numpy array.
+    """
+    points = cmds.xform('{}.vtx[*]'.format(mesh), q=True, ws=True, t=True)
+    return np.array(points, dtype=np.float64).reshape(-1, 3)
+
+
+def getTriangles(mesh):
+    """
+    Triangulated vertex ids of a mesh.
+
+    Args:
+        mesh: Mesh node.
+
+    Returns: (triangle, 3) numpy int array.
+    """
+    selList = om2.MSelectionList()
+    selList.add(mesh)
+    meshPath = selList.getDagPath(0)
+    meshPath.extendToShape()
+    _, triangleVerts = om2.MFnMesh(meshPath).getTriangles()
+    return np.array(triangleVerts, dtype=np.int32).reshape(-1, 3)
+
+
+def getTopologyFingerprint(mesh):
+    """
+    Hash the vertex count, face counts and face-vertex connectivity of a mesh.
+
+    Args:
+        mesh: Mesh node.
+
+    Returns: Hex digest string, see topology.fingerprint().
+    """
+    selList = om2.MSelectionList()
+    selList.add(mesh)
+    meshPath = selList.getDagPath(0)
+    meshPath.extendToShape()
+    meshFn = om2.MFnMesh(meshPath)
+    faceCounts, faceConnects = meshFn.getVertices()
+    return topology.fingerprint(meshFn.numVertices, np.array(faceCounts), np.array(faceConnects))
+
+
+def getWeights(skinCluster, vertexIds=None):
+    """
+    Get the weights of many vertices with a single MFnSkinCluster.getWeights call.
+
+    Args:
+        skinCluster: SkinCluster node.
+        vertexIds: A list of vertex ids. Defaults to every vertex.
+
+    Returns: Dense (vertex, influence) float64 numpy array. Columns follow the skinCluster influence order.
+    """
+    skinFn, geoPath = _getSkinFn(skinCluster)
+    if vertexIds is None:
+        component = _vertexComponent(vertexCount=om2.MItGeometry(geoPath).count())
+    else:
+        component = _vertexComponent(vertexIds)
+    weights, infCount = skinFn.getWeights(geoPath, component)
+    return np.array(weights, dtype=np.float64).reshape(-1, infCount)
+
+
+def getSparseWeights(skinCluster, threshold=0.0, chunkSize=None):
+    """
+    Get the weights of a skinCluster as CSR arrays, reading bounded vertex chunks.
+
+    Args:
+        skinCluster: SkinCluster node.
+        threshold: Weights less than or equal to this are dropped.
+        chunkSize: Number of vertices per getWeights call. None to read every vertex in one call.
+
+    Returns: (offsets, indices, values) numpy arrays.
+    """
+    vertexCount = getVertexCount(skinCluster)
+    if not chunkSize:
+        return skinweights.denseToCsr(getWeights(skinCluster), threshold=threshold)
+
+    # progressBar visualization
+    progressBar = QtWidgets.QProgressBar()
+    progressBar.setMinimumSize(QtCore.QSize(450, 40))
+    progressBar.setMinimum(0)
+    progressBar.setMaximum(vertexCount)
+    progressBar.setWindowTitle('Exporting skincluster: {}'.format(skinCluster))
+    progressBar.show()
+
+    parts = []
+    for start in xrange(0, vertexCount, chunkSize):
+        vertexIds = np.arange(start, min(start + chunkSize, vertexCount))
+        parts.append(skinweights.denseToCsr(getWeights(skinCluster, vertexIds), threshold=threshold))
+        progressBar.setValue(vertexIds[-1] + 1)
+    progressBar.close()
+    return skinweights.concatCsr(parts)
+
+
+def getSkinWeights(skinCluster, threshold=0.0, chunkSize=None):
+    """
+    Get the weights of a skinCluster with its influence names.
+
+    Args:
+        skinCluster: SkinCluster node.
+        threshold: Weights less than or equal to this are dropped.
+        chunkSize: Number of vertices per getWeights call. None to read every vertex in one call.
+
+    Returns: skinweights.SkinWeights. Influences are named by their shortest unique path.
+    """
+    skinFn, _ = _getSkinFn(skinCluster)
+    infs = [infDag.partialPathName() for infDag in skinFn.influenceObjects()]
+    offsets, indices, values = getSparseWeights(skinCluster, threshold=threshold, chunkSize=chunkSize)
+    return skinweights.SkinWeights(offsets, indices, values, infs)
+
+
+def _runs(ids):
+    """
+    Split ids into runs of consecutive values.
+
+    Args:
+        ids: Int array.
+
+    Returns: List of (start, stop) positions in ids.
+    """
+    if not len(ids):
+        return []
+    breaks = (np.flatnonzero(np.diff(ids) != 1) + 1).tolist()
+    return list(zip([0] + breaks, breaks + [len(ids)]))
+
+
+@contextlib.contextmanager
+def _undoChunk(enabled=True):
+    """
+    Group the undoable commands run in the block in a single undo step.
+
+    Args:
+        enabled: False to run the block as is.
+    """
+    if not enabled:
+        yield
+        return
+    cmds.undoInfo(openChunk=True)
+    try:
+        yield
+    finally:
+        cmds.undoInfo(closeChunk=True)
+
+
+def _setWeightsUndoable(skinCluster, weights, vertexIds, infIndices, normalize=False):
+    """
+    Set weights with undoable setAttr calls on the weightList plugs, one call per vertex and run of
+    consecutive influences, in a single undo chunk.
+    """
+    skinFn, geoPath = _getSkinFn(skinCluster)
+    infDags = skinFn.influenceObjects()
+    logical = np.array([skinFn.indexForInfluenceObject(infDags[int(i)]) for i in infIndices], dtype=np.int64)
+    order = np.argsort(logical)
+    logical = logical[order]
+    weights = weights[:, order]
+    runs = _runs(logical)
+    with _undoChunk():
+        for vertexId, row in zip(vertexIds.tolist(), weights.tolist()):
+            for start, stop in runs:
+                cmds.setAttr('{0}.weightList[{1}].weights[{2}:{3}]'.format(
+                    skinCluster, vertexId, logical[start], logical[stop - 1]), *row[start:stop], size=stop - start)
+        if normalize:
+            mesh = geoPath.fullPathName()
+            cmds.skinPercent(skinCluster, ['{0}.vtx[{1}:{2}]'.format(mesh, vertexIds[start], vertexIds[stop - 1])
+                                           for start, stop in _runs(vertexIds)], normalize=True)
+
+
+def setWeights(skinCluster, weights, vertexIds=None, infIndices=None, normalize=False, undoable=True):
+    """
+    Set the weights of many vertices.
+    By default the weightList plugs are set with setAttr, in one undo step, so the edit can be undone.
+    That is one call per vertex and run of consecutive influences, slow on dense meshes.
+    Batch and scripted callers pass undoable=False for a single MFnSkinCluster.setWeights call,
+    which is not recorded in the undo queue.
+
+    Args:
+        skinCluster: SkinCluster node.
+        weights: Dense (vertex, influence) array.
+        vertexIds: Vertex ids of the rows of weights. Defaults to vertex 0 to len(weights) - 1.
+        infIndices: SkinCluster influence index of each column of weights. Defaults to all influences in order.
+        normalize: True to let Maya normalize the new weights.
+        undoable: True to set the weights with undoable setAttr calls. False for the fast API call.
+
+    Returns: NA
+    """
+    weights = np.asarray(weights, dtype=np.float64)
+    if infIndices is None:
+        infIndices = np.arange(weights.shape[1])
+    if undoable:
+        if vertexIds is None:
+            vertexIds = np.arange(weights.shape[0])
+        _setWeightsUndoable(skinCluster, weights, np.asarray(vertexIds, dtype=np.int64),
+                            np.asarray(infIndices, dtype=np.int64), normalize=normalize)
+        return
+    skinFn, geoPath = _getSkinFn(skinCluster)
+    if vertexIds is None:
+        component = _vertexComponent(vertexCount=weights.shape[0])
+    else:
+        component = _vertexComponent(vertexIds)
+    skinFn.setWeights(geoPath, component,
+                      om2.MIntArray(np.asarray(infIndices, dtype=np.int64).tolist()),
+                      om2.MDoubleArray(weights.ravel().tolist()),
+                      normalize)
+
+
+def getBlendWeights(skinCluster, vertexIds=None):
+    """
+    Get the dual quaternion blend weights of many vertices with a single MFnSkinCluster.getBlendWeights call.
+
+    Args:
+        skinCluster: SkinCluster node.
+        vertexIds: A list of vertex ids. Defaults to every vertex.
+
+    Returns: Float32 numpy array, one blend weight per vertex.
+    """
+    skinFn, geoPath = _getSkinFn(skinCluster)
+    if vertexIds is None:
+        component = _vertexComponent(vertexCount=om2.MItGeometry(geoPath).count())
+    else:
+        component = _vertexComponent(vertexIds)
+    return np.array(skinFn.getBlendWeights(geoPath, component), dtype=np.float32)
+
+
+def setBlendWeights(skinCluster, blendWeights, vertexIds=None, undoable=True):
+    """
+    Set the dual quaternion blend weights of many vertices.
+    By default the blendWeights plug is set with setAttr, one call per run of consecutive vertices, in one
+    undo step. Batch and scripted callers pass undoable=False for a single MFnSkinCluster.setBlendWeights
+    call, which is not recorded in the undo queue.
+
+    Args:
+        skinCluster: SkinCluster node.
+        blendWeights: One blend weight per vertex.
+        vertexIds: Vertex ids of the blend weights. Defaults to vertex 0 to len(blendWeights) - 1.
+        undoable: True to set the blend weights with undoable setAttr calls. False for the fast API call.
+
+    Returns: NA
+    """
+    blendWeights = np.asarray(blendWeights, dtype=np.float64)
+    if undoable:
+        vertexIds = np.arange(len(blendWeights)) if vertexIds is None else np.asarray(vertexIds, dtype=np.int64)
+        values = blendWeights.tolist()
+        with _undoChunk():
+            for start, stop in _runs(vertexIds):
+                cmds.setAttr('{0}.blendWeights[{1}:{2}]'.format(skinCluster, vertexIds[start], vertexIds[stop - 1]),
+                             *values[start:stop], size=stop - start)
+        return
+    skinFn, geoPath = _getSkinFn(skinCluster)
+    if vertexIds is None:
+        component = _vertexComponent(vertexCount=len(blendWeights))
+    else:
+        component = _vertexComponent(vertexIds)
+    skinFn.setBlendWeights(geoPath, component, om2.MDoubleArray(blendWeights.tolist()))
+
+
+def _applyRecord(skinCluster, record, vertexIds=None, chunkSize=None, validate=True, undoable=True):
+    """
+    Apply a skin weight record to a skinCluster in one setWeights() call, or one call per vertex chunk.
+    Normalization is turned off while setting raw values and applied once at the end.
+
+    Args:
+        skinCluster: SkinCluster node.
+        record: Skin weight record holding CSR arrays.
+        vertexIds: Optional vertex ids to apply. Defaults to every vertex stored in the record.
+        chunkSize: Number of vertices expanded and set per call. None to set every vertex in one call.
+                   Only one dense chunk is alive at a time, so memory peaks at chunkSize * influences.
+                   The import can be cancelled between chunks, leaving the skinCluster partially weighted.
+        validate: True to drop invalid weights and renormalize the vertices before they are set.
+                  See skinweights.validateWeights().
+        undoable: True to set the weights with undoable setAttr calls, in one undo step. Slow on dense meshes.
+                  False for batch and scripted callers: bulk API calls, not undoable. See setWeights().
+
+    Returns: (number of vertices set, True if cancelled, validation report or None)
+    """
+    weights = skinweights.SkinWeights.fromRecord(record)
+    infIndices = getInfluenceIndices(skinCluster, weights.infs)
+    for inf, infIndex in zip(weights.infs, infIndices):
+        if infIndex < 0:
+            LOG.warning('SkinCluster "{0}": Influence "{1}" not found, its weights are skipped'.format(skinCluster, inf))
+
+    # only keep influences found on the skinCluster, as dense columns
+    found = np.flatnonzero(infIndices >= 0)
+    foundInfs = [weights.infs[i] for i in found]
+
+    with _undoChunk(undoable):
+        skinNorm = cmds.getAttr('%s.normalizeWeights' % skinCluster)
+        if skinNorm != 0:
+            cmds.setAttr('%s.normalizeWeights' % skinCluster, 0)
+
+        total = weights.vertexCount if vertexIds is None else len(vertexIds)
+        step = chunkSize or max(total, 1)
+        progressDialog = None
+        if chunkSize:
+            # progressBar visualization
+            progressDialog = QtWidgets.QProgressDialog('Importing skincluster: {}'.format(skinCluster), 'Cancel',
+                                                       0, total)
+            progressDialog.setMinimumSize(QtCore.QSize(450, 40))
+            progressDialog.setWindowTitle('Importing skincluster: {}'.format(skinCluster))
+            progressDialog.show()
+
+        reports = []
+        completed = 0
+        cancelled = False
+        while completed < total:
+            if vertexIds is None:
+                chunkIds = np.arange(completed, min(completed + step, total))
+                chunk = weights.view(chunkIds[0], chunkIds[-1] + 1)
+            else:
+                chunkIds = np.asarray(vertexIds[completed:completed + step])
+                chunk = weights.rows(chunkIds)
+            if validate:
+                csr, report = skinweights.validateWeights(chunk.offsets, chunk.indices, chunk.values,
+                                                          infCount=len(chunk.infs), nw=skinNorm, rows=chunkIds)
+                chunk = skinweights.SkinWeights(*csr, infs=chunk.infs)
+                reports.append(report)
+            dense = chunk.toDense(infs=foundInfs)
+            setWeights(skinCluster, dense, vertexIds=chunkIds, infIndices=infIndices[found], undoable=undoable)
+            completed += len(chunkIds)
+            del dense, chunk
+
+            if progressDialog:
+                progressDialog.setValue(completed)
+                QtWidgets.QApplication.processEvents()
+                if progressDialog.wasCanceled() and completed < total:
+                    LOG.warning('SkinCluster "{0}": Import cancelled after {1} / {2} vertices'.format(
+                        skinCluster, completed, total))
+                    cancelled = True
+                    break
+        if progressDialog:
+            progressDialog.close()
+
+        # restore normalize setting
+        cmds.setAttr('%s.normalizeWeights' % skinCluster, skinNorm)
+        if skinNorm == 1:
+            cmds.skinCluster(skinCluster, e=True, forceNormalizeWeights=True)
+
+        if 'blendWeights' in record and not cancelled:
+            blendWeights = np.asarray(record['blendWeights'])
+            if vertexIds is None:
+                setBlendWeights(skinCluster, blendWeights, undoable=undoable)
+            else:
+                setBlendWeights(skinCluster, blendWeights[vertexIds], vertexIds=vertexIds, undoable=undoable)
+
+    report = None
+    if validate:
+        report = skinweights.mergeValidationReports(reports)
+        summary = skinweights.formatValidationReport(report)
+        if summary:
+            LOG.warning('SkinCluster "{0}": {1}'.format(skinCluster, summary))
+    return completed, cancelled, report
+
+
+def cleanSkinCluster(skinCluster, threshold=0.001, maxInfluences=4, removeUnused=True, chunkSize=None,
+                     undoable=True):
+    """
+    Maintenance pass on a skinCluster.
+    Reads the weights once, prunes weights below threshold, caps every vertex to maxInfluences, renormalizes,
+    writes the weights back with setWeights() and removes the influences left without weights in a single edit.
+
+    Args:
+        skinCluster: SkinCluster node.
+        threshold: Weights lower than this are removed.
+        maxInfluences: Maximum number of influences per vertex. None for no limit.
+        removeUnused: True to remove influences without weights.
+        chunkSize: Number of vertices read and written per call. None to process every vertex in one call.
+        undoable: True to set the weights with undoable setAttr calls, in one undo step. Slow on dense meshes.
+                  False for batch and scripted callers: bulk API calls, not undoable. See setWeights().
+
+    Returns: Dict of statistics: vertices, weights, pruned, capped, cappedVertices, removed (influence names).
+    """
+    weights = getSkinWeights(skinCluster, chunkSize=chunkSize)
+    infs = weights.infs
+    skinNorm = cmds.getAttr('%s.normalizeWeights' % skinCluster)
+    (offsets, indices, values), stats = skinweights.cleanWeights(
+        weights.offsets, weights.indices, weights.values, len(infs), threshold=threshold, maxInfluences=maxInfluences,
+        normalize=skinNorm != 0)
+
+    # write back every influence so pruned weights are zeroed
+    vertexCount = len(offsets) - 1
+    step = chunkSize or max(vertexCount, 1)
+    with _undoChunk(undoable):
+        if skinNorm != 0:
+            cmds.setAttr('%s.normalizeWeights' % skinCluster, 0)
+        for start in xrange(0, vertexCount, step):
+            vertexIds = np.arange(start, min(start + step, vertexCount))
+            dense = skinweights.csrToDense(offsets, indices, values, len(infs), rows=vertexIds)
+            setWeights(skinCluster, dense, vertexIds=vertexIds, undoable=undoable)
+        cmds.setAttr('%s.normalizeWeights' % skinCluster, skinNorm)
+
+        stats['removed'] = []
+        if removeUnused:
+            stats['removed'] = [infs[i] for i in stats.pop('unused')]
+            removeInfluences(skinCluster, stats['removed'])
+        else:
+            stats.pop('unused')
+
+    LOG.info('SkinCluster "{0}": pruned {1} weights, capped {2} weights on {3} vertices, removed {4} influences.'.format(
+        skinCluster, stats['pruned'], stats['capped'], stats['cappedVertices'], len(stats['removed'])))
+    return stats
+
+
+def getBoneSegments(infs):
+    """
+    World space bone segments of influences: one segment from each influence to each of its child joints.
+    Influences without child joints get a degenerate segment on their own position.
+
+    Args:
+        infs: A list of influence objects.
+
+    Returns: (starts, ends, owners): (s, 3) segment starts and ends, (s,) influence index of every segment.
+    """
+    selList = om2.MSelectionList()
+    for inf in infs:
+        selList.add(inf)
+
+    starts, ends, owners = [], [], []
+    for i in xrange(selList.length()):
+        dagPath = selList.getDagPath(i)
+        start = om2.MTransformationMatrix(dagPath.inclusiveMatrix()).translation(om2.MSpace.kWorld)
+        dagFn = om2.MFnDagNode(dagPath)
+        childEnds = []
+        for c in xrange(dagFn.childCount()):
+            child = dagFn.child(c)
+            if not child.hasFn(om2.MFn.kJoint):
+                continue
+            childPath = om2.MDagPath.getAPathTo(child)
+            childEnds.append(om2.MTransformationMatrix(childPath.inclusiveMatrix()).translation(om2.MSpace.kWorld))
+        for end in childEnds or [start]:
+            starts.append((start.x, start.y, start.z))
+            ends.append((end.x, end.y, end.z))
+            owners.append(i)
+    return np.array(starts, dtype=np.float64), np.array(ends, dtype=np.float64), np.array(owners, dtype=np.int64)
+
+
+def bindSkin(mesh, infs, mode=skinweights.BIND_CLOSEST, maxInfluences=4, falloff=2.0, chunkSize=None, undoable=True,
+             **kwargs):
+    """
+    Bind a mesh with starter weights computed in numpy from the distance of every vertex to the bones,
+    then written with setWeights().
+
+    Args:
+        mesh: Mesh node.
+        infs: A list of influence objects.
+        mode: skinweights.BIND_CLOSEST to fully weight every vertex to its closest bone.
+              skinweights.BIND_INVERSE_DISTANCE to blend the maxInfluences closest bones by inverse distance.
+        maxInfluences: Maximum number of influences per vertex.
+        falloff: Inverse distance exponent. Higher values give harder transitions.
+        chunkSize: Number of vertices set per call. None to set every vertex in one call.
+        undoable: True to set the weights with undoable setAttr calls, in one undo step. Slow on dense meshes.
+                  False for batch and scripted callers: bulk API calls, not undoable. See setWeights().
+        **kwargs: Passed to create() when the mesh has no skinCluster yet (name, nw, sm).
+
+    Returns: The skinCluster.
+    """
+    missing = [inf for inf in infs if not cmds.objExists(inf)]
+    if missing:
+        LOG.error('Unable to bind {0}, influences not found: {1}'.format(mesh, missing))
+        return None
+    skinCluster = getSkinCluster(mesh)
+    if not skinCluster:
+        skinCluster = create(mesh, infs, mi=maxInfluences, **kwargs)
+        if not skinCluster:
+            return None
+    infIndices = getInfluenceIndices(skinCluster, infs)
+    for inf in np.array(infs)[infIndices < 0]:
+        LOG.warning('SkinCluster "{0}": Influence "{1}" not found, it is skipped'.format(skinCluster, inf))
+
+    skinFn, _ = _getSkinFn(skinCluster)
+    skinInfs = [infDag.partialPathName() for infDag in skinFn.influenceObjects()]
+
+    # segments are owned by skinCluster influence indices
+    starts, ends, owners = getBoneSegments(infs)
+    onSkin = infIndices[owners] >= 0
+    offsets, indices, values = skinweights.bindWeights(
+        getPoints(mesh), starts[onSkin], ends[onSkin], infIndices[owners[onSkin]], len(skinInfs), mode=mode,
+        maxInfluences=maxInfluences, falloff=falloff)
+    # weights on every skinCluster influence, so the influences not bound to are zeroed
+    record = skinweights.SkinWeights(offsets, indices, values, skinInfs).toRecord()
+    _applyRecord(skinCluster, record, chunkSize=chunkSize, validate=False, undoable=undoable)
+    LOG.info('Bound {0} vertices of {1} to {2} influences.'.format(len(offsets) - 1, mesh, len(infs)))
+    return skinCluster
+
+
+def getSymmetryMap(mesh, axis=0):
     """
-    Export skinWeights of a list of meshes to a json file.
+    Mirror vertex of every vertex of a mesh, cached per topology and vertex positions.
 
     Args:
-        exportPath: The file path where a json file is saved.
+        mesh: Mesh node.
+        axis: Mirror axis, 0 for x, 1 for y, 2 for z.
+
+    Returns: (mirror vertex ids, distances from the mirrored positions to the matched vertices) numpy arrays.
+    """
+    points = getPoints(mesh)
+    key = TOPOLOGY_CACHE.key('symmetry', axis, getTopologyFingerprint(mesh), topology.pointsHash(points))
+    cached = TOPOLOGY_CACHE.get(key)
+    if cached is not None:
+        return cached['mirror'], cached['distances']
+    mirror, distances = skinweights.symmetryMap(points, axis=axis)
+    TOPOLOGY_CACHE.put(key, {'mirror': mirror, 'distances': distances})
+    return mirror, distances
+
+
+def mirrorSkinWeight(mesh, axis='x', positive=True, rules=skinweights.MIRROR_RULES, tolerance=0.001,
+                     matchTolerance=0.01, undoable=True):
+    """
+    Mirror the skin weights of a mesh from one side to the other.
+    The symmetry map is cached per topology and vertex positions, influences are mirrored by name rules
+    and the weights are written back in a single setWeights() call.
+
+    Args:
+        mesh: Mesh node.
+        axis: Mirror axis, 'x', 'y' or 'z'.
+        positive: True to mirror from the positive side to the negative side. False for the other way around.
+        rules: List of (left, right) influence name substrings, e.g. [('L_', 'R_')].
+        tolerance: Vertices closer than this to the mirror plane are left untouched.
+        matchTolerance: Vertices whose mirrored position is further than this from any vertex have no
+                        symmetric counterpart. Their weights are left untouched.
+        undoable: True to set the weights with undoable setAttr calls, in one undo step. Slow on dense meshes.
+                  False for batch and scripted callers: bulk API calls, not undoable. See setWeights().
+
+    Returns: Number of mirrored vertices. None if the mesh has no skinCluster.
+    """
+    skinCluster = getSkinCluster(mesh)
+    if not skinCluster:
+        LOG.warning('Mesh {} has no skinCluster, skipping... '.format(mesh))
+        return None
+    axis = 'xyz'.index(axis.lower())
+
+    weights = getSkinWeights(skinCluster)
+    infs = weights.infs
+    infTable = skinweights.mirrorInfluenceTable(infs, rules=rules)
+    for i in np.flatnonzero(infTable == np.arange(len(infs))):
+        LOG.debug('Influence "{0}" has no mirrored influence, mirroring onto itself.'.format(infs[i]))
+
+    mirror, distances = getSymmetryMap(mesh, axis=axis)
+    coords = getPoints(mesh)[:, axis]
+    targets = np.flatnonzero(coords < -tolerance if positive else coords > tolerance)
+    unmatched = distances[targets] > matchTolerance
+    if unmatched.any():
+        LOG.warning('Mesh "{0}": {1} vertices have no mirrored vertex within {2}, leaving their weights '
+                    'untouched (furthest match {3:.4g}).'.format(mesh, int(unmatched.sum()), matchTolerance,
+                                                                 distances[targets].max()))
+        targets = targets[~unmatched]
+
+    offsets, indices, values = skinweights.mirrorWeights(weights.offsets, weights.indices, weights.values,
+                                                         mirror, infTable, targets)
+    dense = skinweights.csrToDense(offsets, indices, values, len(infs), rows=targets)
+
+    with _undoChunk(undoable):
+        skinNorm = cmds.getAttr('%s.normalizeWeights' % skinCluster)
+        if skinNorm != 0:
+            cmds.setAttr('%s.normalizeWeights' % skinCluster, 0)
+        setWeights(skinCluster, dense, vertexIds=targets, undoable=undoable)
+        cmds.setAttr('%s.normalizeWeights' % skinCluster, skinNorm)
+    LOG.info('Mirrored skin weights of {0} vertices on {1}.'.format(len(targets), mesh))
+    return len(targets)
+
+
+def getSourceRecord(mesh, skinCluster=None):
+    """
+    Skin weight record of a live skinCluster, with the vertex positions and triangles of its mesh,
+    as it would be exported with storePositions=True.
+
+    Args:
+        mesh: Mesh node.
+        skinCluster: SkinCluster node. Defaults to the skinCluster of the mesh.
+
+    Returns: Record dict. None if the mesh has no skinCluster.
+    """
+    skinCluster = skinCluster or getSkinCluster(mesh)
+    if not skinCluster:
+        return None
+    record = getSkinWeights(skinCluster).toRecord()
+    record.update({'skinCluster': skinCluster,
+                   'nw': cmds.getAttr('%s.normalizeWeights' % skinCluster),
+                   'sm': cmds.getAttr('%s.skinningMethod' % skinCluster),
+                   'mi': cmds.getAttr('%s.maxInfluences' % skinCluster),
+                   'points': getPoints(mesh),
+                   'triangles': getTriangles(mesh)})
+    if record['sm'] == 2:
+        record['blendWeights'] = getBlendWeights(skinCluster)
+    return record
+
+
+def getTriangleBVH(points, triangles):
+    """
+    Triangle BVH of a mesh. The triangle order is cached per topology, so rebuilding the tree of a known
+    topology skips the sort. Any order gives exact results, a cached one only affects the search speed.
+
+    Args:
+        points: (n, 3) vertex positions.
+        triangles: (m, 3) vertex ids.
+
+    Returns: spatial.TriangleBVH
+    """
+    key = TOPOLOGY_CACHE.key('bvh', spatial.LEAF_SIZE, topology.fingerprint(len(points), triangles))
+    cached = TOPOLOGY_CACHE.get(key)
+    if cached is not None and len(cached['order']) == len(triangles):
+        return spatial.TriangleBVH(points, triangles, order=cached['order'])
+    bvh = spatial.TriangleBVH(points, triangles)
+    TOPOLOGY_CACHE.put(key, bvh.arrays())
+    return bvh
+
+
+def transferSkinWeight(source, targets, sourcePath=None, mode=skinweights.REMAP_SURFACE, chunkSize=None,
+                       undoable=True):
+    """
+    Transfer skin weights from one mesh to others by position, e.g. from LOD0 to every other LOD.
+    Every target vertex gets the weights of its closest point on the source surface, interpolated
+    barycentrically. The source search structures are built once for all targets, and the vertex
+    correspondence is cached per source and target topology and vertex positions.
+
+    Args:
+        source: Source mesh. With sourcePath, the mesh name in the file.
+        targets: A list of target meshes. Their skinClusters are rebuilt on the source influences.
+        sourcePath: Optional skin weight file to read the source from, exported with storePositions=True.
+                    Defaults to the live skinCluster of the source mesh.
+        mode: skinweights.REMAP_SURFACE (exact closest point), skinweights.REMAP_BARYCENTRIC
+              (closest point around the nearest vertex) or skinweights.REMAP_CLOSEST (nearest vertex).
+        chunkSize: Number of vertices set per call. None to set a mesh in one call.
+        undoable: True to set the weights with undoable setAttr calls, in one undo step. Slow on dense meshes.
+                  False for batch and scripted callers: bulk API calls, not undoable. See setWeights().
+
+    Returns: {target: skinCluster}
+    """
+    if sourcePath:
+        # the record outlives the reader, its file is released with it
+        with skinweights.SkinWeightReader(sourcePath) as reader:
+            names = [name for name in reader.names if name.split(':')[-1] == source.split(':')[-1]]
+            if not names:
+                LOG.error('Unable to find mesh data for "{0}" in {1}'.format(source, sourcePath))
+                return {}
+            record = reader.read(names[0])
+        if record.get('delta') or 'points' not in record:
+            LOG.error('Mesh "{0}": Weights need to be exported whole, with storePositions=True'.format(source))
+            return {}
+    else:
+        record = getSourceRecord(source)
+        if record is None:
+            LOG.error('Mesh {} has no skinCluster.'.format(source))
+            return {}
+
+    grid = spatial.UniformGrid(record['points'])
+    bvh = None
+    if mode == skinweights.REMAP_SURFACE:
+        bvh = getTriangleBVH(record['points'], record['triangles'])
+        bvh.grid = grid
+
+    skins = {}
+    for target in targets:
+        if not cmds.objExists(target):
+            LOG.warning('Could not find mesh: "' + target + '", skipping...')
+            continue
+        remapped = skinweights.remapRecord(record, getPoints(target), mode=mode, grid=grid, bvh=bvh,
+                                           cache=TOPOLOGY_CACHE, fingerprint=getTopologyFingerprint(target))
+        if getSkinCluster(target):
+            cmds.delete(getSkinCluster(target))
+        skinCluster = create(target, remapped['infs'], nw=remapped.get('nw', 2), sm=remapped.get('sm', 0),
+                             mi=remapped.get('mi', 4))
+        skins[target] = skinCluster
+        if _applyRecord(skinCluster, remapped, chunkSize=chunkSize, undoable=undoable)[1]:
+            LOG.error('Transfer cancelled, "{0}" is left partially weighted.'.format(target))
+            break
+        LOG.info('Transferred skin weights from {0} to {1}.'.format(source, target))
+    return skins
+
+
+def snapshotSkinWeight(mesh, label=None):
+    """
+    Checkpoint the skin weights of a mesh in memory, e.g. before a risky edit.
+    Weights are read with one bulk call and kept in compact arrays. Every mesh keeps its last
+    skinweights.SNAPSHOT_COUNT snapshots, least recently used meshes are evicted over skinweights.SNAPSHOT_BYTES.
+
+    Args:
+        mesh: Mesh node.
+        label: Optional name of the snapshot, to restore it by name.
+
+    Returns: Number of snapshots of the mesh. None if the mesh has no skinCluster.
+    """
+    skinCluster = getSkinCluster(mesh)
+    if not skinCluster:
+        LOG.warning('Mesh {} has no skinCluster, skipping... '.format(mesh))
+        return None
+    record = getSkinWeights(skinCluster).toRecord()
+    record['skinCluster'] = skinCluster
+    if cmds.getAttr('%s.skinningMethod' % skinCluster) == 2:
+        record['blendWeights'] = getBlendWeights(skinCluster)
+    snapshot = SNAPSHOTS.add(mesh, record, label=label)
+    LOG.info('Snapshot of {0}: {1:.1f} MB, {2:.1f} MB used by all snapshots.'.format(
+        mesh, snapshot.nbytes / 1048576.0, SNAPSHOTS.nbytes / 1048576.0))
+    return len(SNAPSHOTS.snapshots(mesh))
+
+
+def restoreSkinWeight(mesh, which=-1, chunkSize=None, undoable=True):
+    """
+    Restore a snapshot taken with snapshotSkinWeight() in one setWeights() call.
+
+    Args:
+        mesh: Mesh node.
+        which: Snapshot index (-1 for the latest) or label.
+        chunkSize: Number of vertices set per call. None to set every vertex in one call.
+        undoable: True to set the weights with undoable setAttr calls, in one undo step. Slow on dense meshes.
+                  False for batch and scripted callers: bulk API calls, not undoable. See setWeights().
+
+    Returns: True if the snapshot is restored.
+    """
+    skinCluster = getSkinCluster(mesh)
+    if not skinCluster:
+        LOG.error('Mesh {} has no skinCluster.'.format(mesh))
+        return False
+    try:
+        record = SNAPSHOTS.get(mesh, which)
+    except (KeyError, IndexError):
+        LOG.error('Unable to find snapshot {0} of {1}.'.format(which, mesh))
+        return False
+    if len(record['offsets']) - 1 != getVertexCount(skinCluster):
+        LOG.error('Mesh "{0}": Vertex number does not match with the snapshot.'.format(mesh))
+        return False
+
+    # weights on every current influence, so influences added since the snapshot are zeroed
+    skinFn, _ = _getSkinFn(skinCluster)
+    infs = [infDag.partialPathName() for infDag in skinFn.influenceObjects()]
+    for inf in record['infs']:
+        if inf not in infs:
+            LOG.warning('SkinCluster "{0}": Influence "{1}" was removed, its weights are skipped'.format(skinCluster, inf))
+    record.update(skinweights.SkinWeights.fromRecord(record).subset(infs).toRecord())
+    _applyRecord(skinCluster, record, chunkSize=chunkSize, validate=False, undoable=undoable)
+    LOG.info('Restored skin weights of {0}.'.format(mesh))
+    return True
+
+
+def getSnapshotUsage():
+    """
+    Memory used by the skin weight snapshots.
+
+    Returns: {mesh: [(label, time, bytes)]}
+    """
+    usage = dict((mesh, SNAPSHOTS.snapshots(mesh)) for mesh in SNAPSHOTS.meshes())
+    LOG.info('{0} snapshots of {1} meshes, {2:.1f} MB.'.format(
+        sum(len(snapshots) for snapshots in usage.values()), len(usage), SNAPSHOTS.nbytes / 1048576.0))
+    return usage
+
+
+def exportSkinWeight(exportPath, meshes, namespace=False, fileFormat=None, threshold=0.0, chunkSize=None,
+                     storePositions=False, baseline=None, tolerance=skinweights.DELTA_TOLERANCE):
+    """
+    Export skinWeights of a list of meshes to a json or binary file.
+    Weights of each mesh are read with a single MFnSkinCluster.getWeights call, or one call per vertex chunk,
+    and streamed to the file before the next mesh is read.
+    The skinning method and max influences are stored with the weights, plus the per vertex blend weights
+    (one getBlendWeights call) for weighted blend skinClusters.
+
+    Args:
+        exportPath: The file path where the file is saved.
         meshes: A list of mesh nodes.
         namespace: True to export with namespace. False to export without namespace.
+        fileFormat: skinweights.FORMAT_JSON (legacy) or skinweights.FORMAT_BINARY. Guessed from the file extension if not given.
+        threshold: Weights less than or equal to this are not exported.
+        chunkSize: Number of vertices read per getWeights call. None to read a mesh in one call.
+        storePositions: True to store world space vertex positions and triangles, so weights can be remapped
+                        on import when the topology changed.
+        baseline: Optional baseline file path, or list of paths (baseline followed by deltas).
+                  Only the vertices whose weights changed from the baseline are exported.
+        tolerance: Largest weight difference considered unchanged for a delta export.
 
     Returns: True if export succeeds. False if export fails.
     """
-    data = {}
     if not meshes:
         LOG.error('Meshes input {0} is not valid.'.format(meshes))
         return False
 
-    for mesh in meshes:
-        skinCluster = getSkinCluster(mesh)
-        if not skinCluster:
-            LOG.warning('Mesh {} has no skinCluster, skipping... '.format(mesh))
-            continue
-        skinNorm = cmds.getAttr('%s.normalizeWeights' % skinCluster)
+    if baseline:
+        # every file of the chain is parsed once for all meshes
+        try:
+            baseline = skinweights.openChain(baseline)
+        except Exception:
+            LOG.error('Unable to load baseline skinWeight data from {0}.'.format(baseline))
+            return False
 
-        # get the MFnSkinCluster for clusterName
-        selList = om.MSelectionList()
-        selList.add(skinCluster)
-        clusterNode = om.MObject()
-        selList.getDependNode(0, clusterNode)
-        skinFn = oma.MFnSkinCluster(clusterNode)
-
-        # get the MDagPath for all influence
-        infDags = om.MDagPathArray()
-        skinFn.influenceObjects(infDags)
-
-        # {
-        #     "mesh_name": {
-        #         "weights": {
-        #             "vert id": {
-        #                 "influence id": weight,
-        #                 "influence id": weight
-        #             }
-        #         },
-        #         "infs": [inf1, inf2, inf3, inf4, ...],
-        #         "skinCluster": skinCluster_name
-        #     }
-        # }
-
-        infIds = {}
-        infs = []
-        unique = True
-        for i in xrange(infDags.length()):
-            infPath = infDags[i].partialPathName()
-            if '|' in infPath:
-                LOG.warning('Influence of {}: "{}" is not have a unique name.'.format(mesh, infDags[i].fullPathName()))
-                unique = False
-            infId = int(skinFn.indexForInfluenceObject(infDags[i]))
-            infIds[infId] = i
-            infs.append(infPath)
-        if not unique:
-            LOG.warning('{} skincluster export is skipped. Please make sure all influence names are unique'.format(mesh))
-            continue
+    try:
+        writer = skinweights.SkinWeightWriter(exportPath, fileFormat=fileFormat)
+        writer.open()
+    except:
+        LOG.error('Unable to export skinWeight data to {0}.'.format(exportPath))
+        skinweights.closeChain(baseline)
+        return False
 
-        # get the MPlug for the weightList and weights attributes
-        wlPlug = skinFn.findPlug('weightList')
-        wPlug = skinFn.findPlug('weights')
-        wlAttr = wlPlug.attribute()
-        wAttr = wPlug.attribute()
-        wInfIds = om.MIntArray()
-
-        # progressBar visualization
-        total = wlPlug.numElements()
-        progressBar = QtWidgets.QProgressBar()
-        progressBar.setMinimumSize(QtCore.QSize(450, 40))
-        progressBar.setMinimum(1)
-        progressBar.setMaximum(total)
-        progressBar.setWindowTitle('Exporting skincluster: {}'.format(mesh))
-        progressBar.show()
-        completed = 0
+    try:
+        for mesh in meshes:
+            skinCluster = getSkinCluster(mesh)
+            if not skinCluster:
+                LOG.warning('Mesh {} has no skinCluster, skipping... '.format(mesh))
+                continue
+            skinNorm = cmds.getAttr('%s.normalizeWeights' % skinCluster)
+            skinMethod = cmds.getAttr('%s.skinningMethod' % skinCluster)
+            maxInfs = cmds.getAttr('%s.maxInfluences' % skinCluster)
 
-        weights = {}
-        for vId in xrange(wlPlug.numElements()):
-            vWeights = {}
-            # tell the weights attribute which vertex id it represents
-            wPlug.selectAncestorLogicalIndex(vId, wlAttr)
-
-            # get the indice of all non-zero weights for this vert
-            wPlug.getExistingArrayAttributeIndices(wInfIds)
-
-            # create a copy of the current wPlug
-            infPlug = om.MPlug(wPlug)
-
-            completed += 1
-            progressBar.setValue(completed)
-            for infId in wInfIds:
-                # tell the infPlug it represents the current influence id
-                infPlug.selectAncestorLogicalIndex(infId, wAttr)
-
-                # add this influence and its weight to this verts weights
-                try:
-                    vWeights[infIds[infId]] = infPlug.asDouble()
-                except KeyError:
-                    # assumes a removed influence
-                    pass
-            weights[vId] = vWeights
-
-        if namespace:
-            meshName = mesh
-        else:
-            meshName = mesh.split(':')[-1]
+            # {
+            #     "mesh_name": {
+            #         "weights": {
+            #             "vert id": {
+            #                 "influence id": weight,
+            #                 "influence id": weight
+            #             }
+            #         },
+            #         "infs": [inf1, inf2, inf3, inf4, ...],
+            #         "skinCluster": skinCluster_name,
+            #         "nw": normalizeWeights,
+            #         "sm": skinningMethod,
+            #         "mi": maxInfluences,
+            #         "blendWeights": [weight, weight, ...]  (weighted blend skinning only)
+            #     }
+            # }
 
-        data[meshName] = {'weights': weights, 'infs': infs, 'skinCluster': skinCluster, 'nw': skinNorm}
+            infs = []
+            unique = True
+            skinFn, _ = _getSkinFn(skinCluster)
+            for infDag in skinFn.influenceObjects():
+                infPath = infDag.partialPathName()
+                if '|' in infPath:
+                    LOG.warning('Influence of {}: "{}" is not have a unique name.'.format(mesh, infDag.fullPathName()))
+                    unique = False
+                infs.append(infPath)
+            if not unique:
+                LOG.warning('{} skincluster export is skipped. Please make sure all influence names are unique'.format(mesh))
+                continue
 
-    with open(exportPath, 'w') as outfile:
-        try:
-            if data:
-                json.dump(data, outfile, sort_keys=True, indent=4)
-                LOG.info('Exported skin weights for mesh {0}.'.format(meshes))
-                return True
+            weights = skinweights.SkinWeights(*getSparseWeights(skinCluster, threshold=threshold, chunkSize=chunkSize),
+                                              infs=infs)
+
+            if namespace:
+                meshName = mesh
             else:
-                LOG.info('No valid skinCluster is found for mesh {0}.'.format(meshes))
+                meshName = mesh.split(':')[-1]
+
+            record = weights.toRecord()
+            record.update({'skinCluster': skinCluster, 'nw': skinNorm, 'sm': skinMethod, 'mi': maxInfs})
+            if skinMethod == 2:
+                record['blendWeights'] = getBlendWeights(skinCluster)
+            if storePositions:
+                record['points'] = getPoints(mesh).astype(np.float32)
+                record['triangles'] = getTriangles(mesh)
+            if baseline:
+                base = skinweights.resolveRecord(baseline, meshName)
+                if base is None:
+                    LOG.info('Mesh "{0}" is not in the baseline, exporting all weights.'.format(meshName))
+                else:
+                    record = skinweights.deltaRecord(base, record, tolerance=tolerance)
+                    if record.get('delta'):
+                        LOG.info('Mesh "{0}": {1} vertices changed from the baseline.'.format(meshName, len(record['rows'])))
+                    else:
+                        LOG.warning('Mesh "{0}": Vertex number does not match with the baseline, exporting all weights.'.format(meshName))
+            # serialize right away so only one mesh is held in memory
+            try:
+                writer.write(meshName, record)
+            except:
+                LOG.error('Unable to export skinWeight data to {0}.'.format(exportPath))
+                writer.close()
                 return False
-        except:
-            LOG.error('Unable to export skinWeight data to {0}.'.format(exportPath))
+            del record, weights
+
+        writer.close()
+        if not writer.names:
+            LOG.info('No valid skinCluster is found for mesh {0}.'.format(meshes))
             return False
+        LOG.info('Exported skin weights for mesh {0}.'.format(meshes))
+        return True
+    finally:
+        skinweights.closeChain(baseline)
+
+
+def resolveSkinWeightNames(reader, meshes, namespace=False, meshMap=None, infMap=None, rules=None):
+    """
+    Resolve the meshes and influences of a skin weight file against the scene, in one pass.
+    Names are hashed once, then matched exactly, by short name, without namespace and by rules.
+    Influences are resolved per mesh: a name matching several nodes takes the one in the namespace, or else the
+    hierarchy, of the mesh. Names still matching several nodes are left unresolved unless a remap table settles them.
+    See naming.NameIndex.
+
+    Args:
+        reader: skinweights.SkinWeightReader of the file.
+        meshes: A list of mesh nodes. If [], every mesh of the file found in the scene.
+        namespace: True to only match names with their namespace.
+        meshMap: Optional {scene mesh: mesh name in the file} remap table.
+        infMap: Optional {influence name in the file: scene node} remap table.
+        rules: Optional list of (regex pattern, replacement) applied to names on both sides before matching.
+
+    Returns: Dict:
+        meshes: [(scene mesh, mesh name in the file)]
+        influences: {scene mesh: {influence name in the file: scene node}}
+        unresolvedMeshes: Meshes without a single match.
+        unresolvedInfluences: {scene mesh: [influence names without a single match]}
+        ambiguous: {name: [candidates]} for the unresolved names matching several nodes.
+    """
+    if not meshes:
+        meshes = cmds.ls(reader.names)
+    meshIndex = naming.NameIndex(reader.names, rules=rules, namespace=namespace)
+    meshNames, unresolvedMeshes, ambiguous = meshIndex.resolveAll(meshes, table=meshMap)
+
+    pairs = [(mesh, meshNames[mesh]) for mesh in meshes if mesh in meshNames]
+    infIndex = naming.NameIndex(cmds.ls(type='transform', long=True), rules=rules, namespace=namespace)
+    infNames, unresolvedInfs = {}, {}
+    for mesh, dataName in pairs:
+        if dataName not in reader.names:
+            continue
+        near = (cmds.ls(mesh, long=True) or [mesh])[0]
+        resolved, unresolved, ambiguousInfs = infIndex.resolveAll(reader.info(dataName)['infs'], table=infMap,
+                                                                  near=near)
+        infNames[mesh] = resolved
+        unresolvedInfs[mesh] = unresolved
+        ambiguous.update(ambiguousInfs)
 
+    # full paths back to the shortest unique names
+    nodes = sorted(set(node for resolved in infNames.values() for node in resolved.values()))
+    shortNames = dict((node, (cmds.ls(node) or [node])[0]) for node in nodes)
+    for resolved in infNames.values():
+        for name, node in resolved.items():
+            resolved[name] = shortNames.get(node, node)
 
-def importSkinWeight(importPath, meshes, namespace=False):
+    return {'meshes': pairs,
+            'influences': infNames,
+            'unresolvedMeshes': unresolvedMeshes,
+            'unresolvedInfluences': unresolvedInfs,
+            'ambiguous': ambiguous}
+
+
+def importSkinWeight(importPath, meshes, namespace=False, remap=None, baseline=None, chunkSize=None, validate=True,
+                     meshMap=None, infMap=None, rules=None, undoable=True):
     """
-    Import skinWeight from a json file, to a list of meshes.
+    Import skinWeight from a json or binary file, to a list of meshes.
     To a whole mesh, or selected vertices.
+    Weights of each mesh are applied with a single setWeights() call, or one call per vertex chunk.
+    The import is one undo step by default, pass undoable=False for the fast bulk API calls in batch scripts.
+    Skinning method, max influences and blend weights are restored when stored in the file.
+    Binary files are indexed, so only the weights of the requested meshes are loaded.
 
     Args:
-        filepath: The file path where a json file is loaded.
+        filepath: The file path where the file is loaded. The format is detected from the file header.
         meshes: A list of mesh nodes. If [], import all available meshes.
         namespace: True to respect imported namespace data. False to ignore any namespaces.
+        remap: None to apply weights by vertex id.
+               skinweights.REMAP_CLOSEST, REMAP_BARYCENTRIC or REMAP_SURFACE to remap weights by vertex position,
+               for data exported with storePositions=True. The vertex correspondence is cached per topology
+               and vertex positions.
+        baseline: Baseline file path, or list of paths (baseline followed by deltas), for delta files.
+        chunkSize: Number of vertices set per call. None to set a mesh in one call.
+                   With binary files, weights are paged in from the file one chunk at a time, so peak memory
+                   stays bounded for multi-million vertex meshes.
+        validate: True to drop NaN, negative and out of range weights and renormalize the weights of every
+                  vertex (per the skinCluster normalization mode) before anything is set.
+        meshMap: Optional {scene mesh: mesh name in the file} remap table.
+        infMap: Optional {influence name in the file: scene node} remap table.
+        rules: Optional list of (regex pattern, replacement) applied to mesh and influence names before matching,
+               e.g. [(r'_v\d+$', '')]. See resolveSkinWeightNames().
+        undoable: True to set the weights with undoable setAttr calls, in one undo step. Slow on dense meshes.
+                  False for batch and scripted callers: bulk API calls, not undoable. See setWeights().
 
     Returns: True if import succeeds. False if import fails.
     """
 
-    with open(importPath) as infile:
+    try:
+        reader = skinweights.SkinWeightReader(importPath)
+        LOG.info('Loaded skinWeight data from {0}.'.format(importPath))
+    except:
+        LOG.error('Unable to load skinWeight data from {0}.'.format(importPath))
+        return False
+    if baseline:
+        # every file of the chain is parsed once for all meshes
         try:
-            data = json.load(infile)
-            LOG.info('Loaded skinWeight data from {0}.'.format(importPath))
-        except:
-            LOG.error('Unable to load skinWeight data from {0}.'.format(importPath))
+            baseline = skinweights.openChain(baseline)
+        except Exception:
+            LOG.error('Unable to load baseline skinWeight data from {0}.'.format(baseline))
+            reader.close()
             return False
 
-    if not meshes:
-        meshes = data.keys()
-
-    for mesh in meshes:
-        selectedIndice = []
-        selectedVerts = [v.split('.vtx')[-1] for v in cmds.ls(sl=1, fl=1) if (('.vtx' in v) and (mesh in v))]
-        for v in selectedVerts:
-            id = re.findall('\\d+', v)[0]
-            selectedIndice.append(id)
-
-        if namespace:
-            if not (mesh in data):
-                LOG.warning('Unable to find mesh data for "{0}"'.format(mesh))
-                continue
-            meshName = mesh
-        else:
-            shortName = mesh.split(':')[-1]
-            meshName = ''
-            for m in data.keys():
-                if m.split(':')[-1] == shortName:
-                    meshName = m
-            if not meshName:
-                LOG.warning('Unable to find mesh data for "{0}"'.format(shortName))
-                continue
+    try:
+        # every name is resolved before anything is imported
+        names = resolveSkinWeightNames(reader, meshes, namespace=namespace, meshMap=meshMap, infMap=infMap, rules=rules)
+        for mesh in names['unresolvedMeshes']:
+            LOG.warning('Unable to find mesh data for "{0}"'.format(mesh))
+        for mesh, unresolved in sorted(names['unresolvedInfluences'].items()):
+            if unresolved:
+                LOG.warning('Mesh "{0}": Unable to find influences: {1}'.format(mesh, ', '.join(unresolved)))
+        for name, candidates in sorted(names['ambiguous'].items()):
+            LOG.warning('"{0}" matches {1}, left unresolved'.format(name, ', '.join(candidates)))
+        proxies = {}
+        selection = getSelectedVertices()
 
-        # if mesh is not in current scene, skip
-        if not cmds.objExists(meshName):
-            continue
+        # one undo step for the whole import
+        with _undoChunk(undoable):
+            for mesh, meshName in names['meshes']:
+                # if mesh is not in current scene, skip
+                if not cmds.objExists(mesh):
+                    continue
+                influences = names['influences'].get(mesh, {})
+                unresolvedInfs = set(names['unresolvedInfluences'].get(mesh, ()))
+                selectedIndice = None
+                if selection:
+                    selectedIndice = selection.get(cmds.ls(mesh, long=True)[0])
 
-        weights = data[meshName]['weights']
-        infs = data[meshName]['infs']
-        skinClusterName = data[meshName]['skinCluster']
-        skinNorm = data[meshName]['nw']
-
-        if cmds.polyEvaluate(mesh, v=1) != len(weights.keys()):
-            LOG.warning('Mesh "{0}": Vertex number does not match with the imported skinCluster "{1}"'.format(
-                mesh, skinClusterName))
-
-        # progressBar visualization
-        total = len(weights.items())
-        progressBar = QtWidgets.QProgressBar()
-        progressBar.setMinimumSize(QtCore.QSize(450, 40))
-        progressBar.setMinimum(1)
-        progressBar.setMaximum(total)
-        progressBar.setWindowTitle('Importing skincluster: {}'.format(mesh))
-        progressBar.show()
-        completed = 0
+                # only the requested mesh is loaded from the file
+                record = reader.read(meshName)
+                if record.get('delta'):
+                    base = skinweights.resolveRecord(baseline, meshName) if baseline else None
+                    if base is None:
+                        LOG.error('Mesh "{0}": Weights are a delta, unable to find its baseline'.format(meshName))
+                        continue
+                    try:
+                        record = skinweights.applyDelta(base, record)
+                    except ValueError as e:
+                        LOG.error('Mesh "{0}": {1}'.format(meshName, e))
+                        continue
+                infs = list(record['infs'])
+                skinClusterName = record['skinCluster']
+                skinNorm = record['nw']
+                meshVertexCount = cmds.polyEvaluate(mesh, v=1)
 
-        # vertices selection
-        if selectedIndice:
-            # get skinCluster
-            currentName = getSkinCluster(mesh)
-            # check if skinCluster exists
-            if not currentName:
-                LOG.error('Mesh "{0}": SkinCluster missing selected vertices'.format(mesh))
-                return False
-            # check the name of skinCluster
-            elif currentName != skinClusterName:
-                LOG.warning('SkinCluster "{0}": Name does not match with the imported skinCluster "{1}"'.format(currentName, skinClusterName))
-
-            # check the number of influences
-            currentInfs = cmds.skinCluster(currentName, q=1, inf=1)
-            if len(currentInfs) != len(infs):
-                LOG.warning('SkinCluster "{0}": Influence number does not match with the imported skinCluster "{1}"'.format(currentName, skinClusterName))
-
-            # unlock influences used by skincluster
-            for inf in infs:
-                if not cmds.objExists(inf):
-                    LOG.warning('Unable to find influence "{0}"]'.format(inf))
-                    continue
-                cmds.setAttr('%s.liw' % inf, 0)
+                if remap:
+                    if 'points' in record:
+                        record = skinweights.remapRecord(record, getPoints(mesh), mode=remap, cache=TOPOLOGY_CACHE,
+                                                         fingerprint=getTopologyFingerprint(mesh))
+                    else:
+                        LOG.warning('Mesh "{0}": No vertex positions stored, unable to remap weights'.format(mesh))
+                vertexCount = len(record['offsets']) - 1
+
+                if meshVertexCount != vertexCount:
+                    LOG.warning('Mesh "{0}": Vertex number does not match with the imported skinCluster "{1}"'.format(
+                        mesh, skinClusterName))
+
+                # vertices selection
+                if selectedIndice is not None and len(selectedIndice):
+                    # get skinCluster
+                    currentName = getSkinCluster(mesh)
+                    # check if skinCluster exists
+                    if not currentName:
+                        LOG.error('Mesh "{0}": SkinCluster missing selected vertices'.format(mesh))
+                        return False
+                    # check the name of skinCluster
+                    elif currentName != skinClusterName:
+                        LOG.warning('SkinCluster "{0}": Name does not match with the imported skinCluster "{1}"'.format(currentName, skinClusterName))
+
+                    # check the number of influences
+                    currentInfs = cmds.skinCluster(currentName, q=1, inf=1)
+                    if len(currentInfs) != len(record['infs']):
+                        LOG.warning('SkinCluster "{0}": Influence number does not match with the imported skinCluster "{1}"'.format(currentName, skinClusterName))
+
+                    # unlock influences used by skincluster, unresolved ones were reported up front
+                    weights = skinweights.SkinWeights.fromRecord(record).rename(influences)
+                    for inf, dataInf in zip(weights.infs, infs):
+                        if dataInf not in unresolvedInfs:
+                            cmds.setAttr('%s.liw' % inf, 0)
+                    # file influences resolved to the same node are summed on it
+                    record.update(weights.mergeDuplicates().toRecord())
 
-            for vertId in selectedIndice:
-                if not (vertId in weights):
-                    LOG.info('Unable to find weight data for {0}.vtx[{1}]'.format(mesh, vertId))
+                    vertexIds = selectedIndice
+                    missing = vertexIds[vertexIds >= vertexCount]
+                    if len(missing):
+                        LOG.info('Unable to find weight data for {0}.vtx{1}'.format(mesh, missing.tolist()))
+                    _, cancelled, _ = _applyRecord(currentName, record, vertexIds=vertexIds[vertexIds < vertexCount],
+                                                   chunkSize=chunkSize, validate=validate, undoable=undoable)
+                    if cancelled:
+                        LOG.error('Import cancelled, selected vertices of "{0}" are left partially weighted.'.format(
+                            mesh))
+                        return False
                     continue
-                    # TODO
-                    # deal with vertices with missing weight data: missing data for vertId
-                    # currently acting awkward
-                weightData = weights[vertId]
-                wlAttr = '%s.weightList[%s]' % (currentName, vertId)
-                completed += 1
-                progressBar.setValue(completed)
-                for infId, infValue in weightData.items():
-                    wAttr = '.weights[%s]' % infId
-                    cmds.setAttr(wlAttr + wAttr, infValue)
-            return True
-
-        # get skinCluster
-        if getSkinCluster(mesh):
-            cmds.delete(getSkinCluster(mesh))
-        create(mesh, infs, name=skinClusterName, nw=skinNorm)
 
-        # normalize needs turned off for the prune to work
-        if skinNorm != 0:
-            cmds.setAttr('%s.normalizeWeights' % skinClusterName, 0)
-        cmds.skinPercent(skinClusterName, mesh, nrm=False, prw=100)
+                # proxies for unresolved influences, shared by every mesh of the import
+                newProxies = [inf for inf in infs if inf in unresolvedInfs and inf not in proxies]
+                proxies.update(createProxyInfluences(newProxies, force=True))
+                mapping = dict((inf, proxies[inf]) for inf in unresolvedInfs if inf in proxies)
+                mapping.update(influences)
+                # file influences resolved to the same node are summed on it, so it is bound once
+                record.update(skinweights.SkinWeights.fromRecord(record).rename(mapping).mergeDuplicates().toRecord())
 
-        # restore normalize setting
-        cmds.setAttr('%s.normalizeWeights' % skinClusterName, skinNorm)
-
-        # apply weights
-        for vertId, weightData in weights.items():
-            wlAttr = '%s.weightList[%s]' % (skinClusterName, vertId)
-            completed += 1
-            progressBar.setValue(completed)
-            for infId, infValue in weightData.items():
-                wAttr = '.weights[%s]' % infId
-                cmds.setAttr(wlAttr + wAttr, infValue)
-
-    return True
\ No newline at end of file
+                # get skinCluster
+                if getSkinCluster(mesh):
+                    cmds.delete(getSkinCluster(mesh))
+                skinClusterName = create(mesh, record['infs'], name=skinClusterName, proxyJnts=False, nw=skinNorm,
+                                         sm=record.get('sm', 0), mi=record.get('mi', 4))
+
+                # apply weights
+                vertexIds = None
+                if meshVertexCount < vertexCount:
+                    vertexIds = np.arange(meshVertexCount)
+                _, cancelled, _ = _applyRecord(skinClusterName, record, vertexIds=vertexIds, chunkSize=chunkSize,
+                                               validate=validate, undoable=undoable)
+                if cancelled:
+                    LOG.error('Import cancelled, "{0}" is left partially weighted, remaining meshes are skipped.'
+                              .format(mesh))
+                    return False
+
+        return True
+    finally:
+        reader.close()
+        skinweights.closeChain(baseline)
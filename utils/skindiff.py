@@ -0,0 +1,208 @@
+"""
+Compare skin weight files without Maya.
+
+Library:
+    import skindiff
+    reports = skindiff.diffFiles('v001.json', 'v002.skw', top=20)
+
+Command line:
+    python skindiff.py v001.json v002.skw --top 20 --mesh body
+"""
+import sys
+import json
+import argparse
+import numpy as np
+import log
+import skinweights
+
+LOG = log.get_logger(__name__)
+# CONSTANTS
+TOP = 20
+CHANGE_TOLERANCE = 1e-4
+
+
+def _alignedKeys(record, infs):
+    """
+    Flat (vertex, influence) keys of a record on a shared influence list.
+
+    Args:
+        record: Record dict holding CSR arrays.
+        infs: Shared influence names.
+
+    Returns: (keys, values)
+    """
+    cols = skinweights.alignInfluences(record['indices'], record['infs'], infs)
+    rows = np.repeat(np.arange(len(record['offsets']) - 1), np.diff(np.asarray(record['offsets'], dtype=np.int64)))
+    return rows * len(infs) + cols, np.asarray(record['values'], dtype=np.float64)
+
+
+def _coverage(record, infs):
+    """
+    Per influence number of weighted vertices and sum of weights.
+    """
+    cols = skinweights.alignInfluences(record['indices'], record['infs'], infs)
+    values = np.asarray(record['values'], dtype=np.float64)
+    nonZero = values > 0
+    return (np.bincount(cols[nonZero], minlength=len(infs)),
+            np.bincount(cols, weights=values, minlength=len(infs)))
+
+
+def diffRecords(a, b, top=TOP, tolerance=CHANGE_TOLERANCE):
+    """
+    Compare the weights of two records of the same mesh. Influences are matched by name.
+
+    Args:
+        a: Old record.
+        b: New record.
+        top: Number of most changed vertices to report.
+        tolerance: L1 difference above which a vertex counts as changed.
+
+    Returns: Report dict:
+        vertexCount, changed (number of vertices), meanL1, maxL1,
+        l1 / max (per vertex numpy arrays),
+        top: [(vertex id, l1, max)],
+        influences: {name: {'verticesA', 'verticesB', 'sumA', 'sumB'}}, only influences whose coverage changed,
+        added / removed: influence names only in b / only in a.
+    """
+    vertexCount = len(a['offsets']) - 1
+    if len(b['offsets']) - 1 != vertexCount:
+        raise ValueError('Vertex count differs: {} vs {}.'.format(vertexCount, len(b['offsets']) - 1))
+
+    infs = list(a['infs']) + [inf for inf in b['infs'] if inf not in set(a['infs'])]
+    keysA, valuesA = _alignedKeys(a, infs)
+    keysB, valuesB = _alignedKeys(b, infs)
+
+    # signed difference per (vertex, influence)
+    keys, inverse = np.unique(np.concatenate([keysA, keysB]), return_inverse=True)
+    diffs = np.abs(np.bincount(inverse, weights=np.concatenate([-valuesA, valuesB])))
+    rows = keys // len(infs)
+    l1 = np.bincount(rows, weights=diffs, minlength=vertexCount)
+    maxDiff = np.zeros(vertexCount)
+    if len(rows):
+        # keys are sorted, so every vertex is a contiguous run
+        starts = np.flatnonzero(np.r_[True, rows[1:] != rows[:-1]])
+        maxDiff[rows[starts]] = np.maximum.reduceat(diffs, starts)
+
+    order = np.argsort(-l1, kind='mergesort')[:top]
+    topVerts = [(int(v), float(l1[v]), float(maxDiff[v])) for v in order if l1[v] > tolerance]
+
+    countA, sumA = _coverage(a, infs)
+    countB, sumB = _coverage(b, infs)
+    influences = {}
+    for i in np.flatnonzero((countA != countB) | (np.abs(sumA - sumB) > tolerance)):
+        influences[infs[i]] = {'verticesA': int(countA[i]), 'verticesB': int(countB[i]),
+                               'sumA': float(sumA[i]), 'sumB': float(sumB[i])}
+
+    return {'vertexCount': vertexCount,
+            'changed': int(np.count_nonzero(l1 > tolerance)),
+            'meanL1': float(l1.mean()) if vertexCount else 0.0,
+            'maxL1': float(l1.max()) if vertexCount else 0.0,
+            'l1': l1,
+            'max': maxDiff,
+            'top': topVerts,
+            'influences': influences,
+            'added': [inf for inf in b['infs'] if inf not in set(a['infs'])],
+            'removed': [inf for inf in a['infs'] if inf not in set(b['infs'])]}
+
+
+def diffFiles(pathA, pathB, meshes=None, top=TOP, tolerance=CHANGE_TOLERANCE):
+    """
+    Compare two skin weight files of any supported format.
+
+    Args:
+        pathA: Old file.
+        pathB: New file.
+        meshes: Optional list of mesh names to compare. Defaults to every mesh of both files.
+        top: Number of most changed vertices to report per mesh.
+        tolerance: L1 difference above which a vertex counts as changed.
+
+    Returns: {mesh: report}. See diffRecords(). Meshes missing from a file, or that can't be compared,
+             report {'error': message}.
+    """
+    with skinweights.SkinWeightReader(pathA) as readerA, skinweights.SkinWeightReader(pathB) as readerB:
+        if meshes is None:
+            meshes = readerA.names + [name for name in readerB.names if name not in set(readerA.names)]
+
+        reports = {}
+        for name in meshes:
+            if name not in readerA.names:
+                reports[name] = {'error': 'Only in {}'.format(pathB)}
+                continue
+            if name not in readerB.names:
+                reports[name] = {'error': 'Only in {}'.format(pathA)}
+                continue
+            a, b = readerA.read(name), readerB.read(name)
+            if a.get('delta') or b.get('delta'):
+                reports[name] = {'error': 'Delta records can not be compared without their baseline'}
+                continue
+            try:
+                reports[name] = diffRecords(a, b, top=top, tolerance=tolerance)
+            except ValueError as e:
+                reports[name] = {'error': str(e)}
+    return reports
+
+
+def formatReport(reports):
+    """
+    Format diffFiles() reports as text.
+
+    Args:
+        reports: {mesh: report}
+
+    Returns: Multi line string.
+    """
+    lines = []
+    for name in sorted(reports):
+        report = reports[name]
+        lines.append('{}:'.format(name))
+        if 'error' in report:
+            lines.append('    {}'.format(report['error']))
+            continue
+        lines.append('    {} / {} vertices changed, mean L1 {:.6f}, max L1 {:.6f}'.format(
+            report['changed'], report['vertexCount'], report['meanL1'], report['maxL1']))
+        for inf in report['added']:
+            lines.append('    + {}'.format(inf))
+        for inf in report['removed']:
+            lines.append('    - {}'.format(inf))
+        if report['influences']:
+            lines.append('    influence coverage (vertices, weight sum):')
+            for inf in sorted(report['influences']):
+                info = report['influences'][inf]
+                lines.append('        {}: {} -> {}, {:.4f} -> {:.4f}'.format(
+                    inf, info['verticesA'], info['verticesB'], info['sumA'], info['sumB']))
+        if report['top']:
+            lines.append('    most changed vertices (id, L1, max):')
+            for vertId, l1, maxDiff in report['top']:
+                lines.append('        {}: {:.6f} {:.6f}'.format(vertId, l1, maxDiff))
+    return '\n'.join(lines)
+
+
+def _jsonReport(reports):
+    """
+    Drop the per vertex arrays so reports can be saved as json.
+    """
+    return dict((name, dict((k, v) for k, v in report.items() if k not in ('l1', 'max')))
+                for name, report in reports.items())
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Compare two skin weight files.')
+    parser.add_argument('old', help='Old skin weight file (json or binary).')
+    parser.add_argument('new', help='New skin weight file (json or binary).')
+    parser.add_argument('--mesh', action='append', dest='meshes', help='Mesh to compare. Can be repeated.')
+    parser.add_argument('--top', type=int, default=TOP, help='Number of most changed vertices to list.')
+    parser.add_argument('--tolerance', type=float, default=CHANGE_TOLERANCE, help='L1 change tolerance.')
+    parser.add_argument('--json', dest='jsonPath', help='Also write the report to a json file.')
+    args = parser.parse_args(args)
+
+    reports = diffFiles(args.old, args.new, meshes=args.meshes, top=args.top, tolerance=args.tolerance)
+    print(formatReport(reports))
+    if args.jsonPath:
+        with open(args.jsonPath, 'w') as outfile:
+            json.dump(_jsonReport(reports), outfile, sort_keys=True, indent=4)
+    changed = any(report.get('changed') or 'error' in report for report in reports.values())
+    return 1 if changed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
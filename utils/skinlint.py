@@ -0,0 +1,517 @@
+"""
+Check and convert skin weight files without Maya.
+
+Files are processed in parallel by a pool of worker processes, so whole asset trees can be linted or
+converted at once.
+
+Library:
+    import skinlint
+    reports = skinlint.lintFiles(['assets/chars'], workers=8)
+    print(skinlint.formatReport(reports))
+    results = skinlint.convertFiles(['assets/chars'], skinlint.skinweights.FORMAT_BINARY, outputDir='out')
+
+Command line:
+    python skinlint.py lint assets/chars --workers 8 --json lint.json
+    python skinlint.py convert assets/chars --format binary --output out
+"""
+import os
+import sys
+import json
+import time
+import numbers
+import argparse
+import multiprocessing
+import numpy as np
+import log
+import skinweights
+
+LOG = log.get_logger(__name__)
+# CONSTANTS
+JSON_EXT = '.json'
+EXTENSIONS = (JSON_EXT, skinweights.BINARY_EXT)
+SAMPLE = 10
+STRING_TYPES = (str, type(u''))
+ERROR_KEYS = ('nonFinite', 'negative', 'badIndices', 'duplicateWeights', 'badBlendWeights')
+WARNING_KEYS = ('emptyVertices', 'unnormalizedVertices', 'overMaxInfluences')
+
+
+def findFiles(paths, extensions=EXTENSIONS):
+    """
+    Collect skin weight files from files and directory trees.
+
+    Args:
+        paths: File or directory paths. Directories are walked recursively.
+        extensions: File extensions picked up in directories.
+
+    Returns: Sorted list of file paths.
+    """
+    files = set()
+    for path in paths:
+        if os.path.isfile(path):
+            files.add(path)
+            continue
+        for root, dirs, names in os.walk(path):
+            for name in names:
+                if name.lower().endswith(extensions):
+                    files.add(os.path.join(root, name))
+    return sorted(files)
+
+
+def _isInt(value):
+    try:
+        return int(value) >= 0
+    except (TypeError, ValueError):
+        return False
+
+
+def checkLegacyStructure(meshData):
+    """
+    Check the structure of one mesh entry of a legacy json file, before it is converted.
+
+    Args:
+        meshData: {'weights': {vertId: {infId: weight}}, 'infs': [], 'skinCluster': '', 'nw': 0}
+
+    Returns: List of error strings. Empty if the entry can be converted.
+    """
+    if not isinstance(meshData, dict):
+        return ['Mesh entry is not a dict']
+    errors = []
+    for key, kind in (('weights', dict), ('infs', list)):
+        if key not in meshData:
+            errors.append('Missing "{}"'.format(key))
+        elif not isinstance(meshData[key], kind):
+            errors.append('"{}" is not a {}'.format(key, kind.__name__))
+    if errors:
+        return errors
+
+    badVerts, badRows, badInfs, badValues = [], 0, 0, 0
+    for vertId, vWeights in meshData['weights'].items():
+        if not _isInt(vertId):
+            badVerts.append(vertId)
+        if not isinstance(vWeights, dict):
+            badRows += 1
+            continue
+        for infId, weight in vWeights.items():
+            if not _isInt(infId):
+                badInfs += 1
+            if isinstance(weight, bool) or not isinstance(weight, numbers.Number):
+                badValues += 1
+    if badVerts:
+        errors.append('{} invalid vertex ids, e.g. {}'.format(len(badVerts), json.dumps(badVerts[0])))
+    for count, label in ((badRows, 'vertices whose weights are not a dict'),
+                         (badInfs, 'invalid influence ids'),
+                         (badValues, 'weights that are not numbers')):
+        if count:
+            errors.append('{} {}'.format(count, label))
+    return errors
+
+
+def checkRecordStructure(record):
+    """
+    Check the arrays of a record are consistent with each other.
+
+    Args:
+        record: Record dict holding CSR arrays.
+
+    Returns: List of error strings. Empty if the record is well formed.
+    """
+    missing = [key for key in skinweights.CSR_KEYS + ('infs',) if key not in record]
+    if missing:
+        return ['Missing {}'.format(', '.join(missing))]
+    errors = []
+    offsets = np.asarray(record['offsets'])
+    if offsets.ndim != 1 or not len(offsets) or offsets[0] != 0 or np.any(np.diff(offsets) < 0):
+        return ['Invalid vertex offsets']
+    if not (offsets[-1] == len(record['indices']) == len(record['values'])):
+        return ['Vertex offsets, influence indices and values lengths differ']
+    vertexCount = len(offsets) - 1
+
+    infs = record['infs']
+    if not all(isinstance(inf, STRING_TYPES) for inf in infs):
+        errors.append('Influence names are not all strings')
+    elif len(set(infs)) != len(infs):
+        duplicates = sorted(set(inf for inf in infs if infs.count(inf) > 1))
+        errors.append('Duplicate influences: {}'.format(', '.join(duplicates)))
+
+    for key in skinweights.VERTEX_KEYS:
+        if key in record and len(record[key]) != vertexCount:
+            errors.append('{} {} for {} vertices'.format(len(record[key]), key, vertexCount))
+    if 'points' in record and np.shape(record['points']) != (vertexCount, 3):
+        errors.append('Points shape {} for {} vertices'.format(np.shape(record['points']), vertexCount))
+    if record.get('delta'):
+        rows = np.asarray(record.get('rows', []))
+        if len(rows) != vertexCount:
+            errors.append('{} delta rows for {} vertices'.format(len(rows), vertexCount))
+        elif len(rows) and (np.any(np.diff(rows) <= 0) or rows[0] < 0 or rows[-1] >= record.get('vertexCount', 0)):
+            errors.append('Delta rows are not sorted, unique vertex ids')
+    return errors
+
+
+def lintRecord(record, tolerance=skinweights.SUM_TOLERANCE):
+    """
+    Check the weights of a well formed record and gather per influence statistics.
+
+    Args:
+        record: Record dict holding CSR arrays. See checkRecordStructure().
+        tolerance: Largest difference of a vertex weight sum from 1 considered normalized.
+
+    Returns: Report dict:
+        vertices, weights, maxInfluences (largest number of weights on a vertex),
+        nonFinite, negative, badIndices, duplicateWeights, badBlendWeights: number of invalid weights,
+        emptyVertices, unnormalizedVertices, overMaxInfluences: number of vertices, with a sample of
+        their ids in <key>Sample,
+        unused: names of influences without weights,
+        influences: {name: {'vertices', 'sum', 'max'}}
+    """
+    offsets = np.asarray(record['offsets'], dtype=np.int64)
+    indices = np.asarray(record['indices'], dtype=np.int64)
+    infs = record['infs']
+    rows = record.get('rows') if record.get('delta') else None
+    (_, validIndices, validValues), validation = skinweights.validateWeights(
+        offsets, indices, record['values'], len(infs), nw=0, tolerance=tolerance, rows=rows)
+
+    counts = np.diff(offsets)
+    report = {'vertices': validation['vertices'],
+              'weights': int(len(indices)),
+              'maxInfluences': int(counts.max()) if len(counts) else 0}
+    for key in ('nonFinite', 'negative', 'badIndices'):
+        report[key] = validation[key]
+
+    # the same influence stored twice on a vertex
+    rowIds = np.repeat(np.arange(len(counts)), counts)
+    keys = rowIds * max(len(infs), int(indices.max()) + 1 if len(indices) else 1) + indices
+    report['duplicateWeights'] = int(len(keys) - len(np.unique(keys)))
+
+    vertIds = np.arange(len(counts)) if rows is None else np.asarray(rows, dtype=np.int64)
+    vertices = {'emptyVertices': validation['emptyVertices'],
+                'unnormalizedVertices': validation['unnormalizedVertices'] if record.get('nw', 1) else [],
+                'overMaxInfluences': vertIds[counts > record['mi']] if record.get('mi') else []}
+    for key, ids in vertices.items():
+        report[key] = int(len(ids))
+        report[key + 'Sample'] = [int(v) for v in ids[:SAMPLE]]
+
+    report['badBlendWeights'] = 0
+    if 'blendWeights' in record:
+        blendWeights = np.asarray(record['blendWeights'], dtype=np.float64)
+        with np.errstate(invalid='ignore'):
+            report['badBlendWeights'] = int(np.count_nonzero(~((blendWeights >= 0) & (blendWeights <= 1))))
+
+    validIndices = validIndices.astype(np.int64)
+    validValues = validValues.astype(np.float64)
+    nonZero = validValues > 0
+    infVerts = np.bincount(validIndices[nonZero], minlength=len(infs))
+    infSums = np.bincount(validIndices, weights=validValues, minlength=len(infs))
+    infMaxs = np.zeros(len(infs))
+    np.maximum.at(infMaxs, validIndices, validValues)
+    report['influences'] = dict((inf, {'vertices': int(infVerts[i]), 'sum': float(infSums[i]),
+                                       'max': float(infMaxs[i])}) for i, inf in enumerate(infs))
+    report['unused'] = [inf for i, inf in enumerate(infs) if not infVerts[i]]
+    return report
+
+
+def _meshes(path):
+    """
+    Iterate the meshes of a skin weight file, checking the structure of each entry first.
+
+    Args:
+        path: Skin weight file path.
+
+    Returns: Generator of (name, record or None, structure errors).
+    """
+    if skinweights.detectFormat(path) == skinweights.FORMAT_BINARY:
+        with skinweights.SkinWeightReader(path) as reader:
+            for name in reader.names:
+                try:
+                    record = reader.read(name)
+                except (ValueError, KeyError, TypeError) as e:
+                    yield name, None, ['Unable to read block: {}'.format(e)]
+                    continue
+                yield name, record, []
+        return
+
+    with open(path) as infile:
+        data = json.load(infile)
+    if not isinstance(data, dict):
+        raise ValueError('Top level is not a {mesh: data} dict')
+    for name in sorted(data):
+        errors = checkLegacyStructure(data[name])
+        if errors:
+            yield name, None, errors
+            continue
+        yield name, skinweights.recordFromLegacy(data[name]), []
+
+
+def lintFile(path, tolerance=skinweights.SUM_TOLERANCE):
+    """
+    Lint every mesh of a skin weight file.
+
+    Args:
+        path: Skin weight file path, json or binary.
+        tolerance: Largest difference of a vertex weight sum from 1 considered normalized.
+
+    Returns: {'path', 'format', 'bytes', 'meshes': {name: report}, 'errors': [file level errors]}
+             Mesh reports are lintRecord() reports, plus 'errors': [structure errors].
+    """
+    result = {'path': path, 'format': None, 'bytes': 0, 'meshes': {}, 'errors': []}
+    try:
+        result['bytes'] = os.path.getsize(path)
+        result['format'] = skinweights.detectFormat(path)
+        for name, record, errors in _meshes(path):
+            if not errors:
+                errors = checkRecordStructure(record)
+            report = {'errors': errors}
+            if not errors:
+                report.update(lintRecord(record, tolerance=tolerance))
+            result['meshes'][name] = report
+    except Exception as e:
+        result['errors'].append('{}: {}'.format(e.__class__.__name__, e))
+    return result
+
+
+def outputPath(path, fileFormat, root=None, outputDir=None):
+    """
+    Path a file converts to: the same name with the extension of the format, next to the source or
+    at the same place relative to root in outputDir.
+
+    Args:
+        path: Source file path.
+        fileFormat: skinweights.FORMAT_JSON or skinweights.FORMAT_BINARY.
+        root: Directory the source tree starts from. Defaults to the source directory.
+        outputDir: Directory to write to. Defaults to the source directory.
+
+    Returns: Output file path.
+    """
+    ext = skinweights.BINARY_EXT if fileFormat == skinweights.FORMAT_BINARY else JSON_EXT
+    base = os.path.splitext(path)[0] + ext
+    if not outputDir:
+        return base
+    return os.path.join(outputDir, os.path.relpath(base, root or os.path.dirname(path)))
+
+
+def convertFile(path, targetPath, fileFormat=None):
+    """
+    Convert a skin weight file, one mesh at a time.
+
+    Args:
+        path: Source file path, json or binary.
+        targetPath: Output file path. Must differ from the source.
+        fileFormat: skinweights.FORMAT_JSON or skinweights.FORMAT_BINARY. Guessed from targetPath if not given.
+
+    Returns: {'path', 'output', 'meshes', 'bytes' (source size), 'error'}
+    """
+    result = {'path': path, 'output': targetPath, 'meshes': 0, 'bytes': 0, 'error': None}
+    try:
+        if os.path.abspath(path) == os.path.abspath(targetPath):
+            raise ValueError('Output is the source file')
+        result['bytes'] = os.path.getsize(path)
+        directory = os.path.dirname(targetPath)
+        if directory and not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError:
+                if not os.path.isdir(directory):
+                    raise
+        with skinweights.SkinWeightReader(path) as reader:
+            with skinweights.SkinWeightWriter(targetPath, fileFormat=fileFormat) as writer:
+                for name in reader.names:
+                    writer.write(name, reader.read(name))
+        result['meshes'] = len(reader.names)
+    except Exception as e:
+        result['error'] = '{}: {}'.format(e.__class__.__name__, e)
+    return result
+
+
+def _lintTask(task):
+    return lintFile(*task)
+
+
+def _convertTask(task):
+    return convertFile(*task)
+
+
+def _run(function, tasks, workers=None):
+    """
+    Run tasks in a pool of worker processes.
+
+    Args:
+        function: Picklable module level function taking one task.
+        tasks: List of task arguments.
+        workers: Number of processes. Defaults to the number of cores. 1 runs in this process.
+
+    Returns: Generator of results, in completion order.
+    """
+    workers = min(workers or multiprocessing.cpu_count(), len(tasks))
+    if workers <= 1:
+        for task in tasks:
+            yield function(task)
+        return
+    pool = multiprocessing.Pool(workers)
+    try:
+        for result in pool.imap_unordered(function, tasks):
+            yield result
+        pool.close()
+    except BaseException:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+
+def lintFiles(paths, workers=None, tolerance=skinweights.SUM_TOLERANCE):
+    """
+    Lint skin weight files in parallel.
+
+    Args:
+        paths: File or directory paths. Directories are walked recursively.
+        workers: Number of processes. Defaults to the number of cores.
+        tolerance: Largest difference of a vertex weight sum from 1 considered normalized.
+
+    Returns: {path: result}. See lintFile().
+    """
+    tasks = [(path, tolerance) for path in findFiles(paths)]
+    return dict((result['path'], result) for result in _run(_lintTask, tasks, workers=workers))
+
+
+def convertFiles(paths, fileFormat, outputDir=None, workers=None):
+    """
+    Convert skin weight files in parallel. Files already in the target format are skipped.
+
+    Args:
+        paths: File or directory paths. Directories are walked recursively, and their tree is
+               recreated in outputDir.
+        fileFormat: skinweights.FORMAT_JSON or skinweights.FORMAT_BINARY.
+        outputDir: Directory to write to. Defaults to next to every source file.
+        workers: Number of processes. Defaults to the number of cores.
+
+    Returns: {path: result}. See convertFile().
+    """
+    tasks = []
+    for path in paths:
+        root = path if os.path.isdir(path) else os.path.dirname(path)
+        for filePath in findFiles([path]):
+            if skinweights.detectFormat(filePath) == fileFormat:
+                continue
+            tasks.append((filePath, outputPath(filePath, fileFormat, root=root, outputDir=outputDir), fileFormat))
+    return dict((result['path'], result) for result in _run(_convertTask, tasks, workers=workers))
+
+
+def issues(report, strict=False):
+    """
+    List the problems of a mesh report.
+
+    Args:
+        report: A mesh report of lintFile().
+        strict: Also list warnings: empty, unnormalized and over max influence vertices, unused influences.
+
+    Returns: List of strings.
+    """
+    found = list(report.get('errors', []))
+    labels = {'nonFinite': 'non finite weights',
+              'negative': 'negative weights',
+              'badIndices': 'weights on missing influences',
+              'duplicateWeights': 'influences stored twice on a vertex',
+              'badBlendWeights': 'blend weights out of [0, 1]',
+              'emptyVertices': 'vertices without weights',
+              'unnormalizedVertices': 'vertices not normalized',
+              'overMaxInfluences': 'vertices over max influences'}
+    for key in ERROR_KEYS + (WARNING_KEYS if strict else ()):
+        if report.get(key):
+            text = '{} {}'.format(report[key], labels[key])
+            if report.get(key + 'Sample'):
+                text += ', e.g. {}'.format(' '.join(str(v) for v in report[key + 'Sample']))
+            found.append(text)
+    if strict and report.get('unused'):
+        found.append('{} unused influences: {}'.format(len(report['unused']), ', '.join(report['unused'])))
+    return found
+
+
+def formatReport(results, strict=False, stats=False):
+    """
+    Format lintFiles() results as text. Only files with problems are listed, unless stats is on.
+
+    Args:
+        results: {path: result}
+        strict: Also list warnings.
+        stats: List per influence statistics of every mesh.
+
+    Returns: Multi line string.
+    """
+    lines = []
+    for path in sorted(results):
+        result = results[path]
+        fileLines = ['    {}'.format(error) for error in result['errors']]
+        for name in sorted(result['meshes']):
+            report = result['meshes'][name]
+            meshLines = ['        {}'.format(issue) for issue in issues(report, strict=strict)]
+            if stats and 'influences' in report:
+                meshLines.append('        {} vertices, {} weights, up to {} influences per vertex'.format(
+                    report['vertices'], report['weights'], report['maxInfluences']))
+                for inf in sorted(report['influences']):
+                    info = report['influences'][inf]
+                    meshLines.append('            {}: {} vertices, sum {:.4f}, max {:.4f}'.format(
+                        inf, info['vertices'], info['sum'], info['max']))
+            if meshLines:
+                fileLines.append('    {}:'.format(name))
+                fileLines.extend(meshLines)
+        if fileLines:
+            lines.append('{}:'.format(path))
+            lines.extend(fileLines)
+    return '\n'.join(lines)
+
+
+def _summary(results, seconds):
+    """
+    One line count and throughput of processed files.
+    """
+    size = sum(result['bytes'] for result in results.values()) / 1048576.0
+    return '{} files, {:.1f} MB in {:.1f}s ({:.1f} MB/s)'.format(
+        len(results), size, seconds, size / seconds if seconds else 0.0)
+
+
+def main(args=None):
+    parser = argparse.ArgumentParser(description='Check and convert skin weight files.')
+    subparsers = parser.add_subparsers(dest='command')
+    lintParser = subparsers.add_parser('lint', help='Check skin weight files.')
+    lintParser.add_argument('paths', nargs='+', help='Skin weight files or directories.')
+    lintParser.add_argument('--workers', type=int, help='Number of processes. Defaults to the number of cores.')
+    lintParser.add_argument('--tolerance', type=float, default=skinweights.SUM_TOLERANCE,
+                            help='Weight sum tolerance.')
+    lintParser.add_argument('--strict', action='store_true',
+                            help='Also fail on empty, unnormalized and over max influence vertices, '
+                                 'and unused influences.')
+    lintParser.add_argument('--stats', action='store_true', help='List per influence statistics.')
+    lintParser.add_argument('--json', dest='jsonPath', help='Also write the report to a json file.')
+    convertParser = subparsers.add_parser('convert', help='Convert skin weight files.')
+    convertParser.add_argument('paths', nargs='+', help='Skin weight files or directories.')
+    convertParser.add_argument('--format', dest='fileFormat', required=True,
+                               choices=(skinweights.FORMAT_JSON, skinweights.FORMAT_BINARY), help='Target format.')
+    convertParser.add_argument('--output', dest='outputDir', help='Output directory. Defaults to next to the sources.')
+    convertParser.add_argument('--workers', type=int, help='Number of processes. Defaults to the number of cores.')
+    args = parser.parse_args(args)
+
+    start = time.time()
+    if args.command == 'convert':
+        results = convertFiles(args.paths, args.fileFormat, outputDir=args.outputDir, workers=args.workers)
+        for path in sorted(results):
+            if results[path]['error']:
+                print('{}: {}'.format(path, results[path]['error']))
+        print(_summary(results, time.time() - start))
+        return 1 if any(result['error'] for result in results.values()) else 0
+
+    if args.command != 'lint':
+        parser.error('Missing command: lint or convert')
+    results = lintFiles(args.paths, workers=args.workers, tolerance=args.tolerance)
+    text = formatReport(results, strict=args.strict, stats=args.stats)
+    if text:
+        print(text)
+    print(_summary(results, time.time() - start))
+    if args.jsonPath:
+        with open(args.jsonPath, 'w') as outfile:
+            json.dump(results, outfile, sort_keys=True, indent=4)
+    failed = any(result['errors'] or any(issues(report, strict=args.strict) for report in result['meshes'].values())
+                 for result in results.values())
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,1812 @@
+"""
+Skin weight data and file formats.
+
+Maya-independent, so skin weight files can be read and written from plain python.
+
+Two formats are supported:
+    json   - Legacy format. {mesh: {'weights': {vertId: {infId: weight}}, 'infs': [], 'skinCluster': '', 'nw': 0}}
+    binary - Weights are stored per mesh as CSR arrays (vertex offsets, influence indices, float32 weights).
+             Arrays are little endian, 8 byte aligned and can be mapped straight from disk.
+
+In memory, the weights of a mesh are handled as a SkinWeights object, or as a record: a dict holding the
+CSR arrays ('offsets', 'indices', 'values'), the influence names ('infs') and the skinCluster settings.
+Records can also hold vertex 'points' and 'triangles', used to remap weights by position, and the
+skinCluster skinning method ('sm'), max influences ('mi') and per vertex dual quaternion 'blendWeights'.
+Delta records ('delta': True) only hold the changed vertices ('rows') of a mesh, and the content hash of the
+baseline they apply on ('baseHash').
+
+Binary layout:
+    header: magic 'SKWT', uint32 version, uint64 index offset, uint64 index length
+    block (one per mesh):
+        uint32 meta length, utf-8 json meta, padding
+        arrays listed in meta['arrays'] as [key, dtype, shape], each followed by padding
+    index: utf-8 json list with the byte offset, length, vertex and influence counts of every block
+
+Version 1 files have no index pointer in the header and are indexed by scanning the block metas.
+"""
+import sys
+import json
+import mmap
+import time
+import hashlib
+import struct
+import collections
+import contextlib
+import numpy as np
+import log
+import spatial
+import topology
+
+LOG = log.get_logger(__name__)
+# CONSTANTS
+FORMAT_JSON = 'json'
+FORMAT_BINARY = 'binary'
+BINARY_EXT = '.skw'
+MAGIC = b'SKWT'
+VERSION = 2
+HEADER = struct.Struct('<4sI')
+INDEX_POINTER = struct.Struct('<QQ')
+BLOCK = struct.Struct('<I')
+ALIGN = 8
+OFFSET_DTYPE = '<i8'
+VALUE_DTYPE = '<f4'
+CSR_KEYS = ('offsets', 'indices', 'values')
+REMAP_CLOSEST = 'closest'
+REMAP_BARYCENTRIC = 'barycentric'
+REMAP_SURFACE = 'surface'
+MIRROR_RULES = (('L_', 'R_'), ('Lf_', 'Rt_'), ('left', 'right'), ('Left', 'Right'))
+DELTA_KEYS = ('delta', 'rows', 'vertexCount', 'baseHash')
+# dense per vertex arrays following the weight rows
+VERTEX_KEYS = ('blendWeights',)
+BIND_CLOSEST = 'closest'
+BIND_INVERSE_DISTANCE = 'inverseDistance'
+BIND_CHUNK = 16384
+DELTA_TOLERANCE = 1e-4
+SUM_TOLERANCE = 1e-3
+DELTA_CHUNK = 65536
+SNAPSHOT_COUNT = 10
+SNAPSHOT_BYTES = 1024 * 1024 * 1024
+
+
+def formatFromPath(path):
+    """
+    Guess the file format from a file extension.
+
+    Args:
+        path: A skin weight file path.
+
+    Returns: FORMAT_BINARY for BINARY_EXT files, FORMAT_JSON for anything else.
+    """
+    if path.lower().endswith(BINARY_EXT):
+        return FORMAT_BINARY
+    return FORMAT_JSON
+
+
+def detectFormat(path):
+    """
+    Detect the format of an existing skin weight file from its header.
+
+    Args:
+        path: A skin weight file path.
+
+    Returns: FORMAT_BINARY or FORMAT_JSON.
+    """
+    with open(path, 'rb') as infile:
+        magic = infile.read(len(MAGIC))
+    if magic == MAGIC:
+        return FORMAT_BINARY
+    return FORMAT_JSON
+
+
+def indexDtype(infCount):
+    """
+    Smallest unsigned dtype able to store influence indices.
+
+    Args:
+        infCount: Number of influences.
+
+    Returns: Numpy dtype string.
+    """
+    if infCount <= 0xFFFF:
+        return '<u2'
+    return '<u4'
+
+
+def legacyToCsr(weights, vertexCount=None):
+    """
+    Convert legacy nested weights to CSR arrays.
+
+    Args:
+        weights: {vertId: {infId: weight}}. Ids can be ints or strings.
+        vertexCount: Number of rows. Defaults to the highest vertex id + 1.
+
+    Returns: (offsets, indices, values) numpy arrays.
+    """
+    rows = {}
+    for vertId, vWeights in weights.items():
+        rows[int(vertId)] = vWeights
+    if vertexCount is None:
+        vertexCount = max(rows) + 1 if rows else 0
+
+    counts = np.zeros(vertexCount, dtype=OFFSET_DTYPE)
+    for vertId, vWeights in rows.items():
+        if vertId < vertexCount:
+            counts[vertId] = len(vWeights)
+    offsets = np.zeros(vertexCount + 1, dtype=OFFSET_DTYPE)
+    np.cumsum(counts, out=offsets[1:])
+
+    indices = np.zeros(offsets[-1], dtype='<u4')
+    values = np.zeros(offsets[-1], dtype=VALUE_DTYPE)
+    for vertId, vWeights in rows.items():
+        if vertId >= vertexCount:
+            continue
+        start = offsets[vertId]
+        # keep influences sorted within a row
+        items = sorted((int(infId), weight) for infId, weight in vWeights.items())
+        for i, (infId, weight) in enumerate(items):
+            indices[start + i] = infId
+            values[start + i] = weight
+    return offsets, indices, values
+
+
+def csrToLegacy(offsets, indices, values):
+    """
+    Convert CSR arrays to legacy nested weights.
+
+    Args:
+        offsets: Vertex offsets, vertex count + 1 long.
+        indices: Influence index per weight.
+        values: Weight values.
+
+    Returns: {vertId: {infId: weight}} with int keys.
+    """
+    offsets = np.asarray(offsets).tolist()
+    indices = np.asarray(indices).tolist()
+    values = np.asarray(values, dtype=np.float64).tolist()
+    weights = {}
+    for vertId in range(len(offsets) - 1):
+        start, end = offsets[vertId], offsets[vertId + 1]
+        weights[vertId] = dict(zip(indices[start:end], values[start:end]))
+    return weights
+
+
+def _rowEntries(offsets, rows):
+    """
+    Locate the stored weights of a list of rows.
+
+    Args:
+        offsets: Vertex offsets, vertex count + 1 long.
+        rows: Vertex ids.
+
+    Returns: (output row of every weight, flat position of every weight, weight count per row)
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    rows = np.asarray(rows, dtype=np.int64)
+    starts = offsets[rows]
+    counts = offsets[rows + 1] - starts
+    rowIds = np.repeat(np.arange(len(rows)), counts)
+    flat = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts) + np.repeat(starts, counts)
+    return rowIds, flat, counts
+
+
+def csrToDense(offsets, indices, values, infCount, rows=None, columns=None):
+    """
+    Expand CSR arrays to a dense (vertex, influence) matrix.
+
+    Args:
+        offsets: Vertex offsets, vertex count + 1 long.
+        indices: Influence index per weight.
+        values: Weight values.
+        infCount: Number of columns of the dense matrix.
+        rows: Optional vertex ids to extract, in output order. Defaults to all vertices.
+        columns: Optional array mapping a stored influence index to a dense column. -1 drops the influence.
+
+    Returns: Float64 numpy array of shape (len(rows), infCount).
+    """
+    if rows is None:
+        rows = np.arange(len(offsets) - 1)
+    rowIds, flat, _ = _rowEntries(offsets, rows)
+    cols = np.asarray(indices, dtype=np.int64)[flat]
+    if columns is not None:
+        cols = np.asarray(columns, dtype=np.int64)[cols]
+        keep = cols >= 0
+        rowIds, flat, cols = rowIds[keep], flat[keep], cols[keep]
+
+    dense = np.zeros((len(rows), infCount), dtype=np.float64)
+    dense[rowIds, cols] = np.asarray(values)[flat]
+    return dense
+
+
+def csrRows(offsets, indices, values, rows):
+    """
+    Gather rows of CSR arrays. Rows can repeat.
+
+    Args:
+        offsets: Vertex offsets, vertex count + 1 long.
+        indices: Influence index per weight.
+        values: Weight values.
+        rows: Vertex ids, in output order.
+
+    Returns: (offsets, indices, values) numpy arrays.
+    """
+    _, flat, counts = _rowEntries(offsets, rows)
+    newOffsets = np.zeros(len(counts) + 1, dtype=OFFSET_DTYPE)
+    np.cumsum(counts, out=newOffsets[1:])
+    return newOffsets, np.asarray(indices)[flat], np.asarray(values)[flat]
+
+
+def csrSlice(offsets, indices, values, start, stop):
+    """
+    Cut a consecutive vertex range out of CSR arrays.
+    Indices and values are views of the input arrays, only the range offsets are copied.
+
+    Args:
+        offsets: Vertex offsets, vertex count + 1 long.
+        indices: Influence index per weight.
+        values: Weight values.
+        start: First vertex id.
+        stop: Vertex id after the last vertex.
+
+    Returns: (offsets, indices, values) of the range, offsets starting at 0.
+    """
+    rangeOffsets = np.asarray(offsets[start:stop + 1], dtype=np.int64)
+    first, last = rangeOffsets[0], rangeOffsets[-1]
+    return rangeOffsets - first, indices[first:last], values[first:last]
+
+
+def iterCsrChunks(offsets, indices, values, chunkSize):
+    """
+    Walk CSR arrays in consecutive vertex blocks, see csrSlice().
+    Memory mapped arrays are only paged in one block at a time.
+
+    Example:
+        for start, (offsets, indices, values) in skinweights.iterCsrChunks(o, i, v, 100000):
+            dense = skinweights.csrToDense(offsets, indices, values, infCount)
+
+    Args:
+        offsets: Vertex offsets, vertex count + 1 long.
+        indices: Influence index per weight.
+        values: Weight values.
+        chunkSize: Number of vertices per block.
+
+    Returns: Generator of (first vertex id, (offsets, indices, values)).
+    """
+    vertexCount = len(offsets) - 1
+    for start in range(0, vertexCount, chunkSize):
+        yield start, csrSlice(offsets, indices, values, start, min(start + chunkSize, vertexCount))
+
+
+def denseToCsr(dense, threshold=0.0):
+    """
+    Sparsify a dense (vertex, influence) matrix to CSR arrays.
+
+    Args:
+        dense: 2d array of weights.
+        threshold: Weights less than or equal to this are dropped.
+
+    Returns: (offsets, indices, values) numpy arrays.
+    """
+    dense = np.asarray(dense)
+    rowIds, indices = np.nonzero(dense > threshold)
+    offsets = np.zeros(dense.shape[0] + 1, dtype=OFFSET_DTYPE)
+    np.cumsum(np.bincount(rowIds, minlength=dense.shape[0]), out=offsets[1:])
+    values = dense[rowIds, indices].astype(VALUE_DTYPE)
+    return offsets, indices.astype('<u4'), values
+
+
+def concatCsr(parts):
+    """
+    Stack CSR blocks of consecutive vertex ranges.
+
+    Args:
+        parts: A list of (offsets, indices, values).
+
+    Returns: (offsets, indices, values) numpy arrays.
+    """
+    if not parts:
+        return np.zeros(1, dtype=OFFSET_DTYPE), np.zeros(0, dtype='<u4'), np.zeros(0, dtype=VALUE_DTYPE)
+    offsets = [np.zeros(1, dtype=OFFSET_DTYPE)]
+    base = 0
+    for partOffsets, partIndices, _ in parts:
+        offsets.append(np.asarray(partOffsets[1:], dtype=OFFSET_DTYPE) + base)
+        base += len(partIndices)
+    return (np.concatenate(offsets),
+            np.concatenate([p[1] for p in parts]).astype('<u4'),
+            np.concatenate([p[2] for p in parts]).astype(VALUE_DTYPE))
+
+
+def _rowIds(offsets):
+    offsets = np.asarray(offsets, dtype=np.int64)
+    return np.repeat(np.arange(len(offsets) - 1), np.diff(offsets))
+
+
+def _filterCsr(offsets, indices, values, keep):
+    """
+    Drop stored weights from CSR arrays.
+
+    Args:
+        offsets: Vertex offsets, vertex count + 1 long.
+        indices: Influence index per weight.
+        values: Weight values.
+        keep: Bool mask of the weights to keep.
+
+    Returns: (offsets, indices, values) numpy arrays.
+    """
+    vertexCount = len(offsets) - 1
+    newOffsets = np.zeros(vertexCount + 1, dtype=OFFSET_DTYPE)
+    np.cumsum(np.bincount(_rowIds(offsets)[keep], minlength=vertexCount), out=newOffsets[1:])
+    return newOffsets, np.asarray(indices)[keep], np.asarray(values)[keep]
+
+
+def pruneWeights(offsets, indices, values, threshold):
+    """
+    Drop weights below a threshold.
+
+    Args:
+        offsets: Vertex offsets, vertex count + 1 long.
+        indices: Influence index per weight.
+        values: Weight values.
+        threshold: Weights lower than this are removed.
+
+    Returns: (offsets, indices, values) numpy arrays.
+    """
+    return _filterCsr(offsets, indices, values, np.asarray(values) >= threshold)
+
+
+def capInfluences(offsets, indices, values, maxInfluences):
+    """
+    Keep the largest maxInfluences weights of every vertex.
+
+    Args:
+        offsets: Vertex offsets, vertex count + 1 long.
+        indices: Influence index per weight.
+        values: Weight values.
+        maxInfluences: Maximum number of influences per vertex.
+
+    Returns: (offsets, indices, values) numpy arrays.
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    rowIds = _rowIds(offsets)
+    # rank the weights of every row, largest first
+    order = np.lexsort((-np.asarray(values, dtype=np.float64), rowIds))
+    rank = np.empty(len(order), dtype=np.int64)
+    rank[order] = np.arange(len(order)) - offsets[rowIds[order]]
+    return _filterCsr(offsets, indices, values, rank < maxInfluences)
+
+
+def normalizeWeights(offsets, indices, values):
+    """
+    Scale the weights of every vertex to sum to 1. Vertices without weights are left empty.
+
+    Args:
+        offsets: Vertex offsets, vertex count + 1 long.
+        indices: Influence index per weight.
+        values: Weight values.
+
+    Returns: (offsets, indices, values) numpy arrays.
+    """
+    rowIds = _rowIds(offsets)
+    values = np.asarray(values, dtype=np.float64)
+    sums = np.bincount(rowIds, weights=values, minlength=len(offsets) - 1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        normalized = np.where(sums[rowIds] > 0, values / sums[rowIds], 0.0)
+    return offsets, indices, normalized.astype(VALUE_DTYPE)
+
+
+def unusedInfluences(indices, infCount):
+    """
+    Influences without any weight.
+
+    Args:
+        indices: Influence index per weight.
+        infCount: Number of influences.
+
+    Returns: Sorted numpy array of influence indices.
+    """
+    used = np.zeros(infCount, dtype=bool)
+    used[np.asarray(indices, dtype=np.int64)] = True
+    return np.flatnonzero(~used)
+
+
+def cleanWeights(offsets, indices, values, infCount, threshold=0.0, maxInfluences=None, normalize=True):
+    """
+    Prune, cap and normalize weights in one pass.
+
+    Args:
+        offsets: Vertex offsets, vertex count + 1 long.
+        indices: Influence index per weight.
+        values: Weight values.
+        infCount: Number of influences.
+        threshold: Weights lower than this are removed.
+        maxInfluences: Maximum number of influences per vertex. None for no limit.
+        normalize: True to normalize the remaining weights.
+
+    Returns: ((offsets, indices, values), stats dict)
+    """
+    stats = {'vertices': len(offsets) - 1, 'weights': len(values)}
+    csr = pruneWeights(offsets, indices, values, threshold)
+    stats['pruned'] = len(values) - len(csr[2])
+    if maxInfluences:
+        capped = capInfluences(*csr, maxInfluences=maxInfluences)
+        stats['capped'] = len(csr[2]) - len(capped[2])
+        # vertices that had more than maxInfluences weights
+        stats['cappedVertices'] = int(np.count_nonzero(np.diff(csr[0]) > maxInfluences))
+        csr = capped
+    else:
+        stats['capped'] = 0
+        stats['cappedVertices'] = 0
+    if normalize:
+        csr = normalizeWeights(*csr)
+    stats['unused'] = unusedInfluences(csr[1], infCount).tolist()
+    return csr, stats
+
+
+def validateWeights(offsets, indices, values, infCount, nw=1, tolerance=SUM_TOLERANCE, rows=None):
+    """
+    Check and fix weights before they are applied.
+    Non finite and negative weights, and weights of influences out of range are dropped.
+    Vertices whose weights don't sum to 1 are renormalized, unless normalization is off (nw 0).
+    Vertices left without weights can't be fixed and are only reported.
+
+    Args:
+        offsets: Vertex offsets, vertex count + 1 long.
+        indices: Influence index per weight.
+        values: Weight values.
+        infCount: Number of influences.
+        nw: SkinCluster normalization mode. 0 - none, 1 - interactive, 2 - post.
+        tolerance: Largest difference of a vertex weight sum from 1 considered normalized.
+        rows: Optional vertex id of every row, used in the report. Defaults to the row number.
+
+    Returns: ((offsets, indices, values), report dict)
+        report: vertices, nonFinite, negative, badIndices (number of dropped weights),
+                emptyVertices, unnormalizedVertices (numpy arrays of vertex ids).
+    """
+    offsets = np.asarray(offsets, dtype=np.int64)
+    if len(offsets) == 0 or offsets[0] != 0 or np.any(np.diff(offsets) < 0) or offsets[-1] != len(values):
+        raise ValueError('Invalid skin weight offsets.')
+    values = np.asarray(values, dtype=np.float64)
+    indices = np.asarray(indices, dtype=np.int64)
+    vertexCount = len(offsets) - 1
+    rows = np.arange(vertexCount) if rows is None else np.asarray(rows, dtype=np.int64)
+
+    finite = np.isfinite(values)
+    with np.errstate(invalid='ignore'):
+        positive = values >= 0
+    inRange = indices < infCount
+    report = {'vertices': vertexCount,
+              'nonFinite': int(np.count_nonzero(~finite)),
+              'negative': int(np.count_nonzero(finite & ~positive)),
+              'badIndices': int(np.count_nonzero(~inRange))}
+    offsets, indices, values = _filterCsr(offsets, indices, values, finite & positive & inRange)
+
+    sums = np.bincount(_rowIds(offsets), weights=values, minlength=vertexCount)
+    empty = np.diff(offsets) == 0
+    report['emptyVertices'] = rows[empty]
+    report['unnormalizedVertices'] = rows[~empty & (np.abs(sums - 1.0) > tolerance)]
+    if nw and len(report['unnormalizedVertices']):
+        offsets, indices, values = normalizeWeights(offsets, indices, values)
+    return (offsets, indices.astype('<u4'), values.astype(VALUE_DTYPE)), report
+
+
+def mergeValidationReports(reports):
+    """
+    Combine the validateWeights() reports of several vertex blocks.
+
+    Args:
+        reports: A list of report dicts.
+
+    Returns: Report dict.
+    """
+    merged = {}
+    for report in reports:
+        for key, value in report.items():
+            if isinstance(value, np.ndarray):
+                merged[key] = np.concatenate([merged[key], value]) if key in merged else value
+            else:
+                merged[key] = merged.get(key, 0) + value
+    return merged
+
+
+def formatValidationReport(report):
+    """
+    One line summary of a validateWeights() report.
+
+    Args:
+        report: Report dict.
+
+    Returns: String. Empty if the weights were valid.
+    """
+    issues = []
+    for key, label in (('nonFinite', 'non finite weights'), ('negative', 'negative weights'),
+                       ('badIndices', 'weights on missing influences')):
+        if report.get(key):
+            issues.append('{} {} dropped'.format(report[key], label))
+    if len(report.get('unnormalizedVertices', [])):
+        issues.append('{} vertices not normalized'.format(len(report['unnormalizedVertices'])))
+    if len(report.get('emptyVertices', [])):
+        issues.append('{} vertices without weights'.format(len(report['emptyVertices'])))
+    return ', '.join(issues)
+
+
+def blendRows(offsets, indices, values, infCount, sources, factors):
+    """
+    Build new rows as weighted sums of existing CSR rows.
+
+    Args:
+        offsets: Vertex offsets, vertex count + 1 long.
+        indices: Influence index per weight.
+        values: Weight values.
+        infCount: Number of influences.
+        sources: (n, k) source vertex ids of every new row.
+        factors: (n, k) blend factor of every source vertex.
+
+    Returns: (offsets, indices, values) numpy arrays with n rows.
+    """
+    sources = np.asarray(sources, dtype=np.int64)
+    sources = sources.reshape(len(sources), -1)
+    factors = np.asarray(factors, dtype=np.float64).reshape(sources.shape)
+    if sources.shape[1] == 1:
+        return csrRows(offsets, indices, values, sources[:, 0])
+
+    rowIds, infIds, weights = [], [], []
+    for k in range(sources.shape[1]):
+        sourceRows, flat, _ = _rowEntries(offsets, sources[:, k])
+        rowIds.append(sourceRows)
+        infIds.append(np.asarray(indices, dtype=np.int64)[flat])
+        weights.append(np.asarray(values, dtype=np.float64)[flat] * factors[sourceRows, k])
+    # sum the contributions per (vertex, influence)
+    keys = np.concatenate(rowIds) * infCount + np.concatenate(infIds)
+    uniqueKeys, inverse = np.unique(keys, return_inverse=True)
+    summed = np.bincount(inverse, weights=np.concatenate(weights))
+    keep = summed > 0
+    uniqueKeys, summed = uniqueKeys[keep], summed[keep]
+    newOffsets = np.zeros(len(sources) + 1, dtype=OFFSET_DTYPE)
+    np.cumsum(np.bincount(uniqueKeys // infCount, minlength=len(sources)), out=newOffsets[1:])
+    return newOffsets, (uniqueKeys % infCount).astype('<u4'), summed.astype(VALUE_DTYPE)
+
+
+def findCorrespondence(srcPoints, points, mode=REMAP_CLOSEST, triangles=None, grid=None, bvh=None):
+    """
+    Map target vertices onto source vertices by position.
+
+    Args:
+        srcPoints: (n, 3) source vertex positions.
+        points: (m, 3) target vertex positions.
+        mode: REMAP_CLOSEST for the nearest source vertex.
+              REMAP_BARYCENTRIC for the closest point on the source triangles around the nearest vertex.
+              REMAP_SURFACE for the exact closest point on the source surface, searched with a triangle BVH.
+        triangles: (t, 3) source triangles, needed for REMAP_BARYCENTRIC and REMAP_SURFACE.
+        grid: Optional spatial.UniformGrid of srcPoints, to reuse between calls.
+        bvh: Optional spatial.TriangleBVH of the source, to reuse between calls.
+
+    Returns: {'sources': (m, k) source vertex ids, 'factors': (m, k) blend factors}
+    """
+    srcPoints = np.asarray(srcPoints, dtype=np.float64).reshape(-1, 3)
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    if grid is None:
+        grid = spatial.UniformGrid(srcPoints)
+
+    if mode == REMAP_CLOSEST:
+        nearest, _ = grid.query(points)
+        return {'sources': nearest[:, None], 'factors': np.ones((len(points), 1))}
+    elif mode == REMAP_BARYCENTRIC:
+        triangles = np.asarray(triangles, dtype=np.int64).reshape(-1, 3)
+        faceIds, barys = spatial.closestPointOnMesh(srcPoints, points, triangles, grid=grid)
+        return {'sources': triangles[faceIds], 'factors': barys}
+    elif mode == REMAP_SURFACE:
+        triangles = np.asarray(triangles, dtype=np.int64).reshape(-1, 3)
+        if bvh is None:
+            bvh = spatial.TriangleBVH(srcPoints, triangles)
+            bvh.grid = grid
+        faceIds, barys, _ = bvh.query(points)
+        return {'sources': triangles[faceIds], 'factors': barys}
+    raise ValueError('Unknown remap mode: {}'.format(mode))
+
+
+def remapRecord(record, points, mode=REMAP_CLOSEST, grid=None, cache=None, fingerprint=None, bvh=None):
+    """
+    Remap the weights of a record to another vertex layout by position.
+    The record must hold source vertex positions ('points'), and triangles for REMAP_BARYCENTRIC.
+
+    Args:
+        record: Record dict holding CSR arrays and points.
+        points: (n, 3) positions of the target vertices.
+        mode: REMAP_CLOSEST to copy the weights of the nearest source vertex.
+              REMAP_BARYCENTRIC to blend the weights of the closest point on the nearest source triangles.
+              REMAP_SURFACE to blend the weights of the exact closest point on the source surface.
+        grid: Optional spatial.UniformGrid of the source points, to reuse between calls.
+        cache: Optional topology.MapCache. The correspondence is cached per source and target topology and
+               vertex positions.
+        fingerprint: Topology fingerprint of the target, needed to use the cache.
+        bvh: Optional spatial.TriangleBVH of the source, to reuse between calls.
+
+    Returns: New record with one row per target vertex.
+    """
+    key = None
+    correspondence = None
+    if cache is not None and fingerprint and 'triangles' in record:
+        srcFingerprint = topology.fingerprint(len(record['points']), record['triangles'])
+        key = cache.key('remap', mode, srcFingerprint, topology.pointsHash(record['points']),
+                        fingerprint, topology.pointsHash(points))
+        correspondence = cache.get(key)
+    if correspondence is None:
+        correspondence = findCorrespondence(record['points'], points, mode=mode,
+                                            triangles=record.get('triangles'), grid=grid, bvh=bvh)
+        if key:
+            cache.put(key, correspondence)
+
+    remapped = dict((k, v) for k, v in record.items() if k not in CSR_KEYS + ('points', 'triangles'))
+    remapped['offsets'], remapped['indices'], remapped['values'] = blendRows(
+        record['offsets'], record['indices'], record['values'], len(record['infs']),
+        correspondence['sources'], correspondence['factors'])
+    for key in VERTEX_KEYS:
+        if key in record:
+            sources = np.asarray(correspondence['sources'], dtype=np.int64)
+            sources = sources.reshape(len(sources), -1)
+            factors = np.asarray(correspondence['factors'], dtype=np.float64).reshape(sources.shape)
+            remapped[key] = (np.asarray(record[key])[sources] * factors).sum(axis=1).astype(VALUE_DTYPE)
+    return remapped
+
+
+def bindWeights(points, starts, ends, owners, infCount, mode=BIND_CLOSEST, maxInfluences=4, falloff=2.0,
+                chunkSize=BIND_CHUNK):
+    """
+    Compute starter weights from the distance of every vertex to the influence bones.
+
+    Args:
+        points: (n, 3) vertex positions.
+        starts: (s, 3) bone segment starts.
+        ends: (s, 3) bone segment ends. Leaf influences can use a degenerate segment (start == end).
+        owners: (s,) influence index of every segment. An influence can own several segments.
+        infCount: Number of influences.
+        mode: BIND_CLOSEST to fully weight every vertex to its closest bone.
+              BIND_INVERSE_DISTANCE to blend the maxInfluences closest bones by 1 / distance ** falloff.
+        maxInfluences: Maximum number of influences per vertex, for BIND_INVERSE_DISTANCE.
+        falloff: Distance exponent, for BIND_INVERSE_DISTANCE. Higher values give harder transitions.
+        chunkSize: Number of vertices measured at once. Memory peaks at a few chunkSize * segments doubles.
+
+    Returns: (offsets, indices, values) numpy arrays.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    owners = np.asarray(owners, dtype=np.int64)
+    if mode not in (BIND_CLOSEST, BIND_INVERSE_DISTANCE):
+        raise ValueError('Unknown bind mode: {}'.format(mode))
+    if not len(owners):
+        raise ValueError('No bone segments to bind to.')
+    keep = 1 if mode == BIND_CLOSEST else max(1, min(maxInfluences, infCount))
+
+    # segments sorted by owner, so the distance to an influence is the minimum over its run of segments
+    order = np.argsort(owners, kind='mergesort')
+    starts = np.asarray(starts, dtype=np.float64)[order]
+    ends = np.asarray(ends, dtype=np.float64)[order]
+    owners = owners[order]
+    runStarts = np.flatnonzero(np.r_[True, owners[1:] != owners[:-1]])
+    runOwners = owners[runStarts]
+    keep = min(keep, len(runOwners))
+
+    indices, values = [], []
+    for start in range(0, len(points), chunkSize):
+        distances = spatial.segmentDistances(points[start:start + chunkSize], starts, ends)
+        distances = np.minimum.reduceat(distances, runStarts, axis=1)
+        if mode == BIND_CLOSEST:
+            nearest = distances.argmin(axis=1)[:, None]
+            weights = np.ones(nearest.shape)
+        else:
+            if keep < distances.shape[1]:
+                nearest = np.argpartition(distances, keep - 1, axis=1)[:, :keep]
+            else:
+                nearest = np.tile(np.arange(keep), (len(distances), 1))
+            weights = 1.0 / np.maximum(distances[np.arange(len(distances))[:, None], nearest], 1e-8) ** falloff
+            weights /= weights.sum(axis=1)[:, None]
+        indices.append(runOwners[nearest].ravel())
+        values.append(weights.ravel())
+
+    offsets = np.arange(len(points) + 1, dtype=OFFSET_DTYPE) * keep
+    if not indices:
+        return offsets, np.zeros(0, dtype='<u4'), np.zeros(0, dtype=VALUE_DTYPE)
+    # keep influences sorted within a row
+    indices, values = np.concatenate(indices), np.concatenate(values)
+    order = np.lexsort((indices, np.repeat(np.arange(len(points)), keep)))
+    return offsets, indices[order].astype('<u4'), values[order].astype(VALUE_DTYPE)
+
+
+def symmetryMap(points, axis=0, grid=None):
+    """
+    Find the mirrored vertex of every vertex.
+
+    Args:
+        points: (n, 3) vertex positions.
+        axis: Mirror axis, 0 for x, 1 for y, 2 for z.
+        grid: Optional spatial.UniformGrid of points, to reuse between calls.
+
+    Returns: (mirror vertex ids, distances from the mirrored positions to the matched vertices)
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    if grid is None:
+        grid = spatial.UniformGrid(points)
+    mirrored = points.copy()
+    mirrored[:, axis] *= -1
+    return grid.query(mirrored)
+
+
+def mirrorInfluenceTable(infs, rules=MIRROR_RULES):
+    """
+    Map every influence to its mirrored influence by name.
+
+    Args:
+        infs: Influence names.
+        rules: List of (left, right) name substrings, tried in order and in both directions.
+
+    Returns: Numpy int array. Influences without a mirrored counterpart map to themselves.
+    """
+    lookup = dict((inf, i) for i, inf in enumerate(infs))
+    table = np.arange(len(infs), dtype=np.int64)
+    for i, inf in enumerate(infs):
+        # match on the short name, keep any namespace or path
+        head, sep, shortName = inf.rpartition('|')
+        nsHead, nsSep, shortName = shortName.rpartition(':')
+        prefix = head + sep + nsHead + nsSep
+        for left, right in rules:
+            for src, dst in ((left, right), (right, left)):
+                if src in shortName:
+                    other = lookup.get(prefix + shortName.replace(src, dst, 1))
+                    if other is not None:
+                        table[i] = other
+                        break
+            if table[i] != i:
+                break
+    return table
+
+
+def mirrorWeights(offsets, indices, values, mirror, infTable, targets):
+    """
+    Replace the weights of target vertices by the weights of their mirrored vertices, with mirrored influences.
+
+    Args:
+        offsets: Vertex offsets, vertex count + 1 long.
+        indices: Influence index per weight.
+        values: Weight values.
+        mirror: Mirror vertex id of every vertex, see symmetryMap().
+        infTable: Mirror influence of every influence, see mirrorInfluenceTable().
+        targets: Vertex ids to overwrite.
+
+    Returns: (offsets, indices, values) numpy arrays.
+    """
+    targets = np.asarray(targets, dtype=np.int64)
+    vertexCount = len(offsets) - 1
+    newOffsets, newIndices, newValues = csrRows(offsets, indices, values, np.asarray(mirror)[targets])
+    newIndices = np.asarray(infTable)[np.asarray(newIndices, dtype=np.int64)]
+    stacked = concatCsr([(offsets, indices, values), (newOffsets, newIndices, newValues)])
+    sources = np.arange(vertexCount)
+    sources[targets] = vertexCount + np.arange(len(targets))
+    return csrRows(*stacked, rows=sources)
+
+
+def contentHash(record, chunkSize=DELTA_CHUNK):
+    """
+    Hash the weights of a record, chunk by chunk of vertices.
+    Arrays are hashed in their stored dtypes, so the hash is the same for the json and binary formats.
+
+    Args:
+        record: Record dict holding CSR arrays.
+        chunkSize: Number of vertices per hashed chunk.
+
+    Returns: Hex digest of the chunk digests.
+    """
+    offsets = np.asarray(record['offsets'], dtype=OFFSET_DTYPE)
+    indices = np.asarray(record['indices'], dtype='<u4')
+    values = np.asarray(record['values'], dtype=VALUE_DTYPE)
+    digest = hashlib.sha1(json.dumps(list(record['infs'])).encode('utf-8'))
+    for start in range(0, max(len(offsets) - 1, 1), chunkSize):
+        end = min(start + chunkSize, len(offsets) - 1)
+        chunk = hashlib.sha1(np.ascontiguousarray(offsets[start:end + 1] - offsets[start]).tobytes())
+        chunk.update(indices[offsets[start]:offsets[end]].tobytes())
+        chunk.update(values[offsets[start]:offsets[end]].tobytes())
+        digest.update(chunk.digest())
+    for key in VERTEX_KEYS:
+        if key in record:
+            digest.update(np.ascontiguousarray(record[key], dtype=VALUE_DTYPE).tobytes())
+    return digest.hexdigest()
+
+
+def alignInfluences(indices, infs, targetInfs):
+    """
+    Map influence indices to the influence list of another record by name.
+
+    Args:
+        indices: Influence index per weight.
+        infs: Influence names the indices refer to.
+        targetInfs: Influence names to map to.
+
+    Returns: Numpy int array of target indices, -1 where the influence is not in targetInfs.
+    """
+    lookup = dict((inf, i) for i, inf in enumerate(targetInfs))
+    table = np.array([lookup.get(inf, -1) for inf in infs] + [-1], dtype=np.int64)
+    return table[np.asarray(indices, dtype=np.int64)]
+
+
+def changedVertices(base, current, tolerance=DELTA_TOLERANCE):
+    """
+    Vertices whose weights differ between two records of the same mesh.
+
+    Args:
+        base: Baseline record.
+        current: Current record. Must have the same vertex count as base.
+        tolerance: Largest weight difference considered unchanged.
+
+    Returns: Sorted numpy array of vertex ids.
+    """
+    infCount = len(current['infs'])
+    baseCols = alignInfluences(base['indices'], base['infs'], current['infs'])
+    # influences missing from the current record count as a change on their column
+    missing = baseCols < 0
+    baseCols[missing] = infCount
+    baseKeys = _rowIds(base['offsets']) * (infCount + 1) + baseCols
+    currentKeys = _rowIds(current['offsets']) * (infCount + 1) + np.asarray(current['indices'], dtype=np.int64)
+
+    keys = np.concatenate([baseKeys, currentKeys])
+    diffs = np.concatenate([-np.asarray(base['values'], dtype=np.float64),
+                            np.asarray(current['values'], dtype=np.float64)])
+    uniqueKeys, inverse = np.unique(keys, return_inverse=True)
+    summed = np.bincount(inverse, weights=diffs)
+    return np.unique(uniqueKeys[np.abs(summed) > tolerance] // (infCount + 1))
+
+
+def deltaRecord(base, current, tolerance=DELTA_TOLERANCE, baseHash=None):
+    """
+    Build a delta record holding only the vertices that changed from a baseline.
+
+    Args:
+        base: Baseline record.
+        current: Current record.
+        tolerance: Largest weight difference considered unchanged.
+        baseHash: contentHash() of base. Computed if not given.
+
+    Returns: Delta record, or current if the vertex counts differ and a delta is not possible.
+    """
+    vertexCount = len(current['offsets']) - 1
+    if len(base['offsets']) - 1 != vertexCount:
+        return current
+    rows = changedVertices(base, current, tolerance=tolerance)
+    for key in VERTEX_KEYS:
+        if key in current:
+            baseValues = np.asarray(base.get(key, np.zeros(vertexCount)), dtype=np.float64)
+            changed = np.abs(np.asarray(current[key], dtype=np.float64) - baseValues) > tolerance
+            rows = np.union1d(rows, np.flatnonzero(changed))
+    delta = dict((k, v) for k, v in current.items() if k not in CSR_KEYS)
+    delta.update(SkinWeights.fromRecord(current).rows(rows).toRecord())
+    for key in VERTEX_KEYS:
+        if key in current:
+            delta[key] = np.asarray(current[key], dtype=VALUE_DTYPE)[rows]
+    delta['rows'] = rows.astype('<i4')
+    delta['delta'] = True
+    delta['vertexCount'] = vertexCount
+    delta['baseHash'] = baseHash or contentHash(base)
+    return delta
+
+
+def applyDelta(base, delta, verify=True):
+    """
+    Apply a delta record on its baseline.
+
+    Args:
+        base: Baseline record.
+        delta: Delta record built by deltaRecord().
+        verify: True to check that base is the baseline the delta was built against.
+
+    Returns: Full record. Influences follow the delta record.
+    """
+    if verify and contentHash(base) != delta['baseHash']:
+        raise ValueError('Skin weight delta does not match its baseline.')
+    vertexCount = delta['vertexCount']
+    if len(base['offsets']) - 1 != vertexCount:
+        raise ValueError('Skin weight delta has {} vertices, baseline has {}.'.format(
+            vertexCount, len(base['offsets']) - 1))
+
+    # baseline weights mapped on the delta influences, with the changed rows replaced
+    weights = SkinWeights.fromRecord(base).subset(delta['infs'])
+    weights = weights.merge(SkinWeights.fromRecord(delta), rows=delta['rows'])
+
+    record = dict((k, v) for k, v in delta.items() if k not in CSR_KEYS + DELTA_KEYS)
+    record['offsets'], record['indices'], record['values'] = weights.offsets, weights.indices, weights.values
+    for key in VERTEX_KEYS:
+        if key in delta:
+            values = np.array(base.get(key, np.zeros(vertexCount)), dtype=VALUE_DTYPE)
+            values[np.asarray(delta['rows'], dtype=np.int64)] = delta[key]
+            record[key] = values
+    return record
+
+
+def openChain(chain):
+    """
+    Open every file of a chain once, so the records of many meshes can be resolved without parsing
+    the files again.
+
+    Args:
+        chain: A file path, a list of file paths, or of SkinWeightReader, baseline first.
+
+    Returns: List of SkinWeightReader. Close them with closeChain().
+    """
+    if not isinstance(chain, (list, tuple)):
+        chain = [chain]
+    readers = []
+    try:
+        for item in chain:
+            readers.append(item if isinstance(item, SkinWeightReader) else SkinWeightReader(item))
+    except Exception:
+        closeChain([reader for reader, item in zip(readers, chain) if reader is not item])
+        raise
+    return readers
+
+
+def closeChain(readers):
+    """
+    Close the readers of openChain().
+    """
+    for reader in readers or []:
+        reader.close()
+
+
+@contextlib.contextmanager
+def _chainReaders(chain):
+    """
+    openChain() for the length of a with block. Readers passed in are left open.
+    """
+    if not isinstance(chain, (list, tuple)):
+        chain = [chain]
+    readers = openChain(chain)
+    try:
+        yield readers
+    finally:
+        closeChain([reader for reader, item in zip(readers, chain) if reader is not item])
+
+
+def resolveRecord(chain, name):
+    """
+    Resolve the record of a mesh through a chain of files: a baseline followed by deltas.
+
+    Args:
+        chain: A file path or a list of file paths, baseline first. Pass the readers of openChain()
+               when resolving several meshes.
+        name: Mesh name.
+
+    Returns: Full record. None if the baseline has no data for the mesh.
+    """
+    record = None
+    with _chainReaders(chain) as readers:
+        for reader in readers:
+            if name not in reader.names:
+                continue
+            current = reader.read(name)
+            if current.get('delta'):
+                if record is None:
+                    raise ValueError('Delta for "{}" in {} has no baseline.'.format(name, reader.path))
+                record = applyDelta(record, current)
+            else:
+                record = current
+    return record
+
+
+def collapseSkinWeights(chain, outputPath, fileFormat=None):
+    """
+    Collapse a baseline and its deltas into a new baseline file.
+
+    Args:
+        chain: A list of file paths, baseline first.
+        outputPath: The file path of the new baseline.
+        fileFormat: FORMAT_JSON or FORMAT_BINARY. Guessed from the path if not given.
+
+    Returns: List of mesh names written.
+    """
+    with _chainReaders(chain) as readers:
+        names = []
+        for reader in readers:
+            for name in reader.names:
+                if name not in names:
+                    names.append(name)
+        with SkinWeightWriter(outputPath, fileFormat=fileFormat) as writer:
+            for name in names:
+                record = resolveRecord(readers, name)
+                if record is not None:
+                    writer.write(name, record)
+    return writer.names
+
+
+class SkinWeights(object):
+    """
+    Skin weights of one mesh: CSR arrays (vertex offsets, influence indices, weights) and an influence name table.
+    Vertex ranges and renames are views sharing the arrays, other operations build new arrays.
+
+    Example:
+        weights = skinweights.SkinWeights.fromRecord(reader.read('body'))
+        head = weights.view(0, 5000).subset(['head', 'neck'])
+        weights = weights.merge(head.rename({'head': 'head_jnt'}))
+    """
+    __slots__ = ('offsets', 'indices', 'values', 'infs')
+
+    def __init__(self, offsets, indices, values, infs):
+        """
+        Args:
+            offsets: Vertex offsets, vertex count + 1 long.
+            indices: Influence index per weight.
+            values: Weight values.
+            infs: Influence names the indices refer to.
+        """
+        self.offsets = offsets
+        self.indices = indices
+        self.values = values
+        self.infs = list(infs)
+
+    @classmethod
+    def empty(cls, vertexCount, infs):
+        """
+        Weights of vertices without any influence.
+        """
+        return cls(np.zeros(vertexCount + 1, dtype=OFFSET_DTYPE), np.zeros(0, dtype='<u4'),
+                   np.zeros(0, dtype=VALUE_DTYPE), infs)
+
+    @classmethod
+    def fromRecord(cls, record):
+        """
+        Wrap the CSR arrays of a record without copying them.
+        """
+        return cls(record['offsets'], record['indices'], record['values'], record['infs'])
+
+    @classmethod
+    def fromLegacy(cls, weights, infs, vertexCount=None):
+        """
+        Args:
+            weights: Legacy nested weights {vertId: {infId: weight}}.
+            infs: Influence names.
+            vertexCount: Number of vertices. Defaults to the highest vertex id + 1.
+        """
+        return cls(*legacyToCsr(weights, vertexCount=vertexCount), infs=infs)
+
+    @classmethod
+    def fromDense(cls, dense, infs, threshold=0.0):
+        """
+        Args:
+            dense: (vertex, influence) array.
+            infs: Influence names of the columns.
+            threshold: Weights less than or equal to this are dropped.
+        """
+        return cls(*denseToCsr(dense, threshold=threshold), infs=infs)
+
+    @property
+    def vertexCount(self):
+        return len(self.offsets) - 1
+
+    def __len__(self):
+        return self.vertexCount
+
+    def __repr__(self):
+        return '{}({} vertices, {} weights, {} influences)'.format(
+            type(self).__name__, self.vertexCount, len(self.values), len(self.infs))
+
+    def __getitem__(self, key):
+        """
+        A contiguous slice is a view, other slices and vertex id arrays are copies.
+        An int returns the weights of one vertex as {influence name: weight}.
+        """
+        if isinstance(key, slice):
+            start, stop, step = key.indices(self.vertexCount)
+            if step == 1:
+                return self.view(start, max(start, stop))
+            return self.rows(np.arange(start, stop, step))
+        if np.ndim(key):
+            return self.rows(key)
+        vertId = int(key)
+        if vertId < 0:
+            vertId += self.vertexCount
+        start, end = int(self.offsets[vertId]), int(self.offsets[vertId + 1])
+        return dict((self.infs[i], float(w)) for i, w in zip(self.indices[start:end], self.values[start:end]))
+
+    def toRecord(self):
+        """
+        Returns: Record dict holding the arrays (not copied) and influence names.
+        """
+        return {'offsets': self.offsets, 'indices': self.indices, 'values': self.values, 'infs': list(self.infs)}
+
+    def toLegacy(self):
+        """
+        Returns: Legacy nested weights {vertId: {infId: weight}} with int keys.
+        """
+        return csrToLegacy(self.offsets, self.indices, self.values)
+
+    def toDense(self, rows=None, infs=None):
+        """
+        Args:
+            rows: Optional vertex ids to extract. Defaults to all vertices.
+            infs: Optional influence names of the dense columns. Defaults to self.infs.
+
+        Returns: Float64 (vertex, influence) numpy array.
+        """
+        if infs is None:
+            return csrToDense(self.offsets, self.indices, self.values, len(self.infs), rows=rows)
+        columns = alignInfluences(np.arange(len(self.infs)), self.infs, infs)
+        return csrToDense(self.offsets, self.indices, self.values, len(infs), rows=rows, columns=columns)
+
+    def view(self, start, stop):
+        """
+        Weights of a consecutive vertex range, sharing the arrays.
+        """
+        return SkinWeights(*csrSlice(self.offsets, self.indices, self.values, start, stop), infs=self.infs)
+
+    def rows(self, vertexIds):
+        """
+        Weights of a list of vertices, in the given order. Vertex ids can repeat.
+        """
+        return SkinWeights(*csrRows(self.offsets, self.indices, self.values, vertexIds), infs=self.infs)
+
+    def chunks(self, chunkSize):
+        """
+        Walk the vertices in consecutive views.
+
+        Returns: Generator of (first vertex id, SkinWeights).
+        """
+        for start in range(0, self.vertexCount, chunkSize):
+            yield start, self.view(start, min(start + chunkSize, self.vertexCount))
+
+    def subset(self, infs):
+        """
+        Weights on a list of influences. Weights of other influences are dropped.
+        Also used to reorder the influence table to match a skinCluster or another weight set.
+
+        Args:
+            infs: Influence names, in the new influence order.
+        """
+        cols = alignInfluences(self.indices, self.infs, infs)
+        offsets, indices, values = _filterCsr(self.offsets, cols, self.values, cols >= 0)
+        return SkinWeights(offsets, indices.astype('<u4'), values, infs)
+
+    def rename(self, mapping):
+        """
+        Rename influences, sharing the arrays.
+
+        Args:
+            mapping: {old name: new name}. Missing names are kept.
+        """
+        return SkinWeights(self.offsets, self.indices, self.values, [mapping.get(inf, inf) for inf in self.infs])
+
+    def mergeDuplicates(self):
+        """
+        Sum the weights of influences sharing a name, e.g. after rename() mapped two influences on one node.
+
+        Returns: New SkinWeights with unique influence names, in first seen order. Self if they are already unique.
+        """
+        infs = []
+        seen = set()
+        for inf in self.infs:
+            if inf not in seen:
+                seen.add(inf)
+                infs.append(inf)
+        if len(infs) == len(self.infs):
+            return self
+        keys = _rowIds(self.offsets) * len(infs) + alignInfluences(self.indices, self.infs, infs)
+        uniqueKeys, inverse = np.unique(keys, return_inverse=True)
+        summed = np.bincount(inverse, weights=np.asarray(self.values, dtype=np.float64))
+        offsets = np.zeros(self.vertexCount + 1, dtype=OFFSET_DTYPE)
+        np.cumsum(np.bincount(uniqueKeys // len(infs), minlength=self.vertexCount), out=offsets[1:])
+        return SkinWeights(offsets, (uniqueKeys % len(infs)).astype('<u4'), summed.astype(VALUE_DTYPE), infs)
+
+    def merge(self, other, rows=None):
+        """
+        Combine two weight sets. Influences are matched by name, new influences of other are appended.
+
+        Args:
+            other: SkinWeights.
+            rows: None to append the vertices of other after these vertices.
+                  Otherwise the vertex ids that the vertices of other replace.
+
+        Returns: New SkinWeights.
+        """
+        infs = self.infs + [inf for inf in other.infs if inf not in set(self.infs)]
+        otherIndices = alignInfluences(other.indices, other.infs, infs)
+        stacked = concatCsr([(self.offsets, self.indices, self.values),
+                             (other.offsets, otherIndices, other.values)])
+        if rows is None:
+            return SkinWeights(*stacked, infs=infs)
+        sources = np.arange(self.vertexCount)
+        sources[np.asarray(rows, dtype=np.int64)] = self.vertexCount + np.arange(other.vertexCount)
+        return SkinWeights(*csrRows(*stacked, rows=sources), infs=infs)
+
+
+def recordFromLegacy(meshData):
+    """
+    Convert one mesh entry of a legacy json file to a record.
+
+    Args:
+        meshData: {'weights': {}, 'infs': [], 'skinCluster': '', 'nw': 0}
+
+    Returns: Record dict with the nested weights replaced by CSR arrays, and blendWeights as a float array.
+    """
+    record = dict((k, v) for k, v in meshData.items() if k != 'weights')
+    weights = meshData['weights']
+    vertexCount = None
+    if meshData.get('delta'):
+        # deltas are keyed by vertex id, stored compact as rows
+        byId = dict((int(v), w) for v, w in weights.items())
+        rows = sorted(byId)
+        weights = dict((i, byId[v]) for i, v in enumerate(rows))
+        vertexCount = len(rows)
+        record['rows'] = np.array(rows, dtype='<i4')
+    record.update(SkinWeights.fromLegacy(weights, meshData['infs'], vertexCount=vertexCount).toRecord())
+    for key in VERTEX_KEYS:
+        if key in record:
+            record[key] = np.array(record[key], dtype=VALUE_DTYPE)
+    return record
+
+
+def recordToLegacy(record):
+    """
+    Convert a record to one mesh entry of a legacy json file.
+
+    Args:
+        record: Record dict holding CSR arrays.
+
+    Returns: {'weights': {}, 'infs': [], 'skinCluster': '', 'nw': 0}
+    """
+    meshData = {}
+    for key, value in record.items():
+        if key in CSR_KEYS or key == 'rows':
+            continue
+        if isinstance(value, np.ndarray):
+            value = value.tolist()
+        meshData[key] = value
+    weights = SkinWeights.fromRecord(record).toLegacy()
+    if record.get('delta'):
+        rows = np.asarray(record['rows']).tolist()
+        weights = dict((rows[i], w) for i, w in weights.items())
+    meshData['weights'] = weights
+    return meshData
+
+
+def _pad(size):
+    return (-size) % ALIGN
+
+
+def _writeBlock(outfile, name, record):
+    """
+    Write one mesh block of the binary format.
+
+    Args:
+        outfile: File object opened in binary mode.
+        name: Mesh name.
+        record: Record dict. Numpy arrays are stored as arrays, everything else goes to the json meta.
+
+    Returns: The block meta.
+    """
+    arrays = []
+    meta = {'name': name, 'arrays': []}
+    for key, value in sorted(record.items()):
+        if isinstance(value, np.ndarray):
+            if key == 'offsets':
+                dtype = OFFSET_DTYPE
+            elif key == 'indices':
+                dtype = indexDtype(len(record['infs']))
+            elif key == 'values':
+                dtype = VALUE_DTYPE
+            else:
+                dtype = value.dtype.newbyteorder('<').str
+            value = np.ascontiguousarray(value, dtype=dtype)
+            arrays.append(value)
+            meta['arrays'].append([key, dtype, list(value.shape)])
+        else:
+            meta[key] = value
+
+    metaBytes = json.dumps(meta, sort_keys=True).encode('utf-8')
+    outfile.write(BLOCK.pack(len(metaBytes)))
+    outfile.write(metaBytes)
+    outfile.write(b'\0' * _pad(BLOCK.size + len(metaBytes)))
+    for array in arrays:
+        data = array.tobytes()
+        outfile.write(data)
+        outfile.write(b'\0' * _pad(len(data)))
+    return meta
+
+
+def _readMeta(buf, pos):
+    """
+    Read the json meta of a block of the binary format.
+
+    Args:
+        buf: A buffer (mmap) of the whole file.
+        pos: Byte position of the block.
+
+    Returns: (meta, position of the first array)
+    """
+    metaLength = BLOCK.unpack_from(buf, pos)[0]
+    pos += BLOCK.size
+    meta = json.loads(buf[pos:pos + metaLength].decode('utf-8'))
+    pos += metaLength
+    pos += _pad(pos)
+    return meta, pos
+
+
+def _blockEnd(meta, pos):
+    """
+    Byte position after the arrays of a block.
+
+    Args:
+        meta: The block meta.
+        pos: Position of the first array.
+
+    Returns: End position of the block.
+    """
+    for key, dtype, shape in meta['arrays']:
+        nbytes = int(np.prod(shape)) * np.dtype(dtype).itemsize
+        pos += nbytes + _pad(nbytes)
+    return pos
+
+
+def _indexEntry(meta, offset, length):
+    """
+    Build the index entry of a block.
+
+    Args:
+        meta: The block meta.
+        offset: Byte position of the block.
+        length: Byte length of the block.
+
+    Returns: Dict of the block meta without the array layout, plus offset, length, vertexCount and infCount.
+    """
+    entry = dict((k, v) for k, v in meta.items() if k != 'arrays')
+    shapes = dict((key, shape) for key, dtype, shape in meta['arrays'])
+    entry['offset'] = offset
+    entry['length'] = length
+    entry['vertexCount'] = meta.get('vertexCount', shapes['offsets'][0] - 1)
+    entry['infCount'] = len(meta['infs'])
+    return entry
+
+
+def _readBlock(buf, pos):
+    """
+    Read one mesh block of the binary format.
+
+    Args:
+        buf: A buffer (mmap) of the whole file.
+        pos: Byte position of the block.
+
+    Returns: (name, record, end position). Arrays are read-only views into buf.
+    """
+    meta, pos = _readMeta(buf, pos)
+    name = meta.pop('name')
+    record = meta
+    for key, dtype, shape in meta.pop('arrays'):
+        count = int(np.prod(shape))
+        array = np.frombuffer(buf, dtype=dtype, count=count, offset=pos)
+        record[key] = array.reshape(shape)
+        pos += array.nbytes
+        pos += _pad(array.nbytes)
+    return name, record, pos
+
+
+class SkinWeightWriter(object):
+    """
+    Stream skin weight records to a file one mesh at a time.
+    Each record is serialized as soon as it is written, so the caller can release it right away.
+
+    Example:
+        with skinweights.SkinWeightWriter(path) as writer:
+            for mesh in meshes:
+                writer.write(mesh, record)
+    """
+
+    def __init__(self, path, fileFormat=None):
+        """
+        Args:
+            path: The file path to write.
+            fileFormat: FORMAT_JSON or FORMAT_BINARY. Guessed from the path if not given.
+        """
+        if not fileFormat:
+            fileFormat = formatFromPath(path)
+        if fileFormat not in (FORMAT_JSON, FORMAT_BINARY):
+            raise ValueError('Unknown skin weight format: {}'.format(fileFormat))
+        self.path = path
+        self.fileFormat = fileFormat
+        self.names = []
+        self.index = []
+        self._file = None
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def open(self):
+        if self.fileFormat == FORMAT_BINARY:
+            self._file = open(self.path, 'wb')
+            self._file.write(HEADER.pack(MAGIC, VERSION))
+            # patched with the index position on close
+            self._file.write(INDEX_POINTER.pack(0, 0))
+        else:
+            self._file = open(self.path, 'w')
+            self._file.write('{')
+
+    def write(self, name, record):
+        """
+        Serialize the record of one mesh.
+
+        Args:
+            name: Mesh name.
+            record: Record dict holding CSR arrays.
+        """
+        if name in self.names:
+            raise ValueError('Mesh "{}" is already written to {}'.format(name, self.path))
+        if self.fileFormat == FORMAT_BINARY:
+            offset = self._file.tell()
+            meta = _writeBlock(self._file, name, record)
+            self.index.append(_indexEntry(meta, offset, self._file.tell() - offset))
+        else:
+            # one top level key of the legacy json dict, indented as json.dump(indent=4) would
+            text = json.dumps(recordToLegacy(record), sort_keys=True, indent=4)
+            if self.names:
+                self._file.write(',')
+            self._file.write('\n    {}: {}'.format(json.dumps(name), text.replace('\n', '\n    ')))
+        self.names.append(name)
+
+    def close(self):
+        if not self._file:
+            return
+        if self.fileFormat == FORMAT_JSON:
+            self._file.write('\n}' if self.names else '}')
+        else:
+            indexBytes = json.dumps(self.index, sort_keys=True).encode('utf-8')
+            indexOffset = self._file.tell()
+            self._file.write(indexBytes)
+            self._file.seek(HEADER.size)
+            self._file.write(INDEX_POINTER.pack(indexOffset, len(indexBytes)))
+        self._file.close()
+        self._file = None
+
+
+def writeSkinWeights(path, data, fileFormat=None):
+    """
+    Write skin weight records to a file.
+
+    Args:
+        path: The file path to write.
+        data: {mesh: record}
+        fileFormat: FORMAT_JSON or FORMAT_BINARY. Guessed from the path if not given.
+
+    Returns: The format written.
+    """
+    with SkinWeightWriter(path, fileFormat=fileFormat) as writer:
+        for name in sorted(data):
+            writer.write(name, data[name])
+    return writer.fileFormat
+
+
+class SkinWeightReader(object):
+    """
+    Random access to the meshes of a skin weight file.
+    Binary files are indexed through the header, so listing the content or loading one mesh
+    doesn't touch the weights of any other mesh. Legacy json files are parsed once on open.
+
+    Binary files stay mapped, and locked on Windows, until the reader is closed.
+
+    Example:
+        with skinweights.SkinWeightReader(path) as reader:
+            vertexCounts = [reader.info(name)['vertexCount'] for name in reader.names]
+            record = reader.read(reader.names[0])
+    """
+
+    def __init__(self, path):
+        """
+        Args:
+            path: The file path to read.
+        """
+        self.path = path
+        self.fileFormat = detectFormat(path)
+        self.names = []
+        self._index = {}
+        self._legacy = None
+        self._buf = None
+        self.closed = False
+        if self.fileFormat == FORMAT_JSON:
+            self._openJson()
+        else:
+            self._openBinary()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, excType, excValue, traceback):
+        self.close()
+
+    def close(self):
+        """
+        Release the file. Records already read from a binary file view the memory map, which then closes
+        with the last of them, copy their arrays to keep them around without holding the file.
+        """
+        buf, self._buf = self._buf, None
+        self._legacy = None
+        self.closed = True
+        # closing the map under live arrays raises on python 3 and crashes on python 2,
+        # only close it when this is the last reference
+        if buf is not None and sys.getrefcount(buf) <= 2:
+            buf.close()
+
+    def _openJson(self):
+        with open(self.path) as infile:
+            self._legacy = json.load(infile)
+        for name in sorted(self._legacy):
+            meshData = self._legacy[name]
+            entry = dict((k, v) for k, v in meshData.items() if k != 'weights')
+            weights = meshData['weights']
+            if 'vertexCount' not in entry:
+                entry['vertexCount'] = max(int(v) for v in weights) + 1 if weights else 0
+            entry['infCount'] = len(meshData['infs'])
+            self._add(name, entry)
+
+    def _openBinary(self):
+        with open(self.path, 'rb') as infile:
+            self._buf = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version = HEADER.unpack_from(self._buf, 0)
+        if version > VERSION:
+            raise ValueError('Unsupported skin weight file version {} in {}'.format(version, self.path))
+
+        if version >= 2:
+            indexOffset, indexLength = INDEX_POINTER.unpack_from(self._buf, HEADER.size)
+            if not indexOffset:
+                raise ValueError('Skin weight file {} was not closed properly, index is missing'.format(self.path))
+            index = json.loads(self._buf[indexOffset:indexOffset + indexLength].decode('utf-8'))
+            for entry in index:
+                self._add(entry.pop('name'), entry)
+            return
+
+        # no index, scan the block metas
+        pos = HEADER.size
+        while pos < len(self._buf):
+            meta, arrayPos = _readMeta(self._buf, pos)
+            end = _blockEnd(meta, arrayPos)
+            entry = _indexEntry(meta, pos, end - pos)
+            self._add(entry.pop('name'), entry)
+            pos = end
+
+    def _add(self, name, entry):
+        self.names.append(name)
+        self._index[name] = entry
+
+    def info(self, name):
+        """
+        Metadata of one mesh, without loading its weights.
+
+        Args:
+            name: Mesh name.
+
+        Returns: Dict with infs, skinCluster, nw, vertexCount, infCount and, for binary files, offset and length.
+        """
+        return dict(self._index[name])
+
+    def read(self, name):
+        """
+        Load the record of one mesh.
+
+        Args:
+            name: Mesh name.
+
+        Returns: Record dict. Binary arrays are memory mapped.
+        """
+        if self.closed:
+            raise ValueError('Skin weight file {} is closed'.format(self.path))
+        if name not in self._index:
+            raise KeyError('Mesh "{}" is not in {}'.format(name, self.path))
+        if self._legacy is not None:
+            return recordFromLegacy(self._legacy[name])
+        readName, record, _ = _readBlock(self._buf, self._index[name]['offset'])
+        return record
+
+
+def readSkinWeightInfo(path):
+    """
+    List the content of a skin weight file without loading any weights (binary files).
+
+    Args:
+        path: The file path to read.
+
+    Returns: {mesh: info dict}. See SkinWeightReader.info().
+    """
+    with SkinWeightReader(path) as reader:
+        return dict((name, reader.info(name)) for name in reader.names)
+
+
+def readSkinWeights(path, meshes=None):
+    """
+    Read skin weight records from a file of any supported format.
+
+    Args:
+        path: The file path to read.
+        meshes: Optional list of mesh names to load. Other meshes are skipped. Defaults to all meshes.
+
+    Returns: {mesh: record}. Binary arrays are memory mapped, the file is released with the last of them.
+    """
+    with SkinWeightReader(path) as reader:
+        if meshes is None:
+            meshes = reader.names
+        return dict((name, reader.read(name)) for name in meshes)
+
+
+class Snapshot(object):
+    """
+    Compact in-memory copy of the weights of one mesh.
+    Weight counts per vertex replace the offsets, and indices and values use the smallest dtypes.
+    """
+    __slots__ = ('label', 'time', 'counts', 'indices', 'values', 'meta')
+
+    def __init__(self, record, label=None):
+        """
+        Args:
+            record: Record dict holding CSR arrays. Arrays are copied.
+            label: Optional name of the snapshot.
+        """
+        counts = np.diff(np.asarray(record['offsets'], dtype=np.int64))
+        maxCount = int(counts.max()) if len(counts) else 0
+        self.label = label
+        self.time = time.time()
+        self.counts = counts.astype('<u1' if maxCount <= 0xFF else indexDtype(maxCount))
+        self.indices = np.array(record['indices'], dtype=indexDtype(len(record['infs'])))
+        self.values = np.array(record['values'], dtype=VALUE_DTYPE)
+        self.meta = {}
+        for key, value in record.items():
+            if key in CSR_KEYS:
+                continue
+            self.meta[key] = np.array(value) if isinstance(value, np.ndarray) else value
+
+    @property
+    def nbytes(self):
+        arrays = [self.counts, self.indices, self.values]
+        arrays += [value for value in self.meta.values() if isinstance(value, np.ndarray)]
+        return sum(array.nbytes for array in arrays)
+
+    def record(self):
+        """
+        Returns: A new record dict.
+        """
+        record = dict(self.meta)
+        record['offsets'] = np.zeros(len(self.counts) + 1, dtype=OFFSET_DTYPE)
+        np.cumsum(self.counts, out=record['offsets'][1:])
+        record['indices'] = self.indices.astype('<u4')
+        record['values'] = self.values
+        return record
+
+
+class SnapshotStore(object):
+    """
+    In-session checkpoints of skin weights.
+    Every mesh keeps a ring of its last maxCount snapshots. When the store grows over maxBytes,
+    the oldest snapshots of the least recently used meshes are evicted first.
+
+    Example:
+        store = skinweights.SnapshotStore()
+        store.add('body', record, label='before smoothing')
+        record = store.get('body', 'before smoothing')
+    """
+
+    def __init__(self, maxCount=SNAPSHOT_COUNT, maxBytes=SNAPSHOT_BYTES):
+        """
+        Args:
+            maxCount: Maximum number of snapshots per mesh.
+            maxBytes: Maximum memory used by all snapshots.
+        """
+        self.maxCount = maxCount
+        self.maxBytes = maxBytes
+        # mesh: deque of snapshots, oldest first. Meshes are ordered least recently used first.
+        self._rings = collections.OrderedDict()
+
+    def _touch(self, mesh):
+        ring = self._rings.pop(mesh)
+        self._rings[mesh] = ring
+        return ring
+
+    def _find(self, mesh, which):
+        ring = self._rings.get(mesh)
+        if not ring:
+            raise KeyError('No snapshot of "{}"'.format(mesh))
+        if isinstance(which, int):
+            return ring[which]
+        for snapshot in reversed(ring):
+            if snapshot.label == which:
+                return snapshot
+        raise KeyError('No snapshot "{}" of "{}"'.format(which, mesh))
+
+    def add(self, mesh, record, label=None):
+        """
+        Take a snapshot. The oldest snapshot of the mesh is dropped when its ring is full.
+
+        Args:
+            mesh: Mesh name.
+            record: Record dict holding CSR arrays.
+            label: Optional name of the snapshot.
+
+        Returns: The Snapshot.
+        """
+        snapshot = Snapshot(record, label=label)
+        if mesh not in self._rings:
+            self._rings[mesh] = collections.deque(maxlen=self.maxCount)
+        self._touch(mesh).append(snapshot)
+        self.evict(keep=snapshot)
+        return snapshot
+
+    def get(self, mesh, which=-1):
+        """
+        Record of a snapshot.
+
+        Args:
+            mesh: Mesh name.
+            which: Snapshot index in the ring (-1 for the latest), or label.
+
+        Returns: Record dict.
+        """
+        snapshot = self._find(mesh, which)
+        self._touch(mesh)
+        return snapshot.record()
+
+    def snapshots(self, mesh):
+        """
+        Returns: List of (label, time, bytes) of the snapshots of a mesh, oldest first.
+        """
+        return [(snapshot.label, snapshot.time, snapshot.nbytes) for snapshot in self._rings.get(mesh, [])]
+
+    def meshes(self):
+        """
+        Returns: Names of the meshes with snapshots, least recently used first.
+        """
+        return list(self._rings)
+
+    def remove(self, mesh, which=None):
+        """
+        Remove one snapshot, or every snapshot of a mesh.
+
+        Args:
+            mesh: Mesh name.
+            which: Snapshot index or label. None to remove all snapshots of the mesh.
+        """
+        if which is None:
+            self._rings.pop(mesh, None)
+            return
+        ring = self._rings[mesh]
+        ring.remove(self._find(mesh, which))
+        if not ring:
+            self._rings.pop(mesh)
+
+    def clear(self):
+        self._rings.clear()
+
+    def usage(self):
+        """
+        Memory used by the snapshots.
+
+        Returns: {mesh: bytes}
+        """
+        return dict((mesh, sum(snapshot.nbytes for snapshot in ring)) for mesh, ring in self._rings.items())
+
+    @property
+    def nbytes(self):
+        return sum(self.usage().values())
+
+    def evict(self, keep=None):
+        """
+        Drop the oldest snapshots of the least recently used meshes until the store fits in maxBytes.
+
+        Args:
+            keep: A snapshot never to evict, e.g. the one just taken.
+
+        Returns: Number of evicted snapshots.
+        """
+        usage = self.usage()
+        total = sum(usage.values())
+        evicted = 0
+        for mesh in list(self._rings):
+            ring = self._rings[mesh]
+            while total > self.maxBytes and ring and ring[0] is not keep:
+                snapshot = ring.popleft()
+                total -= snapshot.nbytes
+                evicted += 1
+            if not ring:
+                self._rings.pop(mesh)
+            if total <= self.maxBytes:
+                break
+        return evicted
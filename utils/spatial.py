@@ -0,0 +1,665 @@
+"""
+Spatial search structures for vertex correspondence and closest point queries.
+
+Pure numpy, queries are vectorized over chunks of points.
+"""
+import numpy as np
+import log
+
+LOG = log.get_logger(__name__)
+# CONSTANTS
+CHUNK_SIZE = 65536
+MAX_RING = 4
+LEAF_SIZE = 8
+BVH_CHUNK = 8192
+MORTON_BITS = 10
+
+
+def _cube(radius):
+    """
+    Cell ranges covering every cell up to Chebyshev distance radius.
+
+    Args:
+        radius: Radius in cells.
+
+    Returns: List of (dx, dy, first dz, last dz). Cells along z are contiguous in the grid order.
+    """
+    r = range(-radius, radius + 1)
+    return [(dx, dy, -radius, radius) for dx in r for dy in r]
+
+
+def _shell(radius):
+    """
+    Cell ranges covering the cells at exactly Chebyshev distance radius.
+
+    Args:
+        radius: Radius in cells.
+
+    Returns: List of (dx, dy, first dz, last dz).
+    """
+    ranges = []
+    for dx in range(-radius, radius + 1):
+        for dy in range(-radius, radius + 1):
+            if max(abs(dx), abs(dy)) == radius:
+                ranges.append((dx, dy, -radius, radius))
+            else:
+                ranges.append((dx, dy, -radius, -radius))
+                ranges.append((dx, dy, radius, radius))
+    return ranges
+
+
+def _argminPerRun(values, counts):
+    """
+    Position of the smallest value of each run of consecutive values.
+
+    Args:
+        values: Values, grouped in runs.
+        counts: Length of every run. Runs can be empty.
+
+    Returns: (ids of the non empty runs, index of their smallest value)
+    """
+    # NaN never compares equal to the minimum, rank it last instead
+    values = np.where(np.isnan(values), np.inf, values)
+    runs = np.flatnonzero(counts)
+    runCounts = counts[runs]
+    starts = np.cumsum(runCounts) - runCounts
+    minimum = np.repeat(np.minimum.reduceat(values, starts), runCounts)
+    hits = np.flatnonzero(values == minimum)
+    # keep the first hit of every run
+    hitRuns = np.repeat(np.arange(len(runs)), runCounts)[hits]
+    first = np.ones(len(hits), dtype=bool)
+    first[1:] = hitRuns[1:] != hitRuns[:-1]
+    return runs, hits[first]
+
+
+class UniformGrid(object):
+    """
+    Uniform grid over a point cloud for nearest point queries.
+    Queries are searched in rings of cells around them. Queries still unresolved after MAX_RING rings,
+    far from the points, are handled by a PointTree built on first use.
+
+    Example:
+        grid = spatial.UniformGrid(sourcePoints)
+        nearest, distances = grid.query(targetPoints)
+    """
+
+    def __init__(self, points, occupancy=1):
+        """
+        Args:
+            points: (n, 3) array of points.
+            occupancy: Average number of points per occupied cell to aim for.
+        """
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        if not len(self.points):
+            raise ValueError('Can not build a grid without points.')
+        self.origin = self.points.min(axis=0)
+        extent = max((self.points.max(axis=0) - self.origin).max(), 1e-9)
+
+        # mesh vertices lie on a surface, so a volume based estimate gives cells that are too big.
+        # refine the cell size from the actual occupancy instead.
+        count = len(self.points)
+        self.cellSize = extent / max(count / float(occupancy), 1.0) ** (1.0 / 3.0)
+        for _ in range(3):
+            cells = self._cells(self.points)
+            occupied = len(np.unique(self._keys(cells, cells.max(axis=0) + 1)))
+            ratio = occupancy / (count / float(occupied))
+            if 0.5 < ratio < 2.0:
+                break
+            self.cellSize *= ratio ** 0.5
+
+        cells = self._cells(self.points)
+        self.dims = cells.max(axis=0) + 1
+        keys = self._keys(cells, self.dims)
+        self.order = np.argsort(keys, kind='mergesort')
+        self.sortedKeys = keys[self.order]
+        self.tree = None
+
+    def _cells(self, points):
+        return np.floor((points - self.origin) / self.cellSize).astype(np.int64)
+
+    @staticmethod
+    def _keys(cells, dims):
+        return (cells[:, 0] * dims[1] + cells[:, 1]) * dims[2] + cells[:, 2]
+
+    def _lookup(self, cells, dz0, dz1):
+        """
+        Find the points stored in a run of cells along z.
+
+        Args:
+            cells: (n, 3) int array of cell coordinates.
+            dz0: First z offset of the run.
+            dz1: Last z offset of the run.
+
+        Returns: (start, count) into self.order per cell. Count is 0 for empty or out of range cells.
+        """
+        z0 = np.maximum(cells[:, 2] + dz0, 0)
+        z1 = np.minimum(cells[:, 2] + dz1, self.dims[2] - 1)
+        valid = (np.all((cells[:, :2] >= 0) & (cells[:, :2] < self.dims[:2]), axis=1) & (z0 <= z1))
+        base = (cells[:, 0] * self.dims[1] + cells[:, 1]) * self.dims[2]
+        starts = np.searchsorted(self.sortedKeys, base + z0, side='left')
+        ends = np.searchsorted(self.sortedKeys, base + z1, side='right')
+        return starts, np.where(valid, ends - starts, 0)
+
+    def _search(self, queries, queryCells, ranges, best, bestDist):
+        """
+        Update the nearest point of queries with the points of the cells in ranges.
+        """
+        for dx, dy, dz0, dz1 in ranges:
+            starts, counts = self._lookup(queryCells + (dx, dy, 0), dz0, dz1)
+            total = counts.sum()
+            if not total:
+                continue
+            queryIds = np.repeat(np.arange(len(queries)), counts)
+            ramp = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            candidates = self.order[np.repeat(starts, counts) + ramp]
+            dist = ((self.points[candidates] - queries[queryIds]) ** 2).sum(axis=1)
+            groups, first = _argminPerRun(dist, counts)
+            better = dist[first] < bestDist[groups]
+            best[groups[better]] = candidates[first[better]]
+            bestDist[groups[better]] = dist[first[better]]
+
+    def _queryChunk(self, queries):
+        best = np.full(len(queries), -1, dtype=np.int64)
+        bestDist = np.full(len(queries), np.inf)
+        queryCells = self._cells(queries)
+        self._search(queries, queryCells, _cube(1), best, bestDist)
+
+        # a point in a ring further out is at least radius * cellSize away
+        pending = np.flatnonzero(bestDist > self.cellSize ** 2)
+        radius = 2
+        while len(pending) and radius <= MAX_RING:
+            subBest, subDist = best[pending], bestDist[pending]
+            self._search(queries[pending], queryCells[pending], _shell(radius), subBest, subDist)
+            best[pending], bestDist[pending] = subBest, subDist
+            pending = pending[subDist > (radius * self.cellSize) ** 2]
+            radius += 1
+
+        # far away queries, walk a point tree bounded by what the rings found
+        if len(pending):
+            if self.tree is None:
+                self.tree = PointTree(self.points)
+            subBest, subDist = self.tree.query(queries[pending], bound=bestDist[pending])
+            better = subDist < bestDist[pending]
+            best[pending[better]] = subBest[better]
+            bestDist[pending[better]] = subDist[better]
+        return best, bestDist
+
+    def query(self, queries, chunkSize=CHUNK_SIZE):
+        """
+        Find the nearest stored point of every query point.
+
+        Args:
+            queries: (n, 3) array of points.
+            chunkSize: Number of queries processed at once.
+
+        Returns: (indices, distances) numpy arrays.
+        """
+        queries = np.asarray(queries, dtype=np.float64).reshape(-1, 3)
+        indices = np.zeros(len(queries), dtype=np.int64)
+        distances = np.zeros(len(queries), dtype=np.float64)
+        # process queries in grid order so neighbouring queries hit the same memory
+        cells = np.clip(self._cells(queries), -1, self.dims)
+        order = np.argsort(self._keys(cells + 1, self.dims + 2), kind='mergesort')
+        for start in range(0, len(queries), chunkSize):
+            chunk = order[start:start + chunkSize]
+            best, bestDist = self._queryChunk(queries[chunk])
+            indices[chunk] = best
+            distances[chunk] = np.sqrt(bestDist)
+        return indices, distances
+
+
+def _closestPointOnEdges(points, a, b, c):
+    """
+    Closest point on the three edges of triangles, vectorized over rows. Exact for degenerate triangles,
+    where every point of the triangle lies on an edge. Zero length edges are measured as points.
+
+    Returns: (closest points, barycentric coordinates) as (n, 3) arrays.
+    """
+    corners = (a, b, c)
+    closest = np.zeros_like(points)
+    bary = np.zeros((len(points), 3))
+    best = np.full(len(points), np.inf)
+    for i in range(3):
+        j = (i + 1) % 3
+        start, edge = corners[i], corners[j] - corners[i]
+        lengthSq = (edge * edge).sum(axis=1)
+        along = (edge * (points - start)).sum(axis=1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.clip(np.where(lengthSq > 0, along / lengthSq, 0.0), 0.0, 1.0)
+        onEdge = start + edge * t[:, None]
+        distSq = ((onEdge - points) ** 2).sum(axis=1)
+        better = distSq < best
+        best[better] = distSq[better]
+        closest[better] = onEdge[better]
+        bary[better] = 0.0
+        bary[better, i] = 1.0 - t[better]
+        bary[better, j] = t[better]
+    return closest, bary
+
+
+def closestPointOnTriangles(points, a, b, c):
+    """
+    Closest point on triangles, vectorized over rows.
+    Degenerate triangles (collapsed edge or collinear corners) are measured on their edges.
+
+    Args:
+        points: (n, 3) query points.
+        a: (n, 3) first triangle corners.
+        b: (n, 3) second triangle corners.
+        c: (n, 3) third triangle corners.
+
+    Returns: (closest points, barycentric coordinates) as (n, 3) arrays.
+    """
+    ab, ac, ap = b - a, c - a, points - a
+    d1 = (ab * ap).sum(axis=1)
+    d2 = (ac * ap).sum(axis=1)
+    bp = points - b
+    d3 = (ab * bp).sum(axis=1)
+    d4 = (ac * bp).sum(axis=1)
+    cp = points - c
+    d5 = (ab * cp).sum(axis=1)
+    d6 = (ac * cp).sum(axis=1)
+    va = d3 * d6 - d5 * d4
+    vb = d5 * d2 - d1 * d6
+    vc = d1 * d4 - d3 * d2
+
+    # interior by default, regions are resolved from the most to the least specific
+    with np.errstate(divide='ignore', invalid='ignore'):
+        denom = va + vb + vc
+        v = np.where(denom != 0, vb / denom, 0.0)
+        w = np.where(denom != 0, vc / denom, 0.0)
+        u = 1.0 - v - w
+        bary = np.stack([u, v, w], axis=1)
+
+        def region(mask, u, v, w):
+            bary[mask] = np.stack([u, v, w], axis=1)[mask]
+
+        zero = np.zeros(len(points))
+        one = np.ones(len(points))
+        # edge bc
+        t = (d4 - d3) / ((d4 - d3) + (d5 - d6))
+        region((va <= 0) & (d4 - d3 >= 0) & (d5 - d6 >= 0), zero, 1 - t, t)
+        # edge ac
+        t = d2 / (d2 - d6)
+        region((vb <= 0) & (d2 >= 0) & (d6 <= 0), 1 - t, zero, t)
+        # edge ab
+        t = d1 / (d1 - d3)
+        region((vc <= 0) & (d1 >= 0) & (d3 <= 0), 1 - t, t, zero)
+        # vertices
+        region((d6 >= 0) & (d5 <= d6), zero, zero, one)
+        region((d3 >= 0) & (d4 <= d3), zero, one, zero)
+        region((d1 <= 0) & (d2 <= 0), one, zero, zero)
+
+    closest = a * bary[:, 0:1] + b * bary[:, 1:2] + c * bary[:, 2:3]
+
+    # the region divisions are meaningless without area, use the closest edge instead
+    normal = np.cross(ab, ac)
+    areaSq = (normal * normal).sum(axis=1)
+    flat = areaSq <= 1e-24 * (ab * ab).sum(axis=1) * (ac * ac).sum(axis=1)
+    degenerate = flat | ~np.isfinite(bary).all(axis=1)
+    if degenerate.any():
+        closest[degenerate], bary[degenerate] = _closestPointOnEdges(
+            points[degenerate], a[degenerate], b[degenerate], c[degenerate])
+    return closest, bary
+
+
+def segmentDistances(points, starts, ends):
+    """
+    Distance of every point to every segment.
+    Expanded into dot products so the work is done by matrix products, without (n, s, 3) temporaries.
+
+    Args:
+        points: (n, 3) query points.
+        starts: (s, 3) segment starts.
+        ends: (s, 3) segment ends. A segment can be degenerate (start == end) to measure the distance to a point.
+
+    Returns: (n, s) array of distances.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    starts = np.asarray(starts, dtype=np.float64)
+    axes = np.asarray(ends, dtype=np.float64) - starts
+    lengths = (axes * axes).sum(axis=1)
+
+    # squared distance to the segment starts, and projection on the segment axes
+    startSq = (points * points).sum(axis=1)[:, None] - 2.0 * points.dot(starts.T) + (starts * starts).sum(axis=1)
+    along = points.dot(axes.T) - (starts * axes).sum(axis=1)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.clip(np.where(lengths > 0, along / lengths, 0.0), 0.0, 1.0)
+    distSq = startSq - 2.0 * t * along + t * t * lengths
+    return np.sqrt(np.maximum(distSq, 0.0))
+
+
+def vertexTriangles(triangles, vertexCount):
+    """
+    Triangles incident to every vertex, as CSR arrays.
+
+    Args:
+        triangles: (m, 3) vertex ids.
+        vertexCount: Number of vertices.
+
+    Returns: (offsets, triangle ids)
+    """
+    flat = np.asarray(triangles, dtype=np.int64).ravel()
+    order = np.argsort(flat, kind='mergesort')
+    offsets = np.zeros(vertexCount + 1, dtype=np.int64)
+    np.cumsum(np.bincount(flat, minlength=vertexCount), out=offsets[1:])
+    return offsets, order // 3
+
+
+def _closestAroundVertices(points, queries, triangles, nearest, triOffsets, triIds, chunkSize):
+    """
+    Closest point of every query on the triangles incident to its nearest vertex.
+
+    Returns: (triangle ids, barycentric coordinates). -1 and zeros for queries whose vertex has no triangle.
+    """
+    faceIds = np.full(len(queries), -1, dtype=np.int64)
+    barys = np.zeros((len(queries), 3))
+    for start in range(0, len(queries), chunkSize):
+        chunk = np.arange(start, min(start + chunkSize, len(queries)))
+        starts = triOffsets[nearest[chunk]]
+        counts = triOffsets[nearest[chunk] + 1] - starts
+        queryIds = np.repeat(np.arange(len(chunk)), counts)
+        ramp = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        candidates = triIds[np.repeat(starts, counts) + ramp]
+        corners = points[triangles[candidates]]
+        qp = queries[chunk][queryIds]
+        closest, bary = closestPointOnTriangles(qp, corners[:, 0], corners[:, 1], corners[:, 2])
+        dist = ((closest - qp) ** 2).sum(axis=1)
+        groups, first = _argminPerRun(dist, counts)
+        faceIds[chunk[groups]] = candidates[first]
+        barys[chunk[groups]] = bary[first]
+    return faceIds, barys
+
+
+def closestPointOnMesh(points, queries, triangles, grid=None, chunkSize=CHUNK_SIZE):
+    """
+    Closest point on a triangle mesh, searched on the triangles around the nearest vertex.
+    Queries nearest to a vertex without triangles are searched around the nearest vertex that has some.
+
+    Args:
+        points: (n, 3) mesh vertex positions.
+        queries: (q, 3) query points.
+        triangles: (m, 3) vertex ids.
+        grid: Optional UniformGrid of points, to reuse between calls.
+        chunkSize: Number of queries processed at once.
+
+    Returns: (triangle ids, barycentric coordinates) of the closest point of every query.
+    """
+    points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+    queries = np.asarray(queries, dtype=np.float64).reshape(-1, 3)
+    triangles = np.asarray(triangles, dtype=np.int64).reshape(-1, 3)
+    if not len(triangles):
+        raise ValueError('Unable to find closest points on a mesh without triangles.')
+    if grid is None:
+        grid = UniformGrid(points)
+    nearest, _ = grid.query(queries, chunkSize=chunkSize)
+    triOffsets, triIds = vertexTriangles(triangles, len(points))
+    faceIds, barys = _closestAroundVertices(points, queries, triangles, nearest, triOffsets, triIds, chunkSize)
+
+    # stray vertices belong to no triangle, search around the vertices that do
+    missing = np.flatnonzero(faceIds < 0)
+    if len(missing):
+        used = np.flatnonzero(np.diff(triOffsets))
+        usedNearest, _ = UniformGrid(points[used]).query(queries[missing], chunkSize=chunkSize)
+        faceIds[missing], barys[missing] = _closestAroundVertices(
+            points, queries[missing], triangles, used[usedNearest], triOffsets, triIds, chunkSize)
+    return faceIds, barys
+
+
+def _mortonCodes(centers):
+    """
+    Interleave the quantized coordinates of points into Morton codes, so sorting the codes keeps
+    nearby points together.
+    """
+    low, high = centers.min(axis=0), centers.max(axis=0)
+    scale = ((1 << MORTON_BITS) - 1) / np.maximum(high - low, 1e-12)
+    quantized = ((centers - low) * scale).astype(np.int64)
+    codes = np.zeros(len(centers), dtype=np.int64)
+    for bit in range(MORTON_BITS):
+        for axis in range(3):
+            codes |= ((quantized[:, axis] >> bit) & 1) << (3 * bit + axis)
+    return codes
+
+
+def _boxDistanceSq(queries, mins, maxs):
+    """
+    Squared distance of points to boxes, row by row.
+    """
+    gap = np.maximum(np.maximum(mins - queries, queries - maxs), 0.0)
+    return (gap * gap).sum(axis=1)
+
+
+class _BoxTree(object):
+    """
+    Implicit binary tree of bounding boxes over leaves of consecutive items, sorted along a Morton curve.
+    Node i of a level has the children 2i and 2i + 1 on the next level, so building it is a few vectorized
+    reductions and it is stored as plain arrays.
+    """
+
+    def _build(self, itemMins, itemMaxs, leafSize):
+        """
+        Build the levels from the boxes of the sorted items.
+        """
+        self.leafSize = leafSize
+        self.itemCount = len(itemMins)
+        leafStarts = np.arange(0, len(itemMins), leafSize)
+        mins = [np.minimum.reduceat(itemMins, leafStarts)]
+        maxs = [np.maximum.reduceat(itemMaxs, leafStarts)]
+        while len(mins[-1]) > 1:
+            # merge pairs of nodes, an odd last node is carried up alone
+            pairStarts = np.arange(0, len(mins[-1]), 2)
+            mins.append(np.minimum.reduceat(mins[-1], pairStarts))
+            maxs.append(np.maximum.reduceat(maxs[-1], pairStarts))
+        # root level first
+        self.mins = mins[::-1]
+        self.maxs = maxs[::-1]
+
+    def _children(self, queryIds, nodes, level):
+        """
+        Expand (query, node) pairs to the children of the nodes on the given level, still grouped by query.
+        """
+        queryIds = np.repeat(queryIds, 2)
+        nodes = 2 * np.repeat(nodes, 2) + np.tile([0, 1], len(nodes))
+        exists = nodes < len(self.mins[level])
+        return queryIds[exists], nodes[exists]
+
+    def _walk(self, queries, bound):
+        """
+        Walk the tree one level at a time for a chunk of queries, only descending into boxes within the
+        squared distance bound of each query. The bound is tightened in place on the way down: every face of
+        a tight box touches an item, so the closest item is never farther than the farthest point of the
+        nearest face on any axis (MINMAXDIST).
+
+        Returns: (query ids, leaf ids) of the leaves to test, grouped by query.
+        """
+        queryIds = np.arange(len(queries))
+        nodes = np.zeros(len(queries), dtype=np.int64)
+        for level in range(len(self.mins)):
+            if level:
+                queryIds, nodes = self._children(queryIds, nodes, level)
+            qp = queries[queryIds]
+            mins, maxs = self.mins[level][nodes], self.maxs[level][nodes]
+            toMins, toMaxs = np.abs(qp - mins), np.abs(qp - maxs)
+            nearSq, farSq = np.minimum(toMins, toMaxs) ** 2, np.maximum(toMins, toMaxs) ** 2
+            minMax = (farSq.sum(axis=1)[:, None] - farSq + nearSq).min(axis=1)
+            # padded, so rounding never prunes the box that holds the item reaching the bound
+            np.minimum.at(bound, queryIds, minMax * (1.0 + 1e-9) + 1e-18)
+            keep = _boxDistanceSq(qp, mins, maxs) <= bound[queryIds]
+            queryIds, nodes = queryIds[keep], nodes[keep]
+        return queryIds, nodes
+
+    def _leafItems(self, queryIds, leaves):
+        """
+        Expand (query, leaf) pairs to (query, sorted item id) pairs.
+        """
+        starts = leaves * self.leafSize
+        counts = np.minimum(starts + self.leafSize, self.itemCount) - starts
+        ramp = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        return np.repeat(queryIds, counts), np.repeat(starts, counts) + ramp
+
+
+class PointTree(_BoxTree):
+    """
+    Bounding box tree over a point cloud, for exact nearest point queries at any distance.
+
+    Example:
+        tree = spatial.PointTree(sourcePoints)
+        nearest, distancesSq = tree.query(targetPoints)
+    """
+
+    def __init__(self, points, leafSize=LEAF_SIZE):
+        """
+        Args:
+            points: (n, 3) array of points.
+            leafSize: Number of points per leaf.
+        """
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        if not len(self.points):
+            raise ValueError('Unable to build a tree without points.')
+        self.order = np.argsort(_mortonCodes(self.points), kind='mergesort')
+        self.sortedPoints = self.points[self.order]
+        self._build(self.sortedPoints, self.sortedPoints, leafSize)
+
+    def query(self, queries, bound=None, chunkSize=BVH_CHUNK):
+        """
+        Find the nearest point of every query point.
+
+        Args:
+            queries: (q, 3) query points.
+            bound: Optional squared distance per query, known to be reached by some point.
+            chunkSize: Number of queries walked down the tree at once.
+
+        Returns: (indices, squared distances) numpy arrays.
+        """
+        queries = np.asarray(queries, dtype=np.float64).reshape(-1, 3)
+        bound = np.full(len(queries), np.inf) if bound is None else np.array(bound, dtype=np.float64)
+        # a bound reached exactly must survive the rounding of the box tests
+        bound = bound * (1.0 + 1e-9) + 1e-18
+        indices = np.zeros(len(queries), dtype=np.int64)
+        distances = np.zeros(len(queries))
+        for start in range(0, len(queries), chunkSize):
+            chunk = slice(start, min(start + chunkSize, len(queries)))
+            indices[chunk], distances[chunk] = self._queryChunk(queries[chunk], bound[chunk])
+        return self.order[indices], distances
+
+    def _queryChunk(self, queries, bound):
+        queryIds, itemIds = self._leafItems(*self._walk(queries, bound))
+        distSq = ((self.sortedPoints[itemIds] - queries[queryIds]) ** 2).sum(axis=1)
+        best = np.zeros(len(queries), dtype=np.int64)
+        bestDist = np.full(len(queries), np.inf)
+        groups, first = _argminPerRun(distSq, np.bincount(queryIds, minlength=len(queries)))
+        best[groups] = itemIds[first]
+        bestDist[groups] = distSq[first]
+        return best, bestDist
+
+
+class TriangleBVH(_BoxTree):
+    """
+    Bounding volume hierarchy over the triangles of a mesh, for exact closest point queries.
+
+    Triangles are sorted along a Morton curve and grouped in leaves of leafSize triangles, see _BoxTree.
+    Queries are bounded by the closest point on the triangles around their nearest vertex, then walk the tree
+    one level at a time for a whole chunk of points, tightening that bound on every level and only descending
+    into boxes within it.
+
+    Example:
+        bvh = spatial.TriangleBVH(points, triangles)
+        faceIds, barys, distances = bvh.query(targetPoints)
+    """
+
+    def __init__(self, points, triangles, leafSize=LEAF_SIZE, order=None):
+        """
+        Args:
+            points: (n, 3) mesh vertex positions.
+            triangles: (m, 3) vertex ids.
+            leafSize: Number of triangles per leaf.
+            order: Optional triangle order from a previous build (see arrays()), to skip the sort.
+        """
+        self.points = np.asarray(points, dtype=np.float64).reshape(-1, 3)
+        triangles = np.asarray(triangles, dtype=np.int64).reshape(-1, 3)
+        if not len(triangles):
+            raise ValueError('Unable to build a BVH without triangles.')
+        if order is None:
+            order = np.argsort(_mortonCodes(self.points[triangles].mean(axis=1)), kind='mergesort')
+        self.order = np.asarray(order, dtype=np.int64)
+        self.triangles = triangles[self.order]
+        self.grid = None
+
+        corners = self.points[self.triangles]
+        self.triMins = corners.min(axis=1)
+        self.triMaxs = corners.max(axis=1)
+        self._build(self.triMins, self.triMaxs, leafSize)
+
+    def arrays(self):
+        """
+        Arrays needed to rebuild the tree without sorting, e.g. to cache it with topology.MapCache.
+
+        Returns: {'order': triangle order}
+        """
+        return {'order': self.order}
+
+    def _closest(self, queries, queryIds, leaves, bound):
+        """
+        Closest point on the triangles of leaves.
+        Triangles whose bounding box is farther than the distance bound of the query are skipped.
+
+        Returns: (query ids, sorted triangle ids, barycentric coordinates, squared distances) per triangle tested.
+        """
+        queryIds, triIds = self._leafItems(queryIds, leaves)
+        keep = _boxDistanceSq(queries[queryIds], self.triMins[triIds], self.triMaxs[triIds]) <= bound[queryIds]
+        triIds, queryIds = triIds[keep], queryIds[keep]
+        corners = self.points[self.triangles[triIds]]
+        qp = queries[queryIds]
+        closest, bary = closestPointOnTriangles(qp, corners[:, 0], corners[:, 1], corners[:, 2])
+        return queryIds, triIds, bary, ((closest - qp) ** 2).sum(axis=1)
+
+    def _keepBest(self, queryIds, triIds, bary, distSq, best, faceIds, barys):
+        """
+        Update the best hit of every query. queryIds must be grouped.
+        """
+        if not len(queryIds):
+            return
+        counts = np.bincount(queryIds, minlength=len(best))
+        groups, first = _argminPerRun(distSq, counts)
+        better = distSq[first] < best[groups]
+        groups, first = groups[better], first[better]
+        best[groups] = distSq[first]
+        faceIds[groups] = triIds[first]
+        barys[groups] = bary[first]
+
+    def query(self, queries, chunkSize=BVH_CHUNK):
+        """
+        Closest point on the mesh of every query point.
+
+        Args:
+            queries: (q, 3) query points.
+            chunkSize: Number of queries walked down the tree at once.
+
+        Returns: (triangle ids, barycentric coordinates, distances) of the closest point of every query.
+        """
+        queries = np.asarray(queries, dtype=np.float64).reshape(-1, 3)
+        if self.grid is None:
+            self.grid = UniformGrid(self.points)
+        # first bound: the closest point on the triangles around the nearest vertex
+        seedIds, seedBarys = closestPointOnMesh(self.points, queries, self.triangles, grid=self.grid)
+        bound = np.full(len(queries), np.inf)
+        hit = seedIds >= 0
+        seeds = (self.points[self.triangles[seedIds[hit]]] * seedBarys[hit][:, :, None]).sum(axis=1)
+        bound[hit] = ((seeds - queries[hit]) ** 2).sum(axis=1) * (1.0 + 1e-9) + 1e-18
+
+        faceIds = np.zeros(len(queries), dtype=np.int64)
+        barys = np.zeros((len(queries), 3))
+        distances = np.zeros(len(queries))
+        for start in range(0, len(queries), chunkSize):
+            chunk = slice(start, min(start + chunkSize, len(queries)))
+            faceIds[chunk], barys[chunk], distances[chunk] = self._queryChunk(queries[chunk], bound[chunk])
+        return self.order[faceIds], barys, distances
+
+    def _queryChunk(self, queries, bound):
+        count = len(queries)
+        queryIds, nodes = self._walk(queries, bound)
+        best = np.full(count, np.inf)
+        faceIds = np.zeros(count, dtype=np.int64)
+        barys = np.zeros((count, 3))
+        self._keepBest(*self._closest(queries, queryIds, nodes, bound=bound), best=best, faceIds=faceIds, barys=barys)
+        return faceIds, barys, np.sqrt(best)
@@ -0,0 +1,51 @@
+"""
+Name index lookups. Runs without Maya:
+    python -m unittest discover -s utils/tests
+"""
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import naming
+
+SCENE = ['|charA:grp|charA:L_arm', '|charB:grp|charB:L_arm', '|rigA|root|spine', '|rigB|root|spine', '|solo_v2']
+
+
+class TestNameIndex(unittest.TestCase):
+
+    def test_levels(self):
+        index = naming.NameIndex(SCENE, rules=[(r'_v\d+$', '')])
+        self.assertEqual(index.candidates('|solo_v2'), (naming.EXACT, ['|solo_v2']))
+        self.assertEqual(index.candidates('charA:L_arm'), (naming.SHORT, ['|charA:grp|charA:L_arm']))
+        self.assertEqual(index.candidates('solo_v1'), (naming.RULES, ['|solo_v2']))
+        self.assertEqual(index.candidates('missing'), (None, []))
+
+    def test_namespaceRules(self):
+        index = naming.NameIndex(['|g|a:L_arm_v2', 'b:L_arm_v3'], rules=[(r'_v\d+$', '')], namespace=True)
+        self.assertEqual(index.candidates('a:L_arm_v1'), (naming.RULES, ['|g|a:L_arm_v2']))
+        self.assertEqual(index.candidates('L_arm'), (None, []))
+
+    def test_ambiguous(self):
+        index = naming.NameIndex(SCENE)
+        resolved, unresolved, ambiguous = index.resolveAll(['L_arm', 'spine', 'solo_v2', 'missing'],
+                                                           near='|charB:grp|charB:body')
+        self.assertEqual(resolved, {'L_arm': '|charB:grp|charB:L_arm', 'solo_v2': '|solo_v2'})
+        self.assertEqual(unresolved, ['spine', 'missing'])
+        self.assertEqual(sorted(ambiguous), ['spine'])
+
+        resolved, unresolved, _ = index.resolveAll(['spine'], near='|rigA|geo|body')
+        self.assertEqual(resolved, {'spine': '|rigA|root|spine'})
+        resolved, unresolved, _ = index.resolveAll(['L_arm'], table={'L_arm': 'charA:L_arm'})
+        self.assertEqual(resolved, {'L_arm': 'charA:L_arm'})
+        self.assertIsNone(index.resolve('L_arm'))
+
+    def test_sharedShortNames(self):
+        names = ['|grp{0}|joint'.format(i) for i in range(2000)]
+        index = naming.NameIndex(names + names[:10])
+        self.assertEqual(index.candidates('joint')[1], names)
+        self.assertEqual(index.names, names)
+
+
+if __name__ == '__main__':
+    unittest.main()
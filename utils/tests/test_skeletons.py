@@ -0,0 +1,83 @@
+"""
+Skeleton layouts and files. Runs without Maya:
+    python -m unittest discover -s utils/tests
+"""
+import os
+import sys
+import json
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import skeletons
+
+
+def joint(name, parent, value, roo='xyz', custom=None):
+    return {'name': name, 'parent': parent, 'p': [value, 0.0, 1.0], 'o': [0.0, value, 0.0], 'r': [90.0, 0.0, 0.0],
+            's': [1.0, 1.0, 1.0], 'roo': roo, 'custom': custom or {}}
+
+
+JOINTS = [joint('root', -1, 0.0),
+          joint('spine', 0, 1.0, roo='zxy'),
+          joint('L_arm', 1, 2.0, custom={'twist': {'type': 'double', 'value': 0.5}}),
+          joint('R_arm', 1, 3.0),
+          joint('extra', -1, 4.0)]
+
+
+class TestSkeletons(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_nested(self):
+        nested = skeletons.nestSkeleton(JOINTS, parent='rig')
+        self.assertEqual(sorted(nested['root']['child']['spine']['child']), ['L_arm', 'R_arm'])
+        joints, parent = skeletons.flattenSkeleton(nested)
+        self.assertEqual(parent, 'rig')
+        self.assertEqual(sorted(j['name'] for j in joints), sorted(j['name'] for j in JOINTS))
+        byName = dict((j['name'], j) for j in joints)
+        for j in joints:
+            if j['parent'] >= 0:
+                self.assertLess(j['parent'], joints.index(j))
+        self.assertEqual(joints[byName['L_arm']['parent']]['name'], 'spine')
+
+    def test_pack(self):
+        flat = skeletons.packSkeleton(JOINTS, parent='rig')
+        self.assertEqual(flat['parents'].tolist(), [-1, 0, 1, 1, -1])
+        self.assertEqual(flat['p'].shape, (5, 3))
+        joints, parent = skeletons.unpackSkeleton(flat)
+        self.assertEqual((joints, parent), (JOINTS, 'rig'))
+
+    def test_unpackOrder(self):
+        flat = skeletons.packSkeleton(JOINTS)
+        flat['parents'][1] = 3
+        self.assertRaises(ValueError, skeletons.unpackSkeleton, flat)
+
+    def test_files(self):
+        for flat in (True, False):
+            path = os.path.join(self.directory, 'skeleton.json')
+            skeletons.writeSkeleton(path, JOINTS, parent='rig', flat=flat)
+            with open(path) as infile:
+                self.assertEqual(skeletons.isFlat(json.load(infile)), flat)
+            loaded = skeletons.readSkeleton(path)
+            expected = skeletons.packSkeleton(*skeletons.flattenSkeleton(skeletons.nestSkeleton(JOINTS, 'rig')))
+            if flat:
+                expected = skeletons.packSkeleton(JOINTS, parent='rig')
+            self.assertEqual(loaded['names'], expected['names'])
+            for key in ('parents', 'roo') + skeletons.VECTOR_KEYS:
+                np.testing.assert_array_equal(loaded[key], expected[key])
+
+            converted = os.path.join(self.directory, 'converted.json')
+            skeletons.convertSkeleton(path, converted, flat=not flat)
+            joints, parent = skeletons.unpackSkeleton(skeletons.readSkeleton(converted))
+            self.assertEqual(parent, 'rig')
+            self.assertEqual(sorted(j['name'] for j in joints), sorted(j['name'] for j in JOINTS))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,262 @@
+"""
+Skin weight records, files and CSR operations. Runs without Maya:
+    python -m unittest discover -s utils/tests
+"""
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import spatial
+import skinweights
+
+INFS = ['root', 'L_arm', 'R_arm', 'spine', 'head']
+
+
+def randomRecord(rng, vertexCount=50, infs=INFS, maxInfluences=3):
+    """
+    Normalized random weights with up to maxInfluences influences per vertex, and every record key.
+    """
+    dense = np.zeros((vertexCount, len(infs)))
+    for row in dense:
+        count = rng.randint(1, maxInfluences + 1)
+        row[rng.choice(len(infs), count, replace=False)] = rng.rand(count) + 0.1
+    dense /= dense.sum(axis=1)[:, None]
+    record = skinweights.SkinWeights.fromDense(dense.astype(np.float32), list(infs)).toRecord()
+    record.update({'skinCluster': 'skinCluster1', 'nw': 1, 'sm': 2, 'mi': maxInfluences,
+                   'blendWeights': rng.rand(vertexCount).astype(np.float32)})
+    return record
+
+
+def dense(record, infs=None):
+    return skinweights.SkinWeights.fromRecord(record).toDense(infs=infs)
+
+
+class TempDirTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def path(self, name):
+        return os.path.join(self.directory, name)
+
+    def assertRecordEqual(self, record, expected):
+        self.assertEqual(list(record['infs']), list(expected['infs']))
+        for key in skinweights.CSR_KEYS + ('blendWeights',):
+            np.testing.assert_array_equal(np.asarray(record[key]), np.asarray(expected[key]))
+        for key in ('skinCluster', 'nw', 'sm', 'mi'):
+            self.assertEqual(record[key], expected[key])
+
+
+class TestFiles(TempDirTestCase):
+
+    def test_roundTrip(self):
+        rng = np.random.RandomState(0)
+        data = {'body': randomRecord(rng), 'ns:head': randomRecord(rng, vertexCount=7)}
+        for fileFormat, name in ((skinweights.FORMAT_JSON, 'weights.json'),
+                                 (skinweights.FORMAT_BINARY, 'weights' + skinweights.BINARY_EXT)):
+            path = self.path(name)
+            self.assertEqual(skinweights.writeSkinWeights(path, data), fileFormat)
+            self.assertEqual(skinweights.detectFormat(path), fileFormat)
+            loaded = skinweights.readSkinWeights(path)
+            self.assertEqual(sorted(loaded), sorted(data))
+            for mesh in data:
+                self.assertRecordEqual(loaded[mesh], data[mesh])
+
+    def test_readerInfo(self):
+        rng = np.random.RandomState(1)
+        path = self.path('weights.skw')
+        skinweights.writeSkinWeights(path, {'a': randomRecord(rng, vertexCount=12), 'b': randomRecord(rng)})
+        info = skinweights.readSkinWeightInfo(path)
+        self.assertEqual(info['a']['vertexCount'], 12)
+        self.assertEqual(info['b']['infs'], INFS)
+        with skinweights.SkinWeightReader(path) as reader:
+            self.assertRaises(KeyError, reader.read, 'missing')
+
+    def test_readerClose(self):
+        rng = np.random.RandomState(11)
+        record = randomRecord(rng)
+        for name in ('weights.json', 'weights.skw'):
+            path = self.path(name)
+            skinweights.writeSkinWeights(path, {'body': record})
+            with skinweights.SkinWeightReader(path) as reader:
+                loaded = reader.read('body')
+            self.assertTrue(reader.closed)
+            self.assertRaises(ValueError, reader.read, 'body')
+            # records read before closing stay valid
+            self.assertRecordEqual(loaded, record)
+            del loaded
+            os.remove(path)
+
+    def test_legacy(self):
+        rng = np.random.RandomState(2)
+        record = randomRecord(rng)
+        legacy = skinweights.recordToLegacy(record)
+        self.assertEqual(sorted(legacy['weights']), list(range(50)))
+        self.assertRecordEqual(skinweights.recordFromLegacy(legacy), record)
+
+
+class TestDelta(TempDirTestCase):
+
+    def changed(self, rng, base, rows):
+        current = dict(base)
+        weights = dense(base)
+        weights[rows] = np.roll(weights[rows], 1, axis=1)
+        current.update(skinweights.SkinWeights.fromDense(weights.astype(np.float32), list(base['infs'])).toRecord())
+        current['blendWeights'] = np.array(base['blendWeights'])
+        current['blendWeights'][rows[:1]] += 0.5
+        return current
+
+    def test_applyDelta(self):
+        rng = np.random.RandomState(3)
+        base = randomRecord(rng)
+        current = self.changed(rng, base, np.array([3, 17, 40]))
+        delta = skinweights.deltaRecord(base, current)
+        self.assertEqual(delta['rows'].tolist(), [3, 17, 40])
+        self.assertRecordEqual(skinweights.applyDelta(base, delta), current)
+        self.assertRaises(ValueError, skinweights.applyDelta, current, delta)
+
+    def test_newInfluence(self):
+        rng = np.random.RandomState(4)
+        base = randomRecord(rng)
+        current = randomRecord(rng, infs=INFS + ['tail'])
+        delta = skinweights.deltaRecord(base, current)
+        np.testing.assert_allclose(dense(skinweights.applyDelta(base, delta)), dense(current))
+
+    def test_chain(self):
+        rng = np.random.RandomState(5)
+        base = {'body': randomRecord(rng), 'head': randomRecord(rng, vertexCount=9)}
+        first = {'body': self.changed(rng, base['body'], np.array([1, 2]))}
+        second = {'body': self.changed(rng, first['body'], np.array([30])), 'tail': randomRecord(rng)}
+        for ext in ('.json', '.skw'):
+            chain = [self.path('base' + ext), self.path('delta1' + ext), self.path('delta2' + ext)]
+            skinweights.writeSkinWeights(chain[0], base)
+            skinweights.writeSkinWeights(chain[1], {'body': skinweights.deltaRecord(base['body'], first['body'])})
+            skinweights.writeSkinWeights(chain[2], {
+                'body': skinweights.deltaRecord(first['body'], second['body']), 'tail': second['tail']})
+
+            self.assertRecordEqual(skinweights.resolveRecord(chain, 'body'), second['body'])
+            self.assertIsNone(skinweights.resolveRecord(chain[:2], 'tail'))
+
+            collapsed = self.path('collapsed' + ext)
+            self.assertEqual(sorted(skinweights.collapseSkinWeights(chain, collapsed)), ['body', 'head', 'tail'])
+            loaded = skinweights.readSkinWeights(collapsed)
+            self.assertRecordEqual(loaded['body'], second['body'])
+            self.assertRecordEqual(loaded['head'], base['head'])
+            self.assertRecordEqual(loaded['tail'], second['tail'])
+
+
+class TestCsr(unittest.TestCase):
+
+    def test_cleanWeights(self):
+        rng = np.random.RandomState(6)
+        record = randomRecord(rng, maxInfluences=5)
+        (offsets, indices, values), stats = skinweights.cleanWeights(
+            record['offsets'], record['indices'], record['values'], len(INFS), threshold=0.1, maxInfluences=2)
+
+        expected = dense(record)
+        expected[expected < 0.1] = 0.0
+        for row in expected:
+            row[np.argsort(-row, kind='mergesort')[2:]] = 0.0
+        sums = expected.sum(axis=1)[:, None]
+        expected = np.where(sums > 0, expected / np.where(sums > 0, sums, 1.0), 0.0)
+        result = skinweights.csrToDense(offsets, indices, values, len(INFS))
+        np.testing.assert_allclose(result, expected, atol=1e-6)
+        self.assertTrue(np.all(np.diff(offsets) <= 2))
+        self.assertEqual(stats['vertices'], 50)
+
+    def test_validateWeights(self):
+        offsets = np.array([0, 2, 4, 5, 5])
+        indices = np.array([0, 1, 0, 9, 1])
+        values = np.array([np.nan, 0.5, 0.25, 0.5, -1.0])
+        (offsets, indices, values), report = skinweights.validateWeights(offsets, indices, values, infCount=2)
+        self.assertEqual((report['nonFinite'], report['negative'], report['badIndices']), (1, 1, 1))
+        self.assertEqual(report['emptyVertices'].tolist(), [2, 3])
+        self.assertEqual(report['unnormalizedVertices'].tolist(), [0, 1])
+        np.testing.assert_allclose(skinweights.csrToDense(offsets, indices, values, 2),
+                                   [[0, 1], [1, 0], [0, 0], [0, 0]])
+
+    def test_mergeDuplicates(self):
+        rng = np.random.RandomState(12)
+        record = randomRecord(rng, maxInfluences=5)
+        weights = skinweights.SkinWeights.fromRecord(record).rename({'R_arm': 'L_arm'})
+        merged = weights.mergeDuplicates()
+        self.assertEqual(merged.infs, ['root', 'L_arm', 'spine', 'head'])
+        expected = dense(record)
+        expected[:, 1] += expected[:, 2]
+        np.testing.assert_allclose(merged.toDense(), np.delete(expected, 2, axis=1), atol=1e-6)
+        self.assertTrue(np.all(np.diff(merged.offsets) <= np.diff(record['offsets'])))
+        self.assertIs(merged.mergeDuplicates(), merged)
+
+    def test_mirrorWeights(self):
+        points = np.array([[1.0, 0, 0], [-1.0, 0, 0], [0.0, 1, 0]])
+        mirror, distances = skinweights.symmetryMap(points)
+        self.assertEqual(mirror.tolist(), [1, 0, 2])
+        np.testing.assert_allclose(distances, 0.0)
+
+        infs = ['L_arm', 'R_arm', 'spine']
+        table = skinweights.mirrorInfluenceTable(infs)
+        self.assertEqual(table.tolist(), [1, 0, 2])
+        weights = np.array([[0.75, 0, 0.25], [0, 0, 1], [0, 0, 1]])
+        offsets, indices, values = skinweights.denseToCsr(weights)
+        result = skinweights.mirrorWeights(offsets, indices, values, mirror, table, targets=[1])
+        np.testing.assert_allclose(skinweights.csrToDense(*result, infCount=3),
+                                   [[0.75, 0, 0.25], [0, 0.75, 0.25], [0, 0, 1]])
+
+    def test_bindClosest(self):
+        rng = np.random.RandomState(7)
+        points = rng.rand(200, 3)
+        starts, ends = rng.rand(6, 3), rng.rand(6, 3)
+        owners = np.array([0, 0, 1, 2, 3, 3])
+        offsets, indices, values = skinweights.bindWeights(points, starts, ends, owners, 4, chunkSize=64)
+        distances = spatial.segmentDistances(points, starts, ends)
+        np.testing.assert_array_equal(indices, owners[distances.argmin(axis=1)])
+        np.testing.assert_array_equal(values, 1.0)
+
+    def test_bindInverseDistance(self):
+        rng = np.random.RandomState(8)
+        points = rng.rand(100, 3)
+        offsets, indices, values = skinweights.bindWeights(
+            points, rng.rand(5, 3), rng.rand(5, 3), np.arange(5), 5, mode=skinweights.BIND_INVERSE_DISTANCE,
+            maxInfluences=3)
+        self.assertTrue(np.all(np.diff(offsets) == 3))
+        sums = np.add.reduceat(values.astype(np.float64), offsets[:-1])
+        np.testing.assert_allclose(sums, 1.0, atol=1e-6)
+
+    def test_remapSamePoints(self):
+        rng = np.random.RandomState(9)
+        record = randomRecord(rng)
+        record['points'] = rng.rand(50, 3)
+        remapped = skinweights.remapRecord(record, record['points'][::-1])
+        np.testing.assert_allclose(dense(remapped), dense(record)[::-1], atol=1e-6)
+
+    def test_correspondenceStrayVertex(self):
+        points = np.array([[0.0, 0, 0], [1, 0, 0], [0, 1, 0], [5, 5, 5]])
+        correspondence = skinweights.findCorrespondence(points, np.array([[5.0, 5, 5.1]]),
+                                                        mode=skinweights.REMAP_BARYCENTRIC,
+                                                        triangles=np.array([[0, 1, 2]]))
+        self.assertEqual(correspondence['sources'].tolist(), [[0, 1, 2]])
+        np.testing.assert_allclose(correspondence['factors'].sum(axis=1), 1.0)
+
+
+class TestSnapshots(unittest.TestCase):
+
+    def test_roundTrip(self):
+        rng = np.random.RandomState(10)
+        record = randomRecord(rng)
+        store = skinweights.SnapshotStore(maxCount=2)
+        store.add('body', record, label='first')
+        np.testing.assert_array_equal(dense(store.get('body', 'first')), dense(record))
+        store.add('body', record)
+        store.add('body', record)
+        self.assertEqual(len(store.snapshots('body')), 2)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,135 @@
+"""
+Spatial queries checked against brute force. Runs without Maya:
+    python -m unittest discover -s utils/tests
+"""
+import os
+import sys
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import spatial
+
+
+def bruteClosestOnTriangles(points, triangles, queries):
+    """
+    Squared distance of every query to its closest point on any triangle.
+    """
+    count = len(triangles)
+    corners = points[triangles]
+    repeated = np.repeat(queries, count, axis=0)
+    closest, _ = spatial.closestPointOnTriangles(repeated, *[np.tile(corners[:, i], (len(queries), 1))
+                                                            for i in range(3)])
+    return ((closest - repeated) ** 2).sum(axis=1).reshape(len(queries), count).min(axis=1)
+
+
+def randomMesh(rng, vertexCount=60, triangleCount=80):
+    points = rng.rand(vertexCount, 3)
+    triangles = np.array([rng.choice(vertexCount, 3, replace=False) for _ in range(triangleCount)])
+    return points, triangles
+
+
+def bruteNearest(points, queries):
+    """
+    Squared distance of every query to its nearest point.
+    """
+    return ((queries[:, None] - points[None]) ** 2).sum(axis=2).min(axis=1)
+
+
+def cloud(rng, seed):
+    """
+    Random points, snapped to a coarse lattice every other seed for duplicates and axis aligned runs.
+    """
+    points = rng.rand(rng.randint(1, 300), 3)
+    if seed % 2:
+        points = np.round(points * 4) / 4
+    return points
+
+
+class TestNearestPoint(unittest.TestCase):
+
+    def test_pointTree(self):
+        for seed in range(100):
+            rng = np.random.RandomState(seed)
+            points = cloud(rng, seed)
+            queries = rng.rand(40, 3) * 6 - 3
+            indices, distances = spatial.PointTree(points).query(queries)
+            expected = bruteNearest(points, queries)
+            np.testing.assert_allclose(distances, expected, rtol=1e-12, atol=1e-15)
+            np.testing.assert_allclose(((points[indices] - queries) ** 2).sum(axis=1), expected, rtol=1e-12,
+                                       atol=1e-15)
+
+    def test_uniformGrid(self):
+        for seed in range(100):
+            rng = np.random.RandomState(seed)
+            points = cloud(rng, seed)
+            # near queries are found in the rings, far ones by the tree fallback
+            queries = np.concatenate([rng.rand(40, 3), rng.rand(40, 3) * 20 - 10])
+            indices, distances = spatial.UniformGrid(points).query(queries)
+            expected = bruteNearest(points, queries)
+            np.testing.assert_allclose(distances ** 2, expected, rtol=1e-9, atol=1e-15)
+            np.testing.assert_allclose(((points[indices] - queries) ** 2).sum(axis=1), expected, rtol=1e-9,
+                                       atol=1e-15)
+
+
+class TestClosestPointOnMesh(unittest.TestCase):
+
+    def test_triangleBVH(self):
+        for seed in range(30):
+            rng = np.random.RandomState(seed)
+            points, triangles = randomMesh(rng)
+            queries = rng.rand(50, 3) * 3 - 1
+            faceIds, barys, distances = spatial.TriangleBVH(points, triangles).query(queries)
+            expected = bruteClosestOnTriangles(points, triangles, queries)
+            np.testing.assert_allclose(distances ** 2, expected, rtol=1e-9, atol=1e-15)
+            closest = (points[triangles[faceIds]] * barys[:, :, None]).sum(axis=1)
+            np.testing.assert_allclose(((closest - queries) ** 2).sum(axis=1), expected, rtol=1e-9, atol=1e-12)
+
+    def test_strayVertex(self):
+        points = np.array([[0.0, 0, 0], [1, 0, 0], [0, 1, 0], [5, 5, 5]])
+        triangles = np.array([[0, 1, 2]])
+        queries = np.array([[5.0, 5, 5.1], [0.2, 0.2, 1.0]])
+        faceIds, barys = spatial.closestPointOnMesh(points, queries, triangles)
+        self.assertEqual(faceIds.tolist(), [0, 0])
+        np.testing.assert_allclose(barys, [[0.0, 0.5, 0.5], [0.6, 0.2, 0.2]])
+
+
+class TestDegenerateTriangles(unittest.TestCase):
+
+    def test_collapsedEdge(self):
+        a = np.array([[0.0, 0.0, 0.0]])
+        c = np.array([[1.0, 0.0, 0.0]])
+        closest, bary = spatial.closestPointOnTriangles(np.array([[0.5, 1.0, 0.0]]), a, a.copy(), c)
+        self.assertTrue(np.isfinite(bary).all())
+        np.testing.assert_allclose(closest, [[0.5, 0.0, 0.0]])
+        np.testing.assert_allclose(bary.sum(axis=1), 1.0)
+
+    def test_collinearCorners(self):
+        a, b, c = np.array([[0.0, 0, 0]]), np.array([[2.0, 0, 0]]), np.array([[1.0, 0, 0]])
+        closest, bary = spatial.closestPointOnTriangles(np.array([[3.0, 1.0, 0.0]]), a, b, c)
+        np.testing.assert_allclose(closest, [[2.0, 0.0, 0.0]])
+        np.testing.assert_allclose(a * bary[:, 0:1] + b * bary[:, 1:2] + c * bary[:, 2:3], closest)
+
+    def test_meshWithCollapsedEdge(self):
+        for seed in range(20):
+            rng = np.random.RandomState(seed)
+            points, triangles = randomMesh(rng)
+            triangles[0, 1] = triangles[0, 0]
+            points[triangles[1, 2]] = (points[triangles[1, 0]] + points[triangles[1, 1]]) * 0.5
+            queries = rng.rand(50, 3) * 1.4 - 0.2
+
+            faceIds, barys = spatial.closestPointOnMesh(points, queries, triangles)
+            self.assertTrue(np.isfinite(barys).all())
+            _, _, distances = spatial.TriangleBVH(points, triangles).query(queries)
+            np.testing.assert_allclose(distances ** 2, bruteClosestOnTriangles(points, triangles, queries),
+                                       atol=1e-12)
+
+    def test_argminPerRunNaN(self):
+        values = np.array([np.nan, 2.0, 1.0, np.nan, 3.0])
+        runs, first = spatial._argminPerRun(values, np.array([3, 0, 2]))
+        self.assertEqual(runs.tolist(), [0, 2])
+        self.assertEqual(first.tolist(), [2, 4])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,68 @@
+"""
+Topology fingerprints and the map cache. Runs without Maya:
+    python -m unittest discover -s utils/tests
+"""
+import os
+import sys
+import shutil
+import tempfile
+import unittest
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import topology
+
+
+class TestHashes(unittest.TestCase):
+
+    def test_fingerprint(self):
+        triangles = np.array([[0, 1, 2], [2, 1, 3]])
+        key = topology.fingerprint(4, triangles)
+        self.assertEqual(key, topology.fingerprint(4, triangles.astype(np.int64)))
+        self.assertNotEqual(key, topology.fingerprint(5, triangles))
+        self.assertNotEqual(key, topology.fingerprint(4, triangles[:, ::-1]))
+
+    def test_pointsHash(self):
+        points = np.random.RandomState(0).rand(20, 3)
+        key = topology.pointsHash(points)
+        self.assertEqual(key, topology.pointsHash(points.astype(np.float32)))
+        self.assertNotEqual(key, topology.pointsHash(points + 0.01))
+
+
+class TestMapCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.cache = topology.MapCache(os.path.join(self.directory, 'cache'), maxEntries=2)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+    def test_putGet(self):
+        key = self.cache.key('remap', 'closest', 'abc')
+        self.assertIsNone(self.cache.get(key))
+        self.cache.put(key, {'sources': np.arange(5)})
+        np.testing.assert_array_equal(self.cache.get(key)['sources'], np.arange(5))
+
+    def test_evict(self):
+        for i in range(3):
+            self.cache.put(self.cache.key(i), {'map': np.arange(i + 1)})
+            # distinct modification times, oldest first
+            os.utime(self.cache._path(self.cache.key(i)), (i, i))
+        self.assertEqual(len(self.cache.entries()), 2)
+        self.cache.put(self.cache.key(3), {'map': np.arange(2)})
+        self.assertIsNone(self.cache.get(self.cache.key(0)))
+        self.cache.clear()
+        self.assertEqual(self.cache.entries(), [])
+
+    def test_corruptEntry(self):
+        key = self.cache.key('bad')
+        self.cache.put(key, {'map': np.arange(3)})
+        with open(self.cache._path(key), 'wb') as outfile:
+            outfile.write(b'not a npz file')
+        self.assertIsNone(self.cache.get(key))
+        self.assertFalse(os.path.exists(self.cache._path(key)))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,211 @@
+"""
+Topology fingerprints and an on-disk cache of vertex correspondence maps.
+
+Correspondence (remap, symmetry, LOD transfer) maps are expensive to search for, but only depend on the
+topologies and vertex positions involved. They are cached on disk keyed by topology fingerprints and point
+hashes so repeat operations on the same assets skip the spatial search.
+"""
+import os
+import io
+import hashlib
+import tempfile
+import numpy as np
+import log
+
+LOG = log.get_logger(__name__)
+# CONSTANTS
+CACHE_ENV = 'MAYA_TOOLS_TOPOLOGY_CACHE'
+CACHE_DIR = os.path.join(tempfile.gettempdir(), 'maya_tools_topology_cache')
+CACHE_EXT = '.npz'
+MAX_ENTRIES = 256
+MAX_BYTES = 512 * 1024 * 1024
+POINT_PRECISION = 1e-4
+
+
+def fingerprint(vertexCount, *arrays):
+    """
+    Hash a topology.
+
+    Example:
+        # polygon mesh: face vertex counts and face vertex connectivity
+        key = topology.fingerprint(vertexCount, faceCounts, faceConnects)
+        # triangle mesh
+        key = topology.fingerprint(vertexCount, triangles)
+
+    Args:
+        vertexCount: Number of vertices.
+        *arrays: Int arrays describing the connectivity.
+
+    Returns: Hex digest string.
+    """
+    digest = hashlib.sha1()
+    digest.update(str(int(vertexCount)).encode('utf-8'))
+    for array in arrays:
+        array = np.ascontiguousarray(array, dtype='<i4')
+        digest.update(str(array.shape).encode('utf-8'))
+        digest.update(array.tobytes())
+    return digest.hexdigest()
+
+
+def pointsHash(points, precision=POINT_PRECISION):
+    """
+    Hash vertex positions, quantized so float noise below the precision gives the same hash.
+    Moved or sculpted meshes with the same topology hash differently.
+
+    Args:
+        points: (n, 3) vertex positions.
+        precision: Quantization step, in scene units.
+
+    Returns: Hex digest string.
+    """
+    quantized = np.ascontiguousarray(np.round(np.asarray(points, dtype=np.float64) / precision), dtype='<i8')
+    digest = hashlib.sha1()
+    digest.update(str(quantized.shape).encode('utf-8'))
+    digest.update(quantized.tobytes())
+    return digest.hexdigest()
+
+
+class MapCache(object):
+    """
+    Least recently used cache of numpy array maps, stored as one .npz file per entry.
+    Entries are evicted oldest first when the cache grows over maxEntries or maxBytes.
+
+    Example:
+        cache = topology.MapCache()
+        key = cache.key('symmetry', 'x', topology.fingerprint(vertexCount, faceCounts, faceConnects),
+                        topology.pointsHash(points))
+        maps = cache.get(key)
+        if maps is None:
+            maps = {'mirror': computeSymmetry()}
+            cache.put(key, maps)
+    """
+
+    def __init__(self, directory=None, maxEntries=MAX_ENTRIES, maxBytes=MAX_BYTES):
+        """
+        Args:
+            directory: Cache directory. Defaults to $MAYA_TOOLS_TOPOLOGY_CACHE, or a folder in the temp dir.
+            maxEntries: Maximum number of cached maps.
+            maxBytes: Maximum total size of the cache on disk.
+        """
+        if not directory:
+            directory = os.environ.get(CACHE_ENV, CACHE_DIR)
+        self.directory = directory
+        self.maxEntries = maxEntries
+        self.maxBytes = maxBytes
+
+    @staticmethod
+    def key(*parts):
+        """
+        Build a cache key from any number of strings (kind of map, options, fingerprints).
+
+        Returns: Hex digest string.
+        """
+        return hashlib.sha1('|'.join(str(p) for p in parts).encode('utf-8')).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + CACHE_EXT)
+
+    def get(self, key):
+        """
+        Load a cached map and mark it as recently used.
+
+        Args:
+            key: Cache key.
+
+        Returns: Dict of numpy arrays. None if the key is not cached.
+        """
+        path = self._path(key)
+        if not os.path.isfile(path):
+            return None
+        try:
+            with np.load(path) as npz:
+                arrays = dict((name, npz[name]) for name in npz.files)
+        except Exception:
+            LOG.warning('Unable to read cached map {}, discarding it.'.format(path))
+            self.discard(key)
+            return None
+        os.utime(path, None)
+        return arrays
+
+    def put(self, key, arrays):
+        """
+        Store a map and evict old entries if the cache is over its limits.
+
+        Args:
+            key: Cache key.
+            arrays: Dict of numpy arrays.
+        """
+        if not os.path.isdir(self.directory):
+            try:
+                os.makedirs(self.directory)
+            except OSError:
+                if not os.path.isdir(self.directory):
+                    raise
+        # write to a temp file first so a concurrent reader never sees a partial file
+        buf = io.BytesIO()
+        np.savez(buf, **arrays)
+        path = self._path(key)
+        tmpPath = '{}.{}.tmp'.format(path, os.getpid())
+        with open(tmpPath, 'wb') as outfile:
+            outfile.write(buf.getvalue())
+        if os.path.exists(path):
+            os.remove(path)
+        os.rename(tmpPath, path)
+        self.evict()
+
+    def discard(self, key):
+        """
+        Remove one entry.
+
+        Args:
+            key: Cache key.
+        """
+        path = self._path(key)
+        if os.path.isfile(path):
+            os.remove(path)
+
+    def entries(self):
+        """
+        List the cached entries.
+
+        Returns: List of (last used time, size in bytes, path), least recently used first.
+        """
+        if not os.path.isdir(self.directory):
+            return []
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(CACHE_EXT):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                stat = os.stat(path)
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        return sorted(entries)
+
+    def evict(self):
+        """
+        Remove least recently used entries until the cache is within maxEntries and maxBytes.
+
+        Returns: Number of removed entries.
+        """
+        entries = self.entries()
+        total = sum(size for _, size, _ in entries)
+        removed = 0
+        while entries and (len(entries) > self.maxEntries or total > self.maxBytes):
+            _, size, path = entries.pop(0)
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+    def clear(self):
+        """
+        Remove every entry.
+        """
+        for _, _, path in self.entries():
+            os.remove(path)